@@ -0,0 +1,30 @@
+"""Add path templates
+
+Revision ID: a1d4f7b9c3e8
+Revises: f8c3e6a9b2d4
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1d4f7b9c3e8'
+down_revision: Union[str, None] = 'f8c3e6a9b2d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Nullable without a default, so no rewrite of apilog or its partitions;
+    # existing logs keep a NULL template and are grouped by their raw path
+    op.add_column('apilog', sa.Column('path_template', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.add_column('userproject', sa.Column('path_template_rules', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('userproject', 'path_template_rules')
+    op.drop_column('apilog', 'path_template')
@@ -0,0 +1,191 @@
+"""Partition apilog by created_at
+
+Replaces apilog with a table range partitioned by created_at (partitions per
+APILOG_PARTITION_INTERVAL, from the oldest row to APILOG_PARTITIONS_AHEAD
+intervals ahead, plus apilog_default). The primary key becomes
+(id, created_at), and event id uniqueness moves to the new apilogevent table.
+
+The old table keeps taking writes while its rows are copied in id-ordered
+chunks, each committed on its own. The final step locks it against writes,
+copies the rows ingested since the copy started and swaps the tables. Rows
+updated in the old table after they were copied keep their old values, so
+do not run bot backfills during the upgrade.
+
+Revision ID: a9d2e5f7c3b8
+Revises: f4c1d8e7b2a6
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d2e5f7c3b8'
+down_revision: Union[str, None] = 'f4c1d8e7b2a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHUNK_SIZE = 10000
+# Rows committed late (long bulk transactions, clock skew between workers) may
+# carry a `created` slightly before the copy started; the final step re-copies
+# this much and skips what is already there
+DELTA_MARGIN = timedelta(minutes=10)
+
+INDEXES = {
+    'ix_apilog_user_agent_id': '(user_agent_id)',
+    'ix_apilog_query_params': 'USING gin (query_params jsonb_path_ops)',
+    'ix_apilog_project_created_at': '(user_project_id, created_at)',
+}
+FOREIGN_KEYS = {
+    'apilog_user_project_id_fkey': 'FOREIGN KEY (user_project_id) REFERENCES userproject (id)',
+    'apilog_bot_id_fkey': 'FOREIGN KEY (bot_id) REFERENCES botinfo (id)',
+    'apilog_user_agent_id_fkey': 'FOREIGN KEY (user_agent_id) REFERENCES useragent (id)',
+}
+# Read like app.config does, but the partition layout of this revision is fixed here
+# rather than imported, so later changes to the app cannot change what it creates
+APILOG_PARTITION_INTERVAL = os.getenv("APILOG_PARTITION_INTERVAL", "month")
+APILOG_PARTITIONS_AHEAD = int(os.getenv("APILOG_PARTITIONS_AHEAD", 3))
+COPY_EVENTS = (
+    "INSERT INTO apilogevent (user_project_id, event_id, created) "
+    "SELECT user_project_id, event_id, created FROM apilog WHERE {condition} AND event_id IS NOT NULL "
+    "ON CONFLICT DO NOTHING"
+)
+
+
+def partition_start(moment, interval):
+    if interval == "day":
+        return datetime(moment.year, moment.month, moment.day)
+    if interval == "month":
+        return datetime(moment.year, moment.month, 1)
+    raise ValueError(f"Unknown partition interval {interval!r}, expected 'day' or 'month'")
+
+
+def next_start(start, interval):
+    if interval == "day":
+        return start + timedelta(days=1)
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def partition_name(start, interval):
+    return start.strftime("apilog_p%Y_%m_%d" if interval == "day" else "apilog_p%Y_%m")
+
+
+def ahead_end(now, interval, ahead):
+    end = partition_start(now, interval)
+    for _ in range(ahead):
+        end = next_start(end, interval)
+    return end
+
+
+def id_chunks(connection, cutoff):
+    """Yield (lower, upper] apilog id bounds covering the rows created up to `cutoff`."""
+    last_id = None
+    while True:
+        query = "SELECT id FROM apilog WHERE created <= :cutoff"
+        if last_id is not None:
+            query += " AND id > :last_id"
+        query += " ORDER BY id LIMIT :limit"
+        ids = connection.execute(
+            sa.text(query), {"cutoff": cutoff, "last_id": last_id, "limit": CHUNK_SIZE}
+        ).scalars().all()
+        if not ids:
+            return
+        yield last_id, ids[-1]
+        last_id = ids[-1]
+
+
+def chunk_condition(lower):
+    condition = "created <= :cutoff AND id <= :upper"
+    return condition if lower is None else f"{condition} AND id > :lower"
+
+
+def create_partitions(connection, interval):
+    oldest = connection.execute(sa.text("SELECT min(created_at) FROM apilog")).scalar()
+    now = datetime.now()
+    partition = partition_start(min(oldest or now, now), interval)
+    end = ahead_end(now, interval, APILOG_PARTITIONS_AHEAD)
+    while partition <= end:
+        following = next_start(partition, interval)
+        op.execute(
+            f"CREATE TABLE {partition_name(partition, interval)} PARTITION OF apilog_partitioned "
+            f"FOR VALUES FROM ('{partition.isoformat(sep=' ')}') TO ('{following.isoformat(sep=' ')}')"
+        )
+        partition = following
+    op.execute("CREATE TABLE apilog_partitioned_default PARTITION OF apilog_partitioned DEFAULT")
+
+
+def upgrade() -> None:
+    op.create_table(
+        'apilogevent',
+        sa.Column('user_project_id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column('event_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_project_id'], ['userproject.id']),
+        sa.PrimaryKeyConstraint('user_project_id', 'event_id'),
+    )
+    op.create_index(op.f('ix_apilogevent_created'), 'apilogevent', ['created'], unique=False)
+
+    # created_at becomes part of the primary key
+    op.execute("UPDATE apilog SET created_at = created WHERE created_at IS NULL")
+
+    op.execute(
+        "CREATE TABLE apilog_partitioned (LIKE apilog INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    op.execute("ALTER TABLE apilog_partitioned ADD CONSTRAINT apilog_partitioned_pkey PRIMARY KEY (id, created_at)")
+    for name, definition in FOREIGN_KEYS.items():
+        op.execute(f"ALTER TABLE apilog_partitioned ADD CONSTRAINT {name} {definition}")
+    for name, definition in INDEXES.items():
+        op.execute(f"CREATE INDEX {name.replace('ix_apilog_', 'ix_apilog_partitioned_')} ON apilog_partitioned {definition}")
+    connection = op.get_bind()
+    create_partitions(connection, APILOG_PARTITION_INTERVAL)
+
+    with op.get_context().autocommit_block():
+        # Finds the rows ingested while the copy runs; dropped with the old table
+        op.execute("CREATE INDEX CONCURRENTLY ix_apilog_created_tmp ON apilog (created)")
+        cutoff = connection.execute(sa.text("SELECT max(created) FROM apilog")).scalar() or datetime.now()
+        for lower, upper in id_chunks(connection, cutoff):
+            bounds = {"cutoff": cutoff, "lower": lower, "upper": upper}
+            connection.execute(sa.text(
+                f"INSERT INTO apilog_partitioned SELECT * FROM apilog WHERE {chunk_condition(lower)} "
+                "ON CONFLICT DO NOTHING"
+            ), bounds)
+            connection.execute(sa.text(COPY_EVENTS.format(condition=chunk_condition(lower))), bounds)
+
+    # Short final transaction; reads of apilog continue while it holds the lock
+    op.execute("LOCK TABLE apilog IN EXCLUSIVE MODE")
+    since = {"since": cutoff - DELTA_MARGIN}
+    connection.execute(sa.text(
+        "INSERT INTO apilog_partitioned SELECT * FROM apilog WHERE created > :since ON CONFLICT DO NOTHING"
+    ), since)
+    connection.execute(sa.text(COPY_EVENTS.format(condition="created > :since")), since)
+    op.execute("DROP TABLE apilog")
+    op.execute("ALTER TABLE apilog_partitioned RENAME TO apilog")
+    op.execute("ALTER TABLE apilog_partitioned_default RENAME TO apilog_default")
+    op.execute("ALTER INDEX apilog_partitioned_pkey RENAME TO apilog_pkey")
+    for name in INDEXES:
+        op.execute(f"ALTER INDEX {name.replace('ix_apilog_', 'ix_apilog_partitioned_')} RENAME TO {name}")
+
+
+def downgrade() -> None:
+    op.execute("CREATE TABLE apilog_unpartitioned (LIKE apilog INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    op.execute("INSERT INTO apilog_unpartitioned SELECT * FROM apilog")
+    op.execute("DROP TABLE apilog")
+    op.execute("ALTER TABLE apilog_unpartitioned RENAME TO apilog")
+    op.execute("ALTER TABLE apilog ADD CONSTRAINT apilog_pkey PRIMARY KEY (id)")
+    for name, definition in FOREIGN_KEYS.items():
+        op.execute(f"ALTER TABLE apilog ADD CONSTRAINT {name} {definition}")
+    for name, definition in INDEXES.items():
+        if name != 'ix_apilog_project_created_at':
+            op.execute(f"CREATE INDEX {name} ON apilog {definition}")
+    op.create_index(
+        'ix_apilog_project_event_id', 'apilog', ['user_project_id', 'event_id'], unique=True,
+        postgresql_where=sa.text('event_id IS NOT NULL'),
+    )
+    op.drop_index(op.f('ix_apilogevent_created'), table_name='apilogevent')
+    op.drop_table('apilogevent')
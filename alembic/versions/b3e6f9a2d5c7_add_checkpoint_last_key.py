@@ -0,0 +1,26 @@
+"""Add last_key to import checkpoints
+
+Revision ID: b3e6f9a2d5c7
+Revises: a1d4f7b9c3e8
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e6f9a2d5c7'
+down_revision: Union[str, None] = 'a1d4f7b9c3e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('importcheckpoint', sa.Column('last_key', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('importcheckpoint', 'last_key')
@@ -0,0 +1,78 @@
+"""Add retention settings and hourly/daily rollups
+
+Adds per-project retention columns, the apiloghourly/apilogdaily rollup
+tables with their watermark, and an index on apilog.created. That index is
+built per partition with CREATE INDEX CONCURRENTLY and then attached to an
+index created ON ONLY the partitioned table, so ingestion is not blocked.
+
+Revision ID: b3f6a8d2c1e4
+Revises: a9d2e5f7c3b8
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f6a8d2c1e4'
+down_revision: Union[str, None] = 'a9d2e5f7c3b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ROLLUP_TABLES = ('apiloghourly', 'apilogdaily')
+# All partitions of apilog, the default one included
+PARTITIONS = (
+    "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+    "WHERE p.relname = 'apilog' AND p.relnamespace = current_schema()::regnamespace ORDER BY c.relname"
+)
+
+
+def create_rollup_table(name: str):
+    op.create_table(
+        name,
+        sa.Column('user_project_id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('is_bot', sa.Boolean(), nullable=False),
+        sa.Column('requests', sa.Integer(), nullable=False),
+        sa.Column('count_2xx', sa.Integer(), nullable=False),
+        sa.Column('count_3xx', sa.Integer(), nullable=False),
+        sa.Column('count_4xx', sa.Integer(), nullable=False),
+        sa.Column('count_5xx', sa.Integer(), nullable=False),
+        sa.Column('response_time_sum', sa.Float(), nullable=False),
+        sa.Column('response_time_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_project_id'], ['userproject.id']),
+        sa.PrimaryKeyConstraint('user_project_id', 'bucket', 'is_bot'),
+    )
+
+
+def upgrade() -> None:
+    op.add_column('userproject', sa.Column('raw_retention_days', sa.Integer(), nullable=True))
+    op.add_column('userproject', sa.Column('rollup_retention_days', sa.Integer(), nullable=True))
+    for name in ROLLUP_TABLES:
+        create_rollup_table(name)
+    op.create_table(
+        'rollupwatermark',
+        sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('watermark', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+    op.execute("CREATE INDEX ix_apilog_created ON ONLY apilog (created)")
+    connection = op.get_bind()
+    partitions = connection.execute(sa.text(PARTITIONS)).scalars().all()
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{partition}_created ON {partition} (created)")
+            op.execute(f"ALTER INDEX ix_apilog_created ATTACH PARTITION ix_{partition}_created")
+
+
+def downgrade() -> None:
+    op.drop_index('ix_apilog_created', table_name='apilog')
+    op.drop_table('rollupwatermark')
+    for name in ROLLUP_TABLES:
+        op.drop_table(name)
+    op.drop_column('userproject', 'rollup_retention_days')
+    op.drop_column('userproject', 'raw_retention_days')
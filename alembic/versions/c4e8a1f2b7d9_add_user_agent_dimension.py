@@ -0,0 +1,135 @@
+"""Add user agent dimension
+
+Moves the parsed user agent columns off apilog into a useragent table keyed by
+uuid5(user_agent) and references it from apilog.user_agent_id. Existing rows
+are backfilled in id-ordered chunks, each committed on its own so the table is
+never locked for the whole backfill. Also merges the two migration heads.
+
+Revision ID: c4e8a1f2b7d9
+Revises: 3afa2ffe2085, remove_payment_fields
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+import uuid
+from datetime import datetime
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a1f2b7d9'
+down_revision: Union[str, None] = ('3afa2ffe2085', 'remove_payment_fields')
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match app.models.useragent.USER_AGENT_NAMESPACE
+USER_AGENT_NAMESPACE = uuid.UUID("6f1c2a8e-3b4d-5e6f-8a9b-0c1d2e3f4a5b")
+CHUNK_SIZE = 10000
+
+STRING_COLUMNS = [
+    'user_agent_browser_family',
+    'user_agent_browser_version',
+    'user_agent_os_family',
+    'user_agent_os_version',
+    'user_agent_device_family',
+    'user_agent_device_brand',
+    'user_agent_device_model',
+]
+BOOLEAN_COLUMNS = ['is_mobile', 'is_tablet', 'is_pc', 'is_touch_capable', 'is_bot']
+LABEL_COLUMNS = STRING_COLUMNS + BOOLEAN_COLUMNS
+
+
+def label_columns():
+    return [sa.Column(name, sqlmodel.sql.sqltypes.AutoString(), nullable=True) for name in STRING_COLUMNS] + \
+        [sa.Column(name, sa.Boolean(), nullable=True) for name in BOOLEAN_COLUMNS]
+
+
+def id_chunks(connection):
+    """Yield (lower, upper] apilog id bounds covering the table in CHUNK_SIZE steps."""
+    last_id = None
+    while True:
+        query = "SELECT id FROM apilog"
+        if last_id is not None:
+            query += " WHERE id > :last_id"
+        query += " ORDER BY id LIMIT :limit"
+        ids = connection.execute(sa.text(query), {"last_id": last_id, "limit": CHUNK_SIZE}).scalars().all()
+        if not ids:
+            return
+        yield last_id, ids[-1]
+        last_id = ids[-1]
+
+
+def chunk_condition(lower):
+    return "apilog.id <= :upper" if lower is None else "apilog.id > :lower AND apilog.id <= :upper"
+
+
+def upgrade() -> None:
+    op.create_table(
+        'useragent',
+        sa.Column('id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column('user_agent', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        *label_columns(),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.add_column('apilog', sa.Column('user_agent_id', sqlmodel.sql.sqltypes.GUID(), nullable=True))
+    op.create_foreign_key('apilog_user_agent_id_fkey', 'apilog', 'useragent', ['user_agent_id'], ['id'])
+
+    connection = op.get_bind()
+
+    # One dimension row per distinct user agent
+    useragent = sa.table(
+        'useragent',
+        sa.column('id', sqlmodel.sql.sqltypes.GUID()),
+        sa.column('user_agent'),
+        sa.column('created'),
+        *[sa.column(name) for name in LABEL_COLUMNS],
+    )
+    distinct_rows = connection.execute(sa.text(
+        f"SELECT DISTINCT user_agent, {', '.join(LABEL_COLUMNS)} FROM apilog "
+        "WHERE user_agent IS NOT NULL AND user_agent <> ''"
+    )).mappings()
+    now = datetime.now()
+    rows = {}
+    for row in distinct_rows:
+        ua_id = uuid.uuid5(USER_AGENT_NAMESPACE, row['user_agent'])
+        rows.setdefault(ua_id, dict(row, id=ua_id, created=now))
+    rows = list(rows.values())
+    for start in range(0, len(rows), CHUNK_SIZE):
+        connection.execute(useragent.insert(), rows[start:start + CHUNK_SIZE])
+    # Temporary lookup index for the backfill; hash avoids the btree row size limit on long agents
+    op.execute("CREATE INDEX ix_useragent_user_agent_tmp ON useragent USING hash (user_agent)")
+
+    # Link existing logs chunk by chunk, each chunk in its own transaction
+    with op.get_context().autocommit_block():
+        for lower, upper in id_chunks(connection):
+            connection.execute(sa.text(
+                "UPDATE apilog SET user_agent_id = useragent.id FROM useragent "
+                f"WHERE {chunk_condition(lower)} AND apilog.user_agent = useragent.user_agent"
+            ), {"lower": lower, "upper": upper})
+
+    op.execute("DROP INDEX ix_useragent_user_agent_tmp")
+    op.create_index(op.f('ix_apilog_user_agent_id'), 'apilog', ['user_agent_id'], unique=False)
+    for name in LABEL_COLUMNS:
+        op.drop_column('apilog', name)
+
+
+def downgrade() -> None:
+    for column in label_columns():
+        op.add_column('apilog', column)
+
+    connection = op.get_bind()
+    with op.get_context().autocommit_block():
+        for lower, upper in id_chunks(connection):
+            assignments = ', '.join(f"{name} = useragent.{name}" for name in LABEL_COLUMNS)
+            connection.execute(sa.text(
+                f"UPDATE apilog SET {assignments} FROM useragent "
+                f"WHERE {chunk_condition(lower)} AND apilog.user_agent_id = useragent.id"
+            ), {"lower": lower, "upper": upper})
+
+    op.drop_index(op.f('ix_apilog_user_agent_id'), table_name='apilog')
+    op.drop_constraint('apilog_user_agent_id_fkey', 'apilog', type_='foreignkey')
+    op.drop_column('apilog', 'user_agent_id')
+    op.drop_table('useragent')
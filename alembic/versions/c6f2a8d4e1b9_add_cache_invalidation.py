@@ -0,0 +1,33 @@
+"""Add cache invalidation table
+
+Revision ID: c6f2a8d4e1b9
+Revises: b3e6f9a2d5c7
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6f2a8d4e1b9'
+down_revision: Union[str, None] = 'b3e6f9a2d5c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'cacheinvalidation',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('cache', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('key', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('created', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('cacheinvalidation')
@@ -0,0 +1,55 @@
+"""Add minute rollup
+
+Revision ID: c7e1b4f9a2d5
+Revises: b3f6a8d2c1e4
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e1b4f9a2d5'
+down_revision: Union[str, None] = 'b3f6a8d2c1e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'apilogminutely',
+        sa.Column('user_project_id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('is_bot', sa.Boolean(), nullable=False),
+        sa.Column('requests', sa.Integer(), nullable=False),
+        sa.Column('count_2xx', sa.Integer(), nullable=False),
+        sa.Column('count_3xx', sa.Integer(), nullable=False),
+        sa.Column('count_4xx', sa.Integer(), nullable=False),
+        sa.Column('count_5xx', sa.Integer(), nullable=False),
+        sa.Column('response_time_sum', sa.Float(), nullable=False),
+        sa.Column('response_time_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_project_id'], ['userproject.id']),
+        sa.PrimaryKeyConstraint('user_project_id', 'bucket', 'is_bot'),
+    )
+    # Logs already folded into the hourly/daily rollups get minute buckets for the last week
+    # (the default MINUTE_ROLLUP_RETENTION_DAYS); newer ones are added by the next compaction
+    op.execute(
+        "INSERT INTO apilogminutely "
+        "SELECT user_project_id, date_trunc('minute', created_at), coalesce(useragent.is_bot, false), count(*), "
+        "count(CASE WHEN response_code BETWEEN 200 AND 299 THEN 1 END), "
+        "count(CASE WHEN response_code BETWEEN 300 AND 399 THEN 1 END), "
+        "count(CASE WHEN response_code BETWEEN 400 AND 499 THEN 1 END), "
+        "count(CASE WHEN response_code BETWEEN 500 AND 599 THEN 1 END), "
+        "coalesce(sum(response_time), 0), count(response_time) "
+        "FROM apilog LEFT JOIN useragent ON useragent.id = apilog.user_agent_id "
+        "WHERE apilog.created <= (SELECT watermark FROM rollupwatermark WHERE name = 'apilog_rollup') "
+        "AND apilog.created_at >= localtimestamp - interval '7 days' "
+        "GROUP BY 1, 2, 3"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('apilogminutely')
@@ -0,0 +1,48 @@
+"""Add daily dimension rollup
+
+Revision ID: d2a7c9e4f1b6
+Revises: c7e1b4f9a2d5
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a7c9e4f1b6'
+down_revision: Union[str, None] = 'c7e1b4f9a2d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'apilogdimensiondaily',
+        sa.Column('user_project_id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column('day', sa.DateTime(), nullable=False),
+        sa.Column('dimension', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('value', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('is_bot', sa.Boolean(), nullable=False),
+        sa.Column('requests', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_project_id'], ['userproject.id']),
+        sa.PrimaryKeyConstraint('user_project_id', 'day', 'dimension', 'value', 'is_bot'),
+    )
+    # Logs already folded into the other rollups are counted here too; newer ones are added
+    # by the next compaction. The watermark row lock keeps compactions out meanwhile.
+    op.execute("SELECT watermark FROM rollupwatermark WHERE name = 'apilog_rollup' FOR UPDATE")
+    for dimension, column in (("user_agent", "user_agent_id"), ("response_code", "response_code")):
+        op.execute(
+            "INSERT INTO apilogdimensiondaily "
+            f"SELECT user_project_id, date_trunc('day', created_at), '{dimension}', "
+            f"coalesce(apilog.{column}::text, ''), coalesce(useragent.is_bot, false), count(*) "
+            "FROM apilog LEFT JOIN useragent ON useragent.id = apilog.user_agent_id "
+            "WHERE apilog.created <= (SELECT watermark FROM rollupwatermark WHERE name = 'apilog_rollup') "
+            "GROUP BY 1, 2, 3, 4, 5"
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('apilogdimensiondaily')
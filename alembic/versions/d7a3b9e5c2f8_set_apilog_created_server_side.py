@@ -0,0 +1,26 @@
+"""Set apilog.created on the database side
+
+Revision ID: d7a3b9e5c2f8
+Revises: c6f2a8d4e1b9
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3b9e5c2f8'
+down_revision: Union[str, None] = 'c6f2a8d4e1b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Recurses to the partitions; a catalog-only change, existing rows are not touched
+    op.alter_column('apilog', 'created', server_default=sa.text('LOCALTIMESTAMP'))
+
+
+def downgrade() -> None:
+    op.alter_column('apilog', 'created', server_default=None)
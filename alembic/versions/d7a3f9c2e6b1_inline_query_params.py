@@ -0,0 +1,95 @@
+"""Store query params inline on apilog
+
+Adds apilog.query_params (JSONB, GIN indexed with jsonb_path_ops), copies the
+apilogqueryparam rows into it in id-ordered chunks, each committed on its own,
+and drops apilogqueryparam.
+
+Revision ID: d7a3f9c2e6b1
+Revises: c4e8a1f2b7d9
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3f9c2e6b1'
+down_revision: Union[str, None] = 'c4e8a1f2b7d9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHUNK_SIZE = 10000
+
+
+def id_chunks(connection):
+    """Yield (lower, upper] apilog id bounds covering the table in CHUNK_SIZE steps."""
+    last_id = None
+    while True:
+        query = "SELECT id FROM apilog"
+        if last_id is not None:
+            query += " WHERE id > :last_id"
+        query += " ORDER BY id LIMIT :limit"
+        ids = connection.execute(sa.text(query), {"last_id": last_id, "limit": CHUNK_SIZE}).scalars().all()
+        if not ids:
+            return
+        yield last_id, ids[-1]
+        last_id = ids[-1]
+
+
+def chunk_condition(lower):
+    return "apilog.id <= :upper" if lower is None else "apilog.id > :lower AND apilog.id <= :upper"
+
+
+def upgrade() -> None:
+    op.add_column('apilog', sa.Column('query_params', postgresql.JSONB(), nullable=True))
+    # apilogqueryparam.api_log_id was never indexed; needed for the per-chunk lookups
+    op.execute("CREATE INDEX ix_apilogqueryparam_api_log_id_tmp ON apilogqueryparam (api_log_id)")
+
+    connection = op.get_bind()
+    with op.get_context().autocommit_block():
+        for lower, upper in id_chunks(connection):
+            connection.execute(sa.text(
+                "UPDATE apilog SET query_params = params.query_params FROM ("
+                "  SELECT api_log_id, jsonb_object_agg(key, value) AS query_params"
+                "  FROM apilogqueryparam JOIN apilog ON apilog.id = apilogqueryparam.api_log_id"
+                f"  WHERE {chunk_condition(lower)} AND key <> '' AND value <> ''"
+                "  GROUP BY api_log_id"
+                ") AS params WHERE apilog.id = params.api_log_id"
+            ), {"lower": lower, "upper": upper})
+
+        op.create_index(
+            'ix_apilog_query_params', 'apilog', ['query_params'], unique=False,
+            postgresql_using='gin', postgresql_ops={'query_params': 'jsonb_path_ops'},
+            postgresql_concurrently=True,
+        )
+
+    op.drop_table('apilogqueryparam')
+
+
+def downgrade() -> None:
+    op.create_table(
+        'apilogqueryparam',
+        sa.Column('id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column('api_log_id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column('key', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('value', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.ForeignKeyConstraint(['api_log_id'], ['apilog.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+    connection = op.get_bind()
+    with op.get_context().autocommit_block():
+        for lower, upper in id_chunks(connection):
+            connection.execute(sa.text(
+                "INSERT INTO apilogqueryparam (id, api_log_id, key, value) "
+                "SELECT gen_random_uuid(), apilog.id, params.key, params.value "
+                "FROM apilog, jsonb_each_text(apilog.query_params) AS params "
+                f"WHERE {chunk_condition(lower)} AND apilog.query_params IS NOT NULL"
+            ), {"lower": lower, "upper": upper})
+
+    op.drop_index('ix_apilog_query_params', table_name='apilog')
+    op.drop_column('apilog', 'query_params')
@@ -0,0 +1,35 @@
+"""Add apilog.event_id
+
+Client-supplied idempotency key, unique per project. The index is partial so
+logs without an event id do not pay for it, and is built concurrently.
+
+Revision ID: e2b8c4d1a9f3
+Revises: d7a3f9c2e6b1
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b8c4d1a9f3'
+down_revision: Union[str, None] = 'd7a3f9c2e6b1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('apilog', sa.Column('event_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_apilog_project_event_id', 'apilog', ['user_project_id', 'event_id'], unique=True,
+            postgresql_where=sa.text('event_id IS NOT NULL'), postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_apilog_project_event_id', table_name='apilog')
+    op.drop_column('apilog', 'event_id')
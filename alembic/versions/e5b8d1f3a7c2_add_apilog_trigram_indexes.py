@@ -0,0 +1,50 @@
+"""Add trigram indexes for log search
+
+Enables pg_trgm and adds GIN trigram indexes on apilog.path, user_agent and
+ip_address for the log explorer's ILIKE searches. Like ix_apilog_created,
+they are built per partition with CREATE INDEX CONCURRENTLY and attached to
+indexes created ON ONLY the partitioned table, so ingestion is not blocked.
+
+Revision ID: e5b8d1f3a7c2
+Revises: d2a7c9e4f1b6
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b8d1f3a7c2'
+down_revision: Union[str, None] = 'd2a7c9e4f1b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_COLUMNS = ('path', 'user_agent', 'ip_address')
+# All partitions of apilog, the default one included
+PARTITIONS = (
+    "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+    "WHERE p.relname = 'apilog' AND p.relnamespace = current_schema()::regnamespace ORDER BY c.relname"
+)
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for column in SEARCH_COLUMNS:
+        op.execute(f"CREATE INDEX ix_apilog_{column}_trgm ON ONLY apilog USING gin ({column} gin_trgm_ops)")
+    connection = op.get_bind()
+    partitions = connection.execute(sa.text(PARTITIONS)).scalars().all()
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            for column in SEARCH_COLUMNS:
+                op.execute(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{partition}_{column}_trgm "
+                    f"ON {partition} USING gin ({column} gin_trgm_ops)"
+                )
+                op.execute(f"ALTER INDEX ix_apilog_{column}_trgm ATTACH PARTITION ix_{partition}_{column}_trgm")
+
+
+def downgrade() -> None:
+    for column in SEARCH_COLUMNS:
+        op.drop_index(f'ix_apilog_{column}_trgm', table_name='apilog')
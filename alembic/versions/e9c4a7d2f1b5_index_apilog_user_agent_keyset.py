@@ -0,0 +1,51 @@
+"""Index apilog by user agent, created_at and id
+
+Replaces ix_apilog_user_agent_id with ix_apilog_user_agent_created_at on
+(user_agent_id, created_at, id), which still serves lookups by user agent
+and lets process_botinfo.py walk each user agent's logs by keyset. Like the
+other apilog indexes, it is built per partition with CREATE INDEX
+CONCURRENTLY and attached to an index created ON ONLY the partitioned
+table, so ingestion is not blocked.
+
+Revision ID: e9c4a7d2f1b5
+Revises: d7a3b9e5c2f8
+Create Date: 2026-10-19 01:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9c4a7d2f1b5'
+down_revision: Union[str, None] = 'd7a3b9e5c2f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# All partitions of apilog, the default one included
+PARTITIONS = (
+    "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+    "WHERE p.relname = 'apilog' AND p.relnamespace = current_schema()::regnamespace ORDER BY c.relname"
+)
+
+
+def upgrade() -> None:
+    op.execute("CREATE INDEX ix_apilog_user_agent_created_at ON ONLY apilog (user_agent_id, created_at, id)")
+    connection = op.get_bind()
+    partitions = connection.execute(sa.text(PARTITIONS)).scalars().all()
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{partition}_user_agent_created_at "
+                f"ON {partition} (user_agent_id, created_at, id)"
+            )
+            op.execute(
+                f"ALTER INDEX ix_apilog_user_agent_created_at ATTACH PARTITION ix_{partition}_user_agent_created_at"
+            )
+    op.drop_index('ix_apilog_user_agent_id', table_name='apilog')
+
+
+def downgrade() -> None:
+    op.create_index('ix_apilog_user_agent_id', 'apilog', ['user_agent_id'], unique=False)
+    op.drop_index('ix_apilog_user_agent_created_at', table_name='apilog')
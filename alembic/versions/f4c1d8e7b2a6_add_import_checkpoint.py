@@ -0,0 +1,33 @@
+"""Add import checkpoint table
+
+Revision ID: f4c1d8e7b2a6
+Revises: e2b8c4d1a9f3
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c1d8e7b2a6'
+down_revision: Union[str, None] = 'e2b8c4d1a9f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'importcheckpoint',
+        sa.Column('source', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('lines_done', sa.Integer(), nullable=False),
+        sa.Column('rows_imported', sa.Integer(), nullable=False),
+        sa.Column('updated', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('source'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('importcheckpoint')
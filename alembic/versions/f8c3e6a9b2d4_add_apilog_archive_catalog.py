@@ -0,0 +1,39 @@
+"""Add apilog archive catalog
+
+Revision ID: f8c3e6a9b2d4
+Revises: e5b8d1f3a7c2
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'f8c3e6a9b2d4'
+down_revision: Union[str, None] = 'e5b8d1f3a7c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'apilogarchive',
+        sa.Column('id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column('user_project_id', sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column('period_start', sa.DateTime(), nullable=False),
+        sa.Column('period_end', sa.DateTime(), nullable=False),
+        sa.Column('uri', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('rows', sa.Integer(), nullable=False),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_project_id'], ['userproject.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_apilogarchive_user_project_id'), 'apilogarchive', ['user_project_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_apilogarchive_user_project_id'), table_name='apilogarchive')
+    op.drop_table('apilogarchive')
@@ -4,8 +4,21 @@ from dotenv import load_dotenv
 # Load the .env file
 load_dotenv()
 
+def get_async_database_url(url):
+    """Map a sync DATABASE_URL onto the matching async driver (asyncpg / aiosqlite)."""
+    if not url:
+        return url
+    scheme, _, rest = url.partition("://")
+    if scheme in ("postgres", "postgresql", "postgresql+psycopg2"):
+        # asyncpg spells libpq's sslmode as ssl
+        return "postgresql+asyncpg://" + rest.replace("sslmode=", "ssl=")
+    if scheme == "sqlite":
+        return "sqlite+aiosqlite://" + rest
+    return url
+
 # Fetch values from environment variables
 DATABASE_URL = os.getenv("DATABASE_URL")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or get_async_database_url(DATABASE_URL)
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 43200))
@@ -16,4 +29,97 @@ REDIRECT_URI = os.getenv("REDIRECT_URI")
 VAPID_PRIVATE_KEY = os.getenv("VAPID_PRIVATE_KEY")
 VAPID_PUBLIC_KEY = os.getenv("VAPID_PUBLIC_KEY")
 
+# API key -> project cache used by the ingest API
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", 10000))
+API_KEY_CACHE_TTL = float(os.getenv("API_KEY_CACHE_TTL", 60))
+API_KEY_CACHE_NEGATIVE_TTL = float(os.getenv("API_KEY_CACHE_NEGATIVE_TTL", 10))
+# Seconds between polls of the cacheinvalidation table, through which the dashboard reaches API worker caches
+CACHE_INVALIDATION_INTERVAL = float(os.getenv("CACHE_INVALIDATION_INTERVAL", 1))
+
+# Parsed user agent cache (per worker)
+USER_AGENT_CACHE_SIZE = int(os.getenv("USER_AGENT_CACHE_SIZE", 10000))
+# Ids of useragent dimension rows known to exist (per worker)
+USER_AGENT_ID_CACHE_SIZE = int(os.getenv("USER_AGENT_ID_CACHE_SIZE", 100000))
+
+# Recently saved (project, event_id) pairs, so client retries are dropped without a query
+EVENT_ID_CACHE_SIZE = int(os.getenv("EVENT_ID_CACHE_SIZE", 100000))
+EVENT_ID_CACHE_TTL = float(os.getenv("EVENT_ID_CACHE_TTL", 3600))
+
+# Compiled path template rules per project (per worker); rule changes reach other workers within the TTL
+PATH_TEMPLATE_CACHE_SIZE = int(os.getenv("PATH_TEMPLATE_CACHE_SIZE", 10000))
+PATH_TEMPLATE_CACHE_TTL = float(os.getenv("PATH_TEMPLATE_CACHE_TTL", 60))
+
+# Offline IP geolocation: a MaxMind .mmdb file or a CSV of IP ranges
+GEOIP_DATABASE_PATH = os.getenv("GEOIP_DATABASE_PATH")
+GEOIP_CACHE_SIZE = int(os.getenv("GEOIP_CACHE_SIZE", 50000))
+
+# Token required by the /metrics endpoints; unset keeps them disabled
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Write-behind ingest queue for the API service
+INGEST_BUFFER_ENABLED = os.getenv("INGEST_BUFFER_ENABLED", "true").lower() == "true"
+INGEST_QUEUE_MAX_SIZE = int(os.getenv("INGEST_QUEUE_MAX_SIZE", 10000))
+INGEST_MAX_BATCH_SIZE = int(os.getenv("INGEST_MAX_BATCH_SIZE", 500))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", 1.0))
+INGEST_QUEUE_OVERFLOW = os.getenv("INGEST_QUEUE_OVERFLOW", "reject")  # block, drop or reject (429)
+
+# Token-bucket rate limits on ingest, in log rows per second (bulk payloads pay per row); off by default
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+RATE_LIMIT_KEY_RATE = float(os.getenv("RATE_LIMIT_KEY_RATE", 200))
+RATE_LIMIT_KEY_BURST = float(os.getenv("RATE_LIMIT_KEY_BURST", 2000))
+RATE_LIMIT_PROJECT_RATE = float(os.getenv("RATE_LIMIT_PROJECT_RATE", 500))
+RATE_LIMIT_PROJECT_BURST = float(os.getenv("RATE_LIMIT_PROJECT_BURST", 5000))
+# Share buckets between workers through Redis; per-worker buckets when unset or unreachable
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", 100000))
+
+# Projects the API and dashboard services log their own requests into (disabled when unset)
+API_TELEMETRY_PROJECT_ID = os.getenv("API_TELEMETRY_PROJECT_ID")
+DASH_TELEMETRY_PROJECT_ID = os.getenv("DASH_TELEMETRY_PROJECT_ID")
+SELF_TELEMETRY_QUEUE_MAX_SIZE = int(os.getenv("SELF_TELEMETRY_QUEUE_MAX_SIZE", 10000))
+SELF_TELEMETRY_MAX_BATCH_SIZE = int(os.getenv("SELF_TELEMETRY_MAX_BATCH_SIZE", 500))
+SELF_TELEMETRY_FLUSH_INTERVAL = float(os.getenv("SELF_TELEMETRY_FLUSH_INTERVAL", 5.0))
+
+# NDJSON streaming upload (/api/log/stream)
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 500))
+STREAM_MAX_LINE_BYTES = int(os.getenv("STREAM_MAX_LINE_BYTES", 1 << 20))
+STREAM_MAX_REPORTED_ERRORS = int(os.getenv("STREAM_MAX_REPORTED_ERRORS", 100))
+
+# Range partitioning of apilog by created_at (PostgreSQL): "day" or "month" partitions,
+# created this many intervals ahead by a loop in the API service
+APILOG_PARTITION_INTERVAL = os.getenv("APILOG_PARTITION_INTERVAL", "month")
+APILOG_PARTITIONS_AHEAD = int(os.getenv("APILOG_PARTITIONS_AHEAD", 3))
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", 3600))
+
+# Default retention in days for raw logs and for their hourly/daily rollups; unset keeps them
+# forever. Projects can override both.
+RAW_RETENTION_DAYS = int(os.getenv("RAW_RETENTION_DAYS", 0)) or None
+ROLLUP_RETENTION_DAYS = int(os.getenv("ROLLUP_RETENTION_DAYS", 0)) or None
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", 3600))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 5000))
+# Rollups only take rows ingested at least this many seconds ago (by the database clock).
+# On PostgreSQL they also wait for transactions still writing; the lag is a margin on top.
+ROLLUP_LAG = float(os.getenv("ROLLUP_LAG", 60))
+# Ingest-time span folded per rollup transaction while catching up
+ROLLUP_STEP = float(os.getenv("ROLLUP_STEP", 3600))
+# Seconds between rollup compactions; charts read raw rows only for logs newer than the last one
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", 60))
+# Minute rollups only serve the short minute charts, so they are kept for all projects alike
+MINUTE_ROLLUP_RETENTION_DAYS = int(os.getenv("MINUTE_ROLLUP_RETENTION_DAYS", 7))
+
+# Cold log archive: periods older than ARCHIVE_AFTER_DAYS are exported to Parquet files under
+# ARCHIVE_URI (a local directory or an object store URI such as s3://bucket/prefix) and removed
+# from apilog. Unset disables archiving.
+ARCHIVE_URI = os.getenv("ARCHIVE_URI")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 90))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", 86400))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 50000))
+
+# Totals of the log explorer: "exact", "estimated" (query planner row estimate, PostgreSQL),
+# "capped" (count up to LOG_COUNT_CAP rows) or "auto" (exact up to LOG_COUNT_EXACT_THRESHOLD
+# estimated rows, estimated above)
+LOG_COUNT_MODE = os.getenv("LOG_COUNT_MODE", "auto")
+LOG_COUNT_CAP = int(os.getenv("LOG_COUNT_CAP", 10000))
+LOG_COUNT_EXACT_THRESHOLD = int(os.getenv("LOG_COUNT_EXACT_THRESHOLD", 100000))
+
 # Debug printing removed for security reasons
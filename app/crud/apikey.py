@@ -4,7 +4,9 @@ from uuid import uuid4
 from fastapi import HTTPException
 from sqlmodel import Session
 
+from app.dependencies.apikey import api_key_cache
 from app.models.apikey import APIKey
+from app.services.invalidation_service import publish_invalidation
 
 
 def create_api_key(db: Session, user_id: uuid.UUID, name: str = None, user_project_id: uuid.UUID = None):
@@ -22,6 +24,9 @@ def create_api_key(db: Session, user_id: uuid.UUID, name: str = None, user_proje
 def delete_api_key(db: Session, key_id: uuid.UUID):
     api_key = db.get(APIKey, key_id)
     if api_key:
+        key = api_key.key
         db.delete(api_key)
+        publish_invalidation(db, "api_key", key)
         db.commit()
+        api_key_cache.invalidate(key)
     return api_key
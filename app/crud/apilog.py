@@ -1,32 +1,57 @@
-import re
-import traceback
+import base64
+import json
 import uuid
+from collections import Counter
 from datetime import datetime, timedelta
 from http.client import responses
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Set
 from urllib.parse import parse_qs, urlparse
 
-import httpx
+from fastapi import HTTPException
 from relative_datetime import DateTimeUtils
-from sqlalchemy import and_, case, func, or_, select
+from sqlalchemy import (and_, case, column, func, insert, literal, or_,
+                        select, table, tuple_, type_coerce, union)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import case, exists, func
 from sqlmodel import Session, or_, select
-from user_agents import parse
-
-from app.models.apilog import APILog, APILogQueryParam
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import (EVENT_ID_CACHE_SIZE, EVENT_ID_CACHE_TTL, LOG_COUNT_CAP,
+                        LOG_COUNT_EXACT_THRESHOLD, LOG_COUNT_MODE)
+from app.crud.useragent import (bot_user_agent_ids, ensure_user_agents,
+                                get_user_agents, mark_user_agents_known,
+                                user_agent_labels)
+from app.database import escape_like, insert_ignore, planner_row_estimate
+from app.models.apilog import APILog, APILogEvent
 from app.models.botinfo import BotInfo
+from app.models.useragent import USER_AGENT_LABELS, UserAgent, user_agent_id
 from app.models.user import UserProject
 from app.schemas.apilog import APILogCreate, APILogSearch
-
-
-async def get_geolocation(ip: str):
-    if ip and ',' in ip:
-        ip = ip.split(',')[0]
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f'https://ipinfo.io/{ip}/json?token=352e1fa66d5869')
-        return response.json()
-
-async def get_url_components(url):
+from app.services.archive_service import archive_counts, archive_stats
+from app.services.bot_match_service import (BotMatcher, current_bot_matcher,
+                                            get_bot_matcher)
+from app.services.cache_service import MISSING, TTLCache
+from app.services.geoip_service import get_location, get_locations
+from app.services.metrics_service import register_metrics
+from app.services.path_template_service import (DEFAULT_TEMPLATER,
+                                                PathTemplater,
+                                                get_path_templater,
+                                                path_templaters)
+from app.services.rollup_service import (bucket_expression, bucket_start,
+                                         current_watermark, dimension_totals,
+                                         full_buckets, rollup_totals)
+from app.services.user_agent_service import get_user_agent_details
+
+# (user_project_id, event_id) of recently saved logs; retries inside the window skip the database
+recent_event_ids = TTLCache(maxsize=EVENT_ID_CACHE_SIZE, ttl=EVENT_ID_CACHE_TTL)
+register_metrics("event_id_cache", recent_event_ids.stats)
+APILOG_INSERT_COLUMNS = [column.key for column in APILog.__table__.columns if column.key != "created"]
+
+# Endpoint of a log for aggregations; logs saved before path templating fall back to their raw path
+ENDPOINT = func.coalesce(APILog.path_template, APILog.path)
+
+
+def get_url_components(url):
     # Parse the URL
     parsed_url = urlparse(url)
     
@@ -53,76 +78,164 @@ def get_response_code_text(code: int):
         return responses.get(code, None)
     return None
 
-def parse_user_agent(apilog: APILog):
-    print("Parsing user agent", apilog.user_agent)
-    try:
-        if parsed_user_agent := parse(apilog.user_agent):
-            print(apilog.user_agent, parsed_user_agent)
-            apilog.user_agent_browser_family = parsed_user_agent.browser.family
-            apilog.user_agent_browser_version = parsed_user_agent.browser.version_string
-            apilog.user_agent_os_family = parsed_user_agent.os.family
-            apilog.user_agent_os_version = parsed_user_agent.os.version_string
-            apilog.user_agent_device_family = parsed_user_agent.device.family
-            apilog.user_agent_device_brand = parsed_user_agent.device.brand
-            apilog.user_agent_device_model = parsed_user_agent.device.model
-            apilog.is_mobile = parsed_user_agent.is_mobile
-            apilog.is_tablet = parsed_user_agent.is_tablet
-            apilog.is_pc = parsed_user_agent.is_pc
-            apilog.is_touch_capable = parsed_user_agent.is_touch_capable
-            apilog.is_bot = parsed_user_agent.is_bot
-    except Exception as e:
-        traceback.print_exc()
-    return apilog
-
-bot_infos = []
+def load_bot_infos(session: Session):
+    return [bot_info.dict() for bot_info in session.query(BotInfo).all()]
 
-def get_bot_id(user_agent: str, session: Session):
-    global bot_infos
-    if not bot_infos:
-        bot_infos_query = session.query(BotInfo).all()
-        bot_infos = [bot_info.dict() for bot_info in bot_infos_query]
-    # Check if any of botinfo.pattern matches the user agent
-    for botinfo in bot_infos:
-        if pattern := botinfo.get('pattern'):
-            compiled_pattern = re.compile(pattern)
-            if compiled_pattern.search(user_agent):
-                return botinfo.get("id")
-    return None
+async def load_bot_matcher(db: AsyncSession) -> BotMatcher:
+    """The process-wide bot matcher, loading the BotInfo table through `db` on first use."""
+    if bot_matcher := current_bot_matcher():
+        return bot_matcher
+    bot_infos = [bot_info.dict() for bot_info in (await db.exec(select(BotInfo))).all()]
+    return get_bot_matcher(lambda: bot_infos)
 
-async def create_apilog(db: Session, user_project_id: uuid.UUID, apilog: APILogCreate, update_location: bool = False):
-    db_apilog = APILog( **apilog.dict())
+def get_bot_id(user_agent: str, session: Session):
+    # The matcher is built from the BotInfo table once per process
+    return get_bot_matcher(lambda: load_bot_infos(session)).match(user_agent)
+
+def parse_user_agent(user_agent: str, session: Session):
+    return get_user_agent_details(user_agent, get_bot_matcher(lambda: load_bot_infos(session)))
+
+def build_user_agent_row(user_agent: str, details) -> dict:
+    row = {label: details.get(label) for label in USER_AGENT_LABELS}
+    row.update(id=user_agent_id(user_agent), user_agent=user_agent, created=datetime.now())
+    return row
+
+async def load_path_templater(db: AsyncSession, user_project_id: uuid.UUID) -> PathTemplater:
+    """The project's path templater, loading its rules through `db` when they are not cached."""
+    templater = path_templaters.get(user_project_id)
+    if templater is MISSING:
+        rules = (await db.exec(
+            select(UserProject.path_template_rules).where(UserProject.id == user_project_id)
+        )).first()
+        templater = get_path_templater(rules)
+        path_templaters.set(user_project_id, templater)
+    return templater
+
+def build_apilog(
+    bot_matcher: BotMatcher, user_project_id: uuid.UUID, apilog: APILogCreate,
+    path_templater: PathTemplater = DEFAULT_TEMPLATER,
+):
+    """
+    Enrich a log entry in memory. Returns the unsaved APILog and the UserAgent
+    dimension row it references (or None).
+    """
+    db_apilog = APILog(**apilog.dict())
     db_apilog.user_project_id = user_project_id
+    # The column is NOT NULL; multi-row inserts do not fill in the model default
+    db_apilog.user_agent = apilog.user_agent or ""
     db_apilog.created_at = apilog.created_at or datetime.now()
-    if update_location and apilog.ip_address:
-        geolocation = await get_geolocation(apilog.ip_address)
-        db_apilog.location = geolocation.get('city', '') + ', ' + geolocation.get('region', '') + ', ' + geolocation.get('country', '')
-    
+
     if code := apilog.response_code:
         db_apilog.response_code_text = get_response_code_text(code)
-    
-    query_params = None
+
     if apilog.url:
-        url, path, query_params = await get_url_components(apilog.url)
+        url, path, query_params = get_url_components(apilog.url)
         db_apilog.path = path
-    
+        db_apilog.path_template = path_templater.template(path)
+        db_apilog.query_params = {key: value for key, value in query_params.items() if key} or None
+
+    user_agent_row = None
     if apilog.user_agent:
-        db_apilog = parse_user_agent(db_apilog)
-        db_apilog.bot_id = get_bot_id(apilog.user_agent, db)
-    
+        details = get_user_agent_details(apilog.user_agent, bot_matcher)
+        db_apilog.bot_id = details.get("bot_id")
+        user_agent_row = build_user_agent_row(apilog.user_agent, details)
+        db_apilog.user_agent_id = user_agent_row["id"]
+
+    return db_apilog, user_agent_row
+
+async def claim_event_ids(db: AsyncSession, user_project_id: uuid.UUID, event_ids: Iterable[str]) -> Set[str]:
+    """
+    Record `event_ids` as saved for the project in the caller's transaction.
+    Returns the ids that had not been saved before.
+    """
+    now = datetime.now()
+    rows = [{"user_project_id": user_project_id, "event_id": event_id, "created": now} for event_id in event_ids]
+    if not rows:
+        return set()
+    statement = insert_ignore(APILogEvent.__table__, db.bind.dialect.name).returning(APILogEvent.__table__.c.event_id)
+    return set((await db.execute(statement, rows)).scalars().all())
+
+async def create_apilog(db: AsyncSession, user_project_id: uuid.UUID, apilog: APILogCreate, update_location: bool = True):
+    """Save one log. Returns None if its event_id was already saved for the project."""
+    event_key = (user_project_id, apilog.event_id) if apilog.event_id else None
+    if event_key and recent_event_ids.get(event_key) is not MISSING:
+        return None
+    # Retries of an event older than the cache are caught by the apilogevent primary key
+    if event_key and not await claim_event_ids(db, user_project_id, [apilog.event_id]):
+        await db.rollback()
+        recent_event_ids.set(event_key, True)
+        return None
+
+    bot_matcher = await load_bot_matcher(db)
+    path_templater = await load_path_templater(db, user_project_id)
+    db_apilog, user_agent_row = build_apilog(bot_matcher, user_project_id, apilog, path_templater)
+    # A location sent by the client wins over the GeoIP lookup
+    if update_location and apilog.ip_address and not apilog.location:
+        db_apilog.location = get_location(apilog.ip_address)
+
+    if user_agent_row:
+        await ensure_user_agents(db, {user_agent_row["id"]: user_agent_row})
     db.add(db_apilog)
-    db.commit()
-    db.refresh(db_apilog)
-    if query_params:
-        db.add_all(APILogQueryParam(api_log_id=db_apilog.id, key=key, value=value) for key, value in query_params.items() if key and value)
-        db.commit()
+    await db.commit()
+    if user_agent_row:
+        mark_user_agents_known([user_agent_row["id"]])
+    if event_key:
+        recent_event_ids.set(event_key, True)
+    # `created` is set by the database and came back with the insert (eager_defaults)
     return db_apilog
 
-async def create_apilog_bulk(db: Session, user_project_id: uuid.UUID, apilogs: List[APILogCreate], update_location: bool = False):
-    db_apilogs = []
+async def create_apilog_bulk(db: AsyncSession, user_project_id: uuid.UUID, apilogs: List[APILogCreate], update_location: bool = True):
+    """
+    Enrich the whole batch in memory and write it with one multi-row insert
+    inside a single transaction. Returns an ack instead of the ORM rows.
+
+    Entries whose event_id was already saved for the project are skipped:
+    recently seen ids are dropped in memory, anything older when
+    claim_event_ids finds it already recorded.
+    """
+    locations = {}
+    if update_location:
+        # One batched GeoIP pass over the distinct IPs of the batch
+        locations = get_locations(apilog.ip_address for apilog in apilogs if not apilog.location)
+
+    bot_matcher = await load_bot_matcher(db)
+    path_templater = await load_path_templater(db, user_project_id)
+    apilog_rows = []
+    user_agent_rows = {}
+    event_keys = set()
+    duplicates = 0
     for apilog in apilogs:
-        if ca := await create_apilog(db, user_project_id, apilog, update_location):
-            db_apilogs.append(ca)
-    return db_apilogs
+        if apilog.event_id:
+            event_key = (user_project_id, apilog.event_id)
+            if event_key in event_keys or recent_event_ids.get(event_key) is not MISSING:
+                duplicates += 1
+                continue
+            event_keys.add(event_key)
+        db_apilog, user_agent_row = build_apilog(bot_matcher, user_project_id, apilog, path_templater)
+        if user_agent_row:
+            user_agent_rows[user_agent_row["id"]] = user_agent_row
+        if not apilog.location and apilog.ip_address in locations:
+            db_apilog.location = locations[apilog.ip_address]
+        # Every column, so all rows of the multi-row insert share one set of keys. `created`
+        # is left out so the database sets it.
+        apilog_rows.append({column: getattr(db_apilog, column) for column in APILOG_INSERT_COLUMNS})
+
+    if event_keys:
+        claimed = await claim_event_ids(db, user_project_id, [event_id for _, event_id in event_keys])
+        saved_rows = [row for row in apilog_rows if not row["event_id"] or row["event_id"] in claimed]
+        duplicates += len(apilog_rows) - len(saved_rows)
+        apilog_rows = saved_rows
+    if user_agent_rows:
+        await ensure_user_agents(db, user_agent_rows)
+    if apilog_rows:
+        await db.execute(insert(APILog.__table__), apilog_rows)
+    await db.commit()
+    mark_user_agents_known(user_agent_rows)
+    for event_key in event_keys:
+        recent_event_ids.set(event_key, True)
+
+    ids = [row["id"] for row in apilog_rows]
+    return {"count": len(ids), "ids": ids, "duplicates": duplicates}
 
 def get_bot_logs_stats_data(
     db: Session, 
@@ -146,7 +259,7 @@ def get_bot_logs_stats_data(
     
     top_bots = (
         query.with_entities(APILog.bot_id, func.count(APILog.bot_id).label('count'))
-        .filter(APILog.is_bot == True)
+        .filter(APILog.user_agent_id.in_(bot_user_agent_ids()))
         .group_by(APILog.bot_id)
         .order_by(func.count(APILog.bot_id).desc())
         .limit(20)
@@ -163,20 +276,21 @@ def get_bot_logs_stats_data(
         # Device stats
         device_stats = (
             query.with_entities(
-                func.count(case((APILog.is_mobile == True, 1))).label('mobile_count'),
-                func.count(case((APILog.is_tablet == True, 1))).label('tablet_count'),
-                func.count(case((APILog.is_pc == True, 1))).label('pc_count')
+                func.count(case((UserAgent.is_mobile == True, 1))).label('mobile_count'),
+                func.count(case((UserAgent.is_tablet == True, 1))).label('tablet_count'),
+                func.count(case((UserAgent.is_pc == True, 1))).label('pc_count')
             )
+            .join(UserAgent, APILog.user_agent_id == UserAgent.id)
             .filter(APILog.bot_id == bot_id)
             .first()
         )
 
         # Top 10 endpoints called
         top_10_endpoints = (
-            query.with_entities(APILog.path, func.count(APILog.path).label('count'))
+            query.with_entities(ENDPOINT.label('path'), func.count(ENDPOINT).label('count'))
             .filter(APILog.bot_id == bot_id)
-            .group_by(APILog.path)
-            .order_by(func.count(APILog.path).desc())
+            .group_by(ENDPOINT)
+            .order_by(func.count(ENDPOINT).desc())
             .limit(10)
             .all()
         )
@@ -215,6 +329,59 @@ def get_bot_logs_stats_data(
 
     return {'bot_stats': bot_stats}
 
+def query_param_conditions(db: Session, query_params: Dict[str, str]):
+    """Conditions matching logs whose query string has every key=value in `query_params`."""
+    if db.get_bind().dialect.name == "postgresql":
+        # A single containment test, answered from the GIN index
+        return [type_coerce(APILog.query_params, JSONB).contains(query_params)]
+    return [APILog.query_params[key].as_string() == value for key, value in query_params.items()]
+
+def has_search_filters(search_params: Optional[APILogSearch], q: Optional[str] = None) -> bool:
+    return bool(q) or bool(search_params and any(value for value in search_params.dict().values()))
+
+# Columns searched by the free-text `q`. Substring matches on them are served by trigram GIN indexes
+# on PostgreSQL and by the apilog_search FTS5 trigram table on SQLite (see app.models.apilog).
+SEARCH_COLUMNS = ("path", "user_agent", "ip_address")
+APILOG_SEARCH = table("apilog_search", column("rowid"), *(column(name) for name in SEARCH_COLUMNS))
+APILOG_SEARCH_KEY = table("apilog_search_key", column("search_rowid"), column("log_id"))
+
+def contains_condition(db: Session, columns: Iterable[str], term: str, prefix: bool = False):
+    """Logs where any of `columns` contains `term` (starts with it if `prefix`), ignoring case."""
+    escaped = escape_like(term)
+    pattern = f"{escaped}%" if prefix else f"%{escaped}%"
+    # Patterns with an ESCAPE clause are not handed to the FTS5 index, so only add one when needed
+    escape = "\\" if escaped != term else None
+    if db.get_bind().dialect.name == "sqlite":
+        # SQLite's LIKE already ignores case; lower() on both sides, as ilike renders it, would bypass the index
+        matches = [
+            select(APILOG_SEARCH.c.rowid).where(APILOG_SEARCH.c[name].like(pattern, escape=escape)) for name in columns
+        ]
+        search_rowids = union(*matches) if len(matches) > 1 else matches[0]
+        return APILog.id.in_(
+            select(APILOG_SEARCH_KEY.c.log_id).where(APILOG_SEARCH_KEY.c.search_rowid.in_(search_rowids))
+        )
+    return or_(*(getattr(APILog, name).ilike(pattern, escape=escape) for name in columns))
+
+def search_conditions(db: Session, search_params: Optional[APILogSearch], q: Optional[str] = None) -> list:
+    """Conditions for the log explorer's search fields and free-text `q`, shared by the listing and the stats."""
+    conditions = []
+    if search_params:
+        if search_params.path:
+            conditions.append(contains_condition(db, ["path"], search_params.path, prefix=True))
+        if search_params.ip_address:
+            conditions.append(contains_condition(db, ["ip_address"], search_params.ip_address, prefix=True))
+        if search_params.user_agent:
+            conditions.append(contains_condition(db, ["user_agent"], search_params.user_agent))
+        if search_params.location:
+            conditions.append(APILog.location.ilike(f"{escape_like(search_params.location)}%", escape="\\"))
+        if search_params.response_code:
+            conditions.append(APILog.response_code == search_params.response_code)
+        if search_params.query_params:
+            conditions.extend(query_param_conditions(db, search_params.query_params))
+    if q:
+        conditions.append(contains_condition(db, SEARCH_COLUMNS, q))
+    return conditions
+
 def coalesce_to_other(column):
     return func.coalesce(column, 'Other')
 
@@ -225,7 +392,8 @@ def get_counts_data(
     search_params = None,
     start_datetime: Optional[datetime] = None,
     end_datetime: Optional[datetime] = None,
-    bots_only: bool = False  # Add this parameter
+    bots_only: bool = False,  # Add this parameter
+    use_rollups: bool = True,
 ):
     query = db.query(APILog)
     
@@ -236,54 +404,92 @@ def get_counts_data(
     if end_datetime:
         query = query.filter(APILog.created_at <= end_datetime)
 
-    if search_params:
-        if search_params.path:
-            query = query.filter(APILog.path.ilike(f'{search_params.path}%'))
-        if search_params.ip_address:
-            query = query.filter(APILog.ip_address.ilike(f'{search_params.ip_address}%'))
-        if search_params.user_agent:
-            query = query.filter(APILog.user_agent.ilike(f'%{search_params.user_agent}%'))
-        if search_params.location:
-            query = query.filter(APILog.location.ilike(f'{search_params.location}%'))
-        if search_params.response_code:
-            query = query.filter(APILog.response_code == search_params.response_code)
+    # Without search filters the whole days of the window are counted from the daily
+    # dimension rollup. Only the partial days at either end and the logs ingested after
+    # its watermark are read from the raw rows.
+    rollup_days = None
+    if use_rollups and not has_search_filters(search_params) and (watermark := current_watermark(db)):
+        first_day = start_datetime and bucket_start(start_datetime, "day")
+        if first_day and first_day < start_datetime:
+            first_day += timedelta(days=1)
+        end_day = end_datetime and bucket_start(end_datetime, "day")
+        if not (first_day and end_day and first_day >= end_day):
+            raw_conditions = [APILog.created > watermark]
+            if first_day:
+                raw_conditions.append(APILog.created_at < first_day)
+            if end_day:
+                raw_conditions.append(APILog.created_at >= end_day)
+            query = query.filter(or_(*raw_conditions))
+            rollup_days = (first_day, end_day)
+
+    query = query.filter(*search_conditions(db, search_params))
 
     if bots_only:
-        query = query.filter(APILog.is_bot == True)  # Add the bots_only filter
+        query = query.filter(APILog.user_agent_id.in_(bot_user_agent_ids()))  # Add the bots_only filter
 
-    browser_family_counts = (
-        query.with_entities(
-            coalesce_to_other(APILog.user_agent_browser_family).label('browser_family'),
-            func.count(APILog.user_agent_browser_family)
-        )
-        .filter(APILog.is_bot == False)
-        .group_by('browser_family')
+    # Group on the dimension id once and attach the labels afterwards
+    user_agent_id_counts = Counter(dict(
+        query.with_entities(APILog.user_agent_id, func.count())
+        .group_by(APILog.user_agent_id)
         .all()
-    )
-    
-    os_family_counts = (
+    ))
+    response_code_counts = Counter(dict(
         query.with_entities(
-            coalesce_to_other(APILog.user_agent_os_family).label('os_family'),
-            func.count(APILog.user_agent_os_family)
-        )
-        .filter(APILog.is_bot == False)
-        .group_by('os_family')
-        .all()
-    )
-
-    # User agent counts (Get top 10 and add others)
-    user_agent_counts = (
-        query.with_entities(
-            coalesce_to_other(APILog.user_agent).label('user_agent'),
-            func.count(APILog.user_agent)
+            APILog.response_code.label('response_code'),
+            func.count(APILog.response_code)
         )
-        .filter(APILog.is_bot == False)
-        .group_by('user_agent')
-        .order_by(func.count(APILog.user_agent).desc())
+        .group_by('response_code')
         .all()
+    ))
+    # Logs moved to the archive are read from its Parquet files, for the same part of the window as the raw rows
+    archive_ranges = [(start_datetime, end_datetime)]
+    if rollup_days:
+        for dimension, value, count in dimension_totals(db, project_id, *rollup_days, bots_only):
+            if dimension == "user_agent":
+                user_agent_id_counts[uuid.UUID(value) if value else None] += count
+            elif dimension == "response_code" and value:
+                response_code_counts[int(value)] += count
+        first_day, end_day = rollup_days
+        archive_ranges = [(end_day, end_datetime)] if end_day else []
+        if first_day and first_day > start_datetime:
+            archive_ranges.append((start_datetime, first_day - timedelta(microseconds=1)))
+    archived_user_agents, archived_response_codes = archive_counts(
+        db, project_id, archive_ranges, search_params, bots_only
     )
+    user_agent_id_counts.update(archived_user_agents)
+    response_code_counts.update(archived_response_codes)
+    user_agents = get_user_agents(db, user_agent_id_counts)
+
+    browser_family_counts = Counter()
+    os_family_counts = Counter()
+    user_agent_counts = Counter()
+    bot_browser_family_counts = Counter()
+    device_type_counts = {"Phone": 0, "Tablet": 0, "PC": 0, "Bot": 0, "Other": 0}
+    for ua_id, count in user_agent_id_counts.items():
+        labels = user_agent_labels(user_agents.get(ua_id))
+        browser_family = labels["user_agent_browser_family"]
+        os_family = labels["user_agent_os_family"]
+        # Same semantics as count(column) grouped by coalesce(column, 'Other')
+        if labels["is_bot"] == False:
+            browser_family_counts[browser_family or 'Other'] += count if browser_family is not None else 0
+            os_family_counts[os_family or 'Other'] += count if os_family is not None else 0
+            user_agent_counts[user_agents[ua_id].user_agent] += count
+        elif labels["is_bot"] == True:
+            bot_browser_family_counts[browser_family or 'Other'] += count if browser_family is not None else 0
+
+        if labels["is_mobile"]:
+            device_type_counts["Phone"] += count
+        if labels["is_tablet"]:
+            device_type_counts["Tablet"] += count
+        if labels["is_pc"]:
+            device_type_counts["PC"] += count
+        if labels["is_bot"]:
+            device_type_counts["Bot"] += count
+        if not (labels["is_mobile"] and labels["is_tablet"] and labels["is_pc"] and labels["is_bot"]):
+            device_type_counts["Other"] += count
 
     # Process the user agent counts to get top 10 and aggregate others
+    user_agent_counts = user_agent_counts.most_common()
     top_15_user_agents = user_agent_counts[:10]
     others_count = sum(count for _, count in user_agent_counts[10:])
     if others_count > 0:
@@ -291,55 +497,10 @@ def get_counts_data(
 
     top_15_user_agent_counts = dict(top_15_user_agents)
 
-    response_code_counts = (
-        query.with_entities(
-            APILog.response_code.label('response_code'),
-            func.count(APILog.response_code)
-        )
-        .group_by('response_code')
-        .all()
-    )
-    response_code_counts = dict(response_code_counts)
     response_code_counts_keyed = dict()
     for key, value in response_code_counts.items():
         response_code_counts_keyed[f"{key} ({get_response_code_text(key)})"] = value
 
-    phone_count = query.filter(APILog.is_mobile == True).count()
-    tablet_count = query.filter(APILog.is_tablet == True).count()
-    pc_count = query.filter(APILog.is_pc == True).count()
-    bot_count = query.filter(APILog.is_bot == True).count()
-    other_count = query.filter(
-        or_(
-            APILog.is_mobile == False,
-            APILog.is_mobile == None,
-            APILog.is_tablet == False,
-            APILog.is_tablet == None,
-            APILog.is_pc == False,
-            APILog.is_pc == None,
-            APILog.is_bot == False,
-            APILog.is_bot == None
-        )
-    ).count()
-
-    device_type_counts = {
-        "Phone": phone_count,
-        "Tablet": tablet_count,
-        "PC": pc_count,
-        "Bot": bot_count,
-        "Other": other_count
-    }
-
-    # get the Browser Family counts where is_bot is True
-    bot_browser_family_counts = (
-        query.with_entities(
-            coalesce_to_other(APILog.user_agent_browser_family).label('browser_family'),
-            func.count(APILog.user_agent_browser_family)
-        )
-        .group_by('browser_family')
-        .filter(APILog.is_bot == True)
-        .all()
-    )
-
     return {
         "browser_family_counts": dict(browser_family_counts),
         "os_family_counts": dict(os_family_counts),
@@ -350,6 +511,73 @@ def get_counts_data(
     }
 
 
+# Sort keys of the log explorer. Pages are ordered by (sort key, id) so a cursor can resume after any row.
+SORT_COLUMNS = {
+    "created_at": APILog.created_at,
+    "response_time": APILog.response_time,
+    "response_code": APILog.response_code,
+    "path": APILog.path,
+    "ip_address": APILog.ip_address,
+    "user_agent": APILog.user_agent,
+}
+
+def encode_cursor(sort: str, direction: str, value, log_id: uuid.UUID) -> str:
+    """Opaque cursor pointing after the row with sort key `value` and id `log_id`."""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort, direction, value, str(log_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str, direction: str):
+    try:
+        cursor_sort, cursor_direction, value, log_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        # Anything else would only fail once bound into the query, as a server error
+        if not isinstance(log_id, str) or isinstance(value, (bool, list, dict)):
+            raise ValueError(cursor)
+        log_id = uuid.UUID(log_id)
+        if sort == "created_at":
+            value = datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if (cursor_sort, cursor_direction) != (sort, direction):
+        raise HTTPException(status_code=400, detail="Cursor was issued for a different sort order")
+    return value, log_id
+
+def after_cursor(sort: str, descending: bool, value, log_id: uuid.UUID):
+    """Condition for the rows after (value, log_id) in (sort key, id) order, NULL sort keys last."""
+    column = SORT_COLUMNS[sort]
+    after = (lambda left, right: left < right) if descending else (lambda left, right: left > right)
+    if not APILog.__table__.c[sort].nullable:
+        # Row comparison, which can be served by an index on the sort key
+        return after(tuple_(column, APILog.id), tuple_(literal(value, column.type), literal(log_id, APILog.id.type)))
+    if value is None:
+        return and_(column.is_(None), after(APILog.id, log_id))
+    return or_(after(column, value), and_(column == value, after(APILog.id, log_id)), column.is_(None))
+
+COUNT_MODES = ("exact", "estimated", "capped", "auto")
+
+def count_rows(db: Session, query, count_mode: str):
+    """
+    (total, kind) for the rows of `query`. kind is "exact", "estimated" (the
+    planner's row estimate) or "capped" (at least `total` rows, counting
+    stopped at LOG_COUNT_CAP). Without a planner estimate (not PostgreSQL)
+    "estimated" and "auto" count up to the cap instead.
+    """
+    if count_mode not in COUNT_MODES:
+        raise HTTPException(status_code=400, detail=f"count_mode must be one of {', '.join(COUNT_MODES)}")
+    if count_mode in ("estimated", "auto"):
+        estimate = planner_row_estimate(db, query)
+        if estimate is None:
+            count_mode = "capped"
+        elif count_mode == "estimated" or estimate > LOG_COUNT_EXACT_THRESHOLD:
+            return estimate, "estimated"
+        else:
+            count_mode = "exact"
+    if count_mode == "capped":
+        total = db.execute(select(func.count()).select_from(query.limit(LOG_COUNT_CAP + 1).subquery())).scalar()
+        return (LOG_COUNT_CAP, "capped") if total > LOG_COUNT_CAP else (total, "exact")
+    return db.execute(select(func.count()).select_from(query.subquery())).scalar(), "exact"
+
 def get_apilogs(
     db: Session,
     user_id: uuid.UUID,
@@ -362,8 +590,19 @@ def get_apilogs(
     sort_direction: Optional[str] = None,
     start_datetime: Optional[datetime] = None,
     end_datetime: Optional[datetime] = None,
-    bots_only: bool = False  # Add this parameter
+    bots_only: bool = False,  # Add this parameter
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    count_mode: str = LOG_COUNT_MODE,
 ):
+    """
+    One page of logs, newest first unless sorted otherwise. Pass the returned
+    `next_cursor` back as `cursor` for the next page: it seeks past the last
+    row instead of skipping `(page - 1) * limit` rows, so every page costs
+    the same. `page` is ignored when a cursor is given. `total` is counted
+    as `count_mode` says (see count_rows) and `total_kind` tells which kind
+    it is; with `include_total` off both are None.
+    """
     offset = (page - 1) * limit
     
     if project_id:
@@ -376,65 +615,36 @@ def get_apilogs(
     if end_datetime:
         query = query.where(APILog.created_at <= end_datetime)
 
-    if search_params:
-        if search_params.path:
-            query = query.where(APILog.path.ilike(f'{search_params.path}%'))
-        if search_params.ip_address:
-            query = query.where(APILog.ip_address.ilike(f'{search_params.ip_address}%'))
-        if search_params.user_agent:
-            query = query.where(APILog.user_agent.ilike(f'%{search_params.user_agent}%'))
-        if search_params.location:
-            query = query.where(APILog.location.ilike(f'{search_params.location}%'))
-        if search_params.response_code:
-            query = query.where(APILog.response_code == search_params.response_code)
-
-    if q:
-        query = query.filter(
-            or_(
-                APILog.path.ilike(f'%{q}%'),
-                APILog.user_agent.ilike(f'%{q}%'),
-                APILog.ip_address.ilike(f'%{q}%'),
-            )
-        )
+    query = query.where(*search_conditions(db, search_params, q))
 
     if bots_only:
-        query = query.where(APILog.is_bot == True)  # Add the bots_only filter
-
-    total_query = select(func.count()).select_from(query.subquery())
-    total = db.execute(total_query).scalar()
-
-    if sort:
-        if sort == 'path':
-            query = query.order_by(APILog.path.asc() if sort_direction == 'asc' else APILog.path.desc())
-        elif sort == 'user_agent':
-            query = query.order_by(APILog.user_agent.asc() if sort_direction == 'asc' else APILog.user_agent.desc())
-        elif sort == 'ip_address':
-            query = query.order_by(APILog.ip_address.asc() if sort_direction == 'asc' else APILog.ip_address.desc())
-        elif sort == 'response_code':
-            query = query.order_by(APILog.response_code.asc() if sort_direction == 'asc' else APILog.response_code.desc())
-        elif sort == 'response_time':
-            query = query.order_by(APILog.response_time.asc() if sort_direction == 'asc' else APILog.response_time.desc())
-        elif sort == 'created_at':
-            query = query.order_by(APILog.created_at.asc() if sort_direction == 'asc' else APILog.created_at.desc())
-        else:
-            query = query.order_by(APILog.created_at.desc())
+        query = query.where(APILog.user_agent_id.in_(bot_user_agent_ids()))  # Add the bots_only filter
+
+    total, total_kind = count_rows(db, query, count_mode) if include_total else (None, None)
+
+    # Unknown sort keys fall back to newest first
+    if sort not in SORT_COLUMNS:
+        sort, sort_direction = "created_at", "desc"
+    direction = "asc" if sort_direction == "asc" else "desc"
+    descending = direction == "desc"
+    column = SORT_COLUMNS[sort]
+    order = column.desc() if descending else column.asc()
+    if APILog.__table__.c[sort].nullable:
+        order = order.nulls_last()
+    query = query.order_by(order, APILog.id.desc() if descending else APILog.id.asc())
+
+    if cursor:
+        query = query.where(after_cursor(sort, descending, *decode_cursor(cursor, sort, direction)))
     else:
-        query = query.order_by(APILog.created_at.desc())
-
-    query = query.offset(offset).limit(limit)
-
-    results = db.execute(query).scalars().all()
+        query = query.offset(offset)
+    # One extra row tells whether there is a next page
+    results = db.execute(query.limit(limit + 1)).scalars().all()
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = encode_cursor(sort, direction, getattr(results[-1], sort), results[-1].id)
     
-    log_ids = [log.id for log in results]
-    query_params = db.execute(
-        select(APILogQueryParam).where(APILogQueryParam.api_log_id.in_(log_ids))
-    ).scalars().all()
-    
-    params_by_log_id = {}
-    for param in query_params:
-        if param.api_log_id not in params_by_log_id:
-            params_by_log_id[param.api_log_id] = []
-        params_by_log_id[param.api_log_id].append(param)
+    user_agents = get_user_agents(db, (log.user_agent_id for log in results))
 
     logs_with_params = []
     for log in results:
@@ -442,7 +652,8 @@ def get_apilogs(
         # response_time to 5 decimal places
         if log_dict["response_time"]:
             log_dict["response_time"] = round(log_dict["response_time"], 5)
-        log_dict["query_params"] = params_by_log_id.get(log.id, [])
+        log_dict["query_params"] = [{"key": key, "value": value} for key, value in (log.query_params or {}).items()]
+        log_dict.update(user_agent_labels(user_agents.get(log.user_agent_id)))
 
         if log.bot_id:
             log_dict["bot_id"] = log.bot_id
@@ -451,7 +662,7 @@ def get_apilogs(
 
         logs_with_params.append(log_dict)
     
-    return {"logs": logs_with_params, "total": total}
+    return {"logs": logs_with_params, "total": total, "total_kind": total_kind, "next_cursor": next_cursor}
 
 
 def get_apilogs_stats(
@@ -463,22 +674,20 @@ def get_apilogs_stats(
     q: Optional[str] = None, 
     start_datetime: Optional[datetime] = None, 
     end_datetime: Optional[datetime] = None,
-    bots_only: bool = False  # Add this parameter
+    bots_only: bool = False,  # Add this parameter
+    use_rollups: bool = True,
 ):
     end_date = end_datetime if end_datetime else datetime.now()
 
     if frequency == "minute":
         start_date = start_datetime if start_datetime else end_date - timedelta(hours=1)
         period_fmt = '%Y-%m-%d %H:%M'
-        date_trunc = func.date_trunc('minute', APILog.created_at)
     elif frequency == "day":
         start_date = start_datetime if start_datetime else end_date - timedelta(days=30)
         period_fmt = '%Y-%m-%d'
-        date_trunc = func.date_trunc('day', APILog.created_at)
     else:  # Default to hourly data
         start_date = start_datetime if start_datetime else end_date - timedelta(hours=24)
         period_fmt = '%Y-%m-%d %H'
-        date_trunc = func.date_trunc('hour', APILog.created_at)
 
     query = db.query(APILog)
     if project_id:
@@ -488,29 +697,26 @@ def get_apilogs_stats(
 
     query = query.filter(APILog.created_at >= start_date).filter(APILog.created_at <= end_date)
 
-    if search_params:
-        if search_params.path:
-            query = query.filter(APILog.path.ilike(f'{search_params.path}%'))
-        if search_params.ip_address:
-            query = query.filter(APILog.ip_address.ilike(f'{search_params.ip_address}%'))
-        if search_params.user_agent:
-            query = query.filter(APILog.user_agent.ilike(f'%{search_params.user_agent}%'))
-        if search_params.location:
-            query = query.filter(APILog.location.ilike(f'{search_params.location}%'))
-        if search_params.response_code:
-            query = query.filter(APILog.response_code == search_params.response_code)
-
-    if q:
-        query = query.filter(
-            or_(
-                APILog.path.ilike(f'%{q}%'),
-                APILog.user_agent.ilike(f'%{q}%'),
-                APILog.ip_address.ilike(f'%{q}%'),
-            )
-        )
+    # Without search filters the rollup of the chart's granularity answers for the buckets
+    # lying wholly inside the window, for every log ingested up to its watermark. The
+    # partial buckets at either end and the newer tail are read from the raw rows.
+    # Filtered charts need the raw rows, so they only cover what retention still keeps.
+    granularity = frequency if frequency in ("minute", "day") else "hour"
+    date_trunc = bucket_expression(APILog.created_at, granularity, db.get_bind().dialect.name)
+    rollup_buckets = None
+    if use_rollups and project_id and not has_search_filters(search_params, q) \
+            and (watermark := current_watermark(db)):
+        first_bucket, end_bucket = full_buckets(start_date, end_date, granularity)
+        if first_bucket < end_bucket:
+            query = query.filter(or_(
+                APILog.created > watermark, APILog.created_at < first_bucket, APILog.created_at >= end_bucket,
+            ))
+            rollup_buckets = (first_bucket, end_bucket)
+
+    query = query.filter(*search_conditions(db, search_params, q))
 
     if bots_only:
-        query = query.filter(APILog.is_bot == True)  # Add the bots_only filter
+        query = query.filter(APILog.user_agent_id.in_(bot_user_agent_ids()))  # Add the bots_only filter
 
     stats_query = (
         query.with_entities(
@@ -519,13 +725,33 @@ def get_apilogs_stats(
             func.count(case((APILog.response_code.between(300, 399), 1), else_=None)).label('3xx_count'),
             func.count(case((APILog.response_code.between(400, 499), 1), else_=None)).label('4xx_count'),
             func.count(case((APILog.response_code.between(500, 599), 1), else_=None)).label('5xx_count'),
-            func.coalesce(func.avg(APILog.response_time), 0).label('avg_response_time')
+            func.coalesce(func.sum(APILog.response_time), 0).label('response_time_sum'),
+            func.count(APILog.response_time).label('response_time_count'),
         )
         .group_by(date_trunc)
         .order_by(date_trunc)
     )
     
-    results = stats_query.all()
+    # period -> [2xx, 3xx, 4xx, 5xx, response time sum, response time count]
+    totals = {}
+    results = [(result[0], result[1:]) for result in stats_query.all()]
+    # Rolled-up periods moved to the archive are read from its Parquet files, for the
+    # same part of the window as the raw rows
+    archive_ranges = [(start_date, end_date)]
+    if rollup_buckets:
+        results += rollup_totals(db, granularity, project_id, *rollup_buckets, bots_only).items()
+        first_bucket, end_bucket = rollup_buckets
+        archive_ranges = [(end_bucket, end_date)]
+        if first_bucket > start_date:
+            archive_ranges.append((start_date, first_bucket - timedelta(microseconds=1)))
+    if project_id:
+        results += archive_stats(
+            db, project_id, granularity, archive_ranges, search_params, q, bots_only
+        ).items()
+    for period, values in results:
+        period_totals = totals.setdefault(period.strftime(period_fmt), [0] * 6)
+        for i, value in enumerate(values):
+            period_totals[i] += value or 0
     
     full_periods = []
     current_period = start_date
@@ -538,7 +764,7 @@ def get_apilogs_stats(
         else:
             current_period += timedelta(hours=1)
     
-    counts = {result[0].strftime(period_fmt): {"2xx_count": result[1], "3xx_count": result[2], "4xx_count": result[3], "5xx_count": result[4], "avg_response_time": result[5]} for result in results}
+    counts = {period: {"2xx_count": t[0], "3xx_count": t[1], "4xx_count": t[2], "5xx_count": t[3], "avg_response_time": t[4] / t[5] if t[5] else 0} for period, t in totals.items()}
     full_results = [{"period": period, "2xx_count": counts.get(period, {}).get("2xx_count", 0), "3xx_count": counts.get(period, {}).get("3xx_count", 0), "4xx_count": counts.get(period, {}).get("4xx_count", 0), "5xx_count": counts.get(period, {}).get("5xx_count", 0), "avg_response_time": counts.get(period, {}).get("avg_response_time", 0)} for period in full_periods]
     
     return full_results
@@ -548,11 +774,11 @@ def get_events(session: Session, type_filter: str, offset: int = 0, limit: int =
     # Subqueries to get the first occurrence of each new endpoint or bot
     subquery_endpoints = (
         session.query(
-            APILog.path,
+            ENDPOINT.label("path"),
             func.min(APILog.created).label("first_seen")
         )
         .filter(APILog.response_code.between(200, 299))
-        .group_by(APILog.path)
+        .group_by(ENDPOINT)
         .subquery()
     )
 
@@ -572,7 +798,7 @@ def get_events(session: Session, type_filter: str, offset: int = 0, limit: int =
         events_query = events_query.filter(
             exists().where(
                 and_(
-                    APILog.path == subquery_endpoints.c.path,
+                    ENDPOINT == subquery_endpoints.c.path,
                     APILog.created == subquery_endpoints.c.first_seen
                 )
             )
@@ -591,7 +817,7 @@ def get_events(session: Session, type_filter: str, offset: int = 0, limit: int =
             or_(
                 exists().where(
                     and_(
-                        APILog.path == subquery_endpoints.c.path,
+                        ENDPOINT == subquery_endpoints.c.path,
                         APILog.created == subquery_endpoints.c.first_seen
                     )
                 ),
@@ -613,11 +839,11 @@ def count_events(session: Session, type_filter: str) -> int:
     # Subqueries to get the first occurrence of each new endpoint or bot
     subquery_endpoints = (
         session.query(
-            APILog.path,
+            ENDPOINT.label("path"),
             func.min(APILog.created).label("first_seen")
         )
         .filter(APILog.response_code.between(200, 299))
-        .group_by(APILog.path)
+        .group_by(ENDPOINT)
         .subquery()
     )
 
@@ -637,7 +863,7 @@ def count_events(session: Session, type_filter: str) -> int:
         count_query = count_query.filter(
             exists().where(
                 and_(
-                    APILog.path == subquery_endpoints.c.path,
+                    ENDPOINT == subquery_endpoints.c.path,
                     APILog.created == subquery_endpoints.c.first_seen
                 )
             )
@@ -656,7 +882,7 @@ def count_events(session: Session, type_filter: str) -> int:
             or_(
                 exists().where(
                     and_(
-                        APILog.path == subquery_endpoints.c.path,
+                        ENDPOINT == subquery_endpoints.c.path,
                         APILog.created == subquery_endpoints.c.first_seen
                     )
                 ),
@@ -2,11 +2,15 @@ from sqlmodel import Session
 
 from app.models.botinfo import BotInfo
 from app.schemas.botinfo import BotInfoCreate
+from app.services.invalidation_service import publish_invalidation
+from app.services.user_agent_service import reset_user_agent_cache
 
 
 def create_botinfo(db: Session, botinfo: BotInfoCreate):
     db_botinfo = BotInfo(**botinfo.dict())
     db.add(db_botinfo)
+    publish_invalidation(db, "user_agents")
     db.commit()
     db.refresh(db_botinfo)
+    reset_user_agent_cache()
     return db_botinfo
@@ -8,11 +8,16 @@ from fastapi import HTTPException
 from sqlmodel import Session, select
 
 from app.models.user import User, UserAlertConfig, UserProject
-from app.schemas.user import UserAlertConfigCreate, UserAlertConfigRead, UserCreate
+from app.schemas.user import (UserAlertConfigCreate, UserAlertConfigRead,
+                              UserCreate, UserProjectPathRulesUpdate,
+                              UserProjectRetentionUpdate)
 from app.services.email_service import (
     send_new_user_notification_email,
     send_welcome_email,
 )
+from app.services.invalidation_service import publish_invalidation
+from app.services.path_template_service import (PathTemplater,
+                                                path_templaters)
 
 
 def get_password_hash(password):
@@ -72,6 +77,40 @@ def save_user_project(db: Session, user_id: uuid.UUID, project_name: str):
     return project
 
 
+def update_project_retention(
+    db: Session, user_id: uuid.UUID, project_id: uuid.UUID, retention: UserProjectRetentionUpdate
+):
+    project = db.get(UserProject, project_id)
+    if not project or project.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Project not found")
+    project.raw_retention_days = retention.raw_retention_days
+    project.rollup_retention_days = retention.rollup_retention_days
+    db.add(project)
+    db.commit()
+    db.refresh(project)
+    return project
+
+
+def update_project_path_rules(
+    db: Session, user_id: uuid.UUID, project_id: uuid.UUID, rules: UserProjectPathRulesUpdate
+):
+    project = db.get(UserProject, project_id)
+    if not project or project.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Project not found")
+    path_template_rules = [rule.strip() for rule in rules.path_template_rules if rule.strip()]
+    try:
+        PathTemplater(path_template_rules)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    project.path_template_rules = path_template_rules or None
+    db.add(project)
+    publish_invalidation(db, "path_templates", str(project_id))
+    db.commit()
+    db.refresh(project)
+    path_templaters.invalidate(project_id)
+    return project
+
+
 def create_user_alert_config(
     db: Session, user_id: uuid.UUID, alert_config: UserAlertConfigCreate
 ) -> UserAlertConfig:
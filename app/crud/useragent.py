@@ -0,0 +1,52 @@
+import uuid
+from typing import Dict, Iterable
+
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import USER_AGENT_ID_CACHE_SIZE
+from app.database import insert_ignore
+from app.models.useragent import USER_AGENT_LABELS, UserAgent
+from app.services.cache_service import MISSING, TTLCache
+from app.services.metrics_service import register_metrics
+
+# Ids of UserAgent rows known to be committed; entries never expire
+known_user_agent_ids = TTLCache(maxsize=USER_AGENT_ID_CACHE_SIZE, ttl=float("inf"))
+register_metrics("user_agent_id_cache", known_user_agent_ids.stats)
+
+
+async def ensure_user_agents(db: AsyncSession, user_agents: Dict[uuid.UUID, dict]):
+    """
+    Insert the dimension rows for `user_agents` (id -> row) that are not known
+    to exist yet. Runs inside the caller's transaction; call
+    `mark_user_agents_known` once it has committed.
+    """
+    missing = [row for ua_id, row in user_agents.items() if known_user_agent_ids.get(ua_id) is MISSING]
+    if missing:
+        await db.execute(insert_ignore(UserAgent.__table__, db.bind.dialect.name), missing)
+
+
+def mark_user_agents_known(ids: Iterable[uuid.UUID]):
+    for ua_id in ids:
+        known_user_agent_ids.set(ua_id, True)
+
+
+def get_user_agents(db: Session, ids: Iterable[uuid.UUID], chunk_size: int = 1000) -> Dict[uuid.UUID, UserAgent]:
+    ids = [ua_id for ua_id in set(ids) if ua_id]
+    user_agents = {}
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        for user_agent in db.exec(select(UserAgent).where(UserAgent.id.in_(chunk))):
+            user_agents[user_agent.id] = user_agent
+    return user_agents
+
+
+def user_agent_labels(user_agent: UserAgent) -> dict:
+    if user_agent is None:
+        return {label: None for label in USER_AGENT_LABELS}
+    return {label: getattr(user_agent, label) for label in USER_AGENT_LABELS}
+
+
+def bot_user_agent_ids():
+    """Subquery of UserAgent ids flagged as bots, for `APILog.user_agent_id.in_(...)` filters."""
+    return select(UserAgent.id).where(UserAgent.is_bot == True)
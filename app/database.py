@@ -1,12 +1,74 @@
+from typing import Optional
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql.expression import ClauseElement, Executable
 from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.config import DATABASE_URL
+from app.config import ASYNC_DATABASE_URL, DATABASE_URL
 
 engine = create_engine(DATABASE_URL)
 
+# Used by the ingestion path so DB round trips do not block the event loop. Created on
+# first use (main_api creates it at startup), so the dashboard never needs an async driver.
+_async_engine = None
+_async_session_maker = None
+
+def get_async_engine():
+    global _async_engine, _async_session_maker
+    if _async_engine is None:
+        _async_engine = create_async_engine(ASYNC_DATABASE_URL)
+        _async_session_maker = sessionmaker(_async_engine, class_=AsyncSession, expire_on_commit=False)
+    return _async_engine
+
+def async_session_maker() -> AsyncSession:
+    get_async_engine()
+    return _async_session_maker()
+
 def get_session():
     with Session(engine) as session:
         yield session
 
+async def get_async_session():
+    async with async_session_maker() as session:
+        yield session
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+
+def dialect_insert(table, dialect_name: str):
+    """INSERT statement supporting ON CONFLICT clauses on `dialect_name`."""
+    if dialect_name == "postgresql":
+        return postgresql.insert(table)
+    if dialect_name == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"ON CONFLICT is not supported on {dialect_name}")
+
+def insert_ignore(table, dialect_name: str):
+    """INSERT statement that skips rows whose key already exists (ON CONFLICT DO NOTHING)."""
+    return dialect_insert(table, dialect_name).on_conflict_do_nothing()
+
+def escape_like(value: str) -> str:
+    """`value` with the LIKE wildcards escaped by a backslash, to be matched literally."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) of a statement, PostgreSQL only."""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(Explain, "postgresql")
+def compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+def planner_row_estimate(session: Session, statement) -> Optional[int]:
+    """Rows the PostgreSQL planner expects `statement` to return, without running it. None on other databases."""
+    if session.get_bind().dialect.name != "postgresql":
+        return None
+    plan = session.execute(Explain(statement)).scalar()
+    return int(plan[0]["Plan"]["Plan Rows"])
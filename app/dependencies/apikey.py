@@ -1,31 +1,46 @@
 from fastapi import Depends, HTTPException, Security
 from fastapi.security.api_key import APIKeyHeader
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.database import get_session
+from app.config import (API_KEY_CACHE_NEGATIVE_TTL, API_KEY_CACHE_SIZE,
+                        API_KEY_CACHE_TTL)
+from app.database import get_async_session
 from app.models.apikey import APIKey
-from app.models.user import User, UserProject
+from app.models.user import UserProject
+from app.services.cache_service import MISSING, TTLCache
+from app.services.invalidation_service import register_invalidation_handler
+from app.services.metrics_service import register_metrics
 
 API_KEY_NAME = "X-API-KEY"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 
-def get_api_key(api_key_header: str = Security(api_key_header), session: Session = Depends(get_session)):
+# key -> detached UserProject, or None for keys known to be invalid
+api_key_cache = TTLCache(maxsize=API_KEY_CACHE_SIZE, ttl=API_KEY_CACHE_TTL)
+register_metrics("api_key_cache", api_key_cache.stats)
+# Keys are deleted from the dashboard service, which publishes the invalidation
+register_invalidation_handler("api_key", api_key_cache.invalidate)
+
+async def get_api_key(api_key_header: str = Security(api_key_header), session: AsyncSession = Depends(get_async_session)):
     if api_key_header is None:
         raise HTTPException(
             status_code=403, detail="API key is required"
         )
-    api_key = session.exec(select(APIKey).where(APIKey.key == api_key_header)).first()
-    print("API KEY", api_key)
-    if api_key is None:
-        raise HTTPException(
-            status_code=403, detail="Invalid API key"
-        )
-    user_project = session.exec(select(UserProject).where(UserProject.id == api_key.user_project_id)).first()
-    print("User project", user_project)
+    user_project = api_key_cache.get(api_key_header)
+    if user_project is MISSING:
+        user_project = (await session.exec(
+            select(UserProject)
+            .join(APIKey, APIKey.user_project_id == UserProject.id)
+            .where(APIKey.key == api_key_header)
+        )).first()
+        if user_project is None:
+            api_key_cache.set(api_key_header, None, ttl=API_KEY_CACHE_NEGATIVE_TTL)
+        else:
+            # Detach so a later commit on this session cannot expire the cached copy
+            session.expunge(user_project)
+            api_key_cache.set(api_key_header, user_project)
     if user_project is None:
         raise HTTPException(
-            status_code=403, detail="User project not found"
+            status_code=403, detail="Invalid API key"
         )
-    user = session.exec(select(User).where(User.id == user_project.user_id)).first()
-    print("User", user)
     return user_project
@@ -1,26 +1,82 @@
+import asyncio
 import logging
-import uuid
-from datetime import datetime
+from contextlib import asynccontextmanager
 
-from fastapi import BackgroundTasks, FastAPI, Request
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 
-from app.crud.apilog import create_apilog
-from app.database import get_session
-from app.models.apilog import APILog, APILogQueryParam
+from app.config import (API_TELEMETRY_PROJECT_ID, APILOG_PARTITION_INTERVAL,
+                        APILOG_PARTITIONS_AHEAD, CACHE_INVALIDATION_INTERVAL,
+                        INGEST_BUFFER_ENABLED,
+                        INGEST_FLUSH_INTERVAL, INGEST_MAX_BATCH_SIZE,
+                        INGEST_QUEUE_MAX_SIZE, INGEST_QUEUE_OVERFLOW,
+                        PARTITION_MAINTENANCE_INTERVAL, RATE_LIMIT_ENABLED,
+                        RATE_LIMIT_KEY_BURST, RATE_LIMIT_KEY_RATE,
+                        RATE_LIMIT_MAX_BUCKETS, RATE_LIMIT_PROJECT_BURST,
+                        RATE_LIMIT_PROJECT_RATE, RATE_LIMIT_REDIS_URL)
+from app.database import engine, get_async_engine
 from app.models.botinfo import BotInfo
 from app.models.user import User, UserProject
-from app.routers import apilog
+from app.routers import apilog, metrics
+from app.services.ingest_service import IngestBuffer
+from app.services.invalidation_service import invalidation_loop
+from app.services.metrics_service import register_metrics
+from app.services.partition_service import partition_maintenance_loop
+from app.services.rate_limit_service import create_rate_limiter
+from app.services.telemetry_service import (SelfTelemetryMiddleware,
+                                            start_self_telemetry,
+                                            stop_self_telemetry)
 
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fails at startup rather than on the first log if ASYNC_DATABASE_URL is unusable
+    async_engine = get_async_engine()
+    app.state.ingest_buffer = None
+    if INGEST_BUFFER_ENABLED:
+        app.state.ingest_buffer = IngestBuffer(
+            max_size=INGEST_QUEUE_MAX_SIZE,
+            max_batch_size=INGEST_MAX_BATCH_SIZE,
+            flush_interval=INGEST_FLUSH_INTERVAL,
+            overflow=INGEST_QUEUE_OVERFLOW,
+        )
+        app.state.ingest_buffer.start()
+        register_metrics("ingest_queue", app.state.ingest_buffer.stats)
+    app.state.rate_limiter = None
+    if RATE_LIMIT_ENABLED:
+        app.state.rate_limiter = create_rate_limiter(
+            RATE_LIMIT_REDIS_URL,
+            RATE_LIMIT_MAX_BUCKETS,
+            key_rate=RATE_LIMIT_KEY_RATE,
+            key_burst=RATE_LIMIT_KEY_BURST,
+            project_rate=RATE_LIMIT_PROJECT_RATE,
+            project_burst=RATE_LIMIT_PROJECT_BURST,
+        )
+        register_metrics("rate_limit", app.state.rate_limiter.stats)
+    start_self_telemetry(app, API_TELEMETRY_PROJECT_ID)
+    # Keeps apilog partitions created ahead of the rows that will land in them
+    partition_task = asyncio.create_task(partition_maintenance_loop(
+        engine, APILOG_PARTITION_INTERVAL, APILOG_PARTITIONS_AHEAD, PARTITION_MAINTENANCE_INTERVAL,
+    ))
+    # Drops cached API keys and bots changed through the dashboard
+    invalidation_task = asyncio.create_task(invalidation_loop(engine, CACHE_INVALIDATION_INTERVAL))
+    yield
+    invalidation_task.cancel()
+    partition_task.cancel()
+    await stop_self_telemetry(app)
+    if app.state.ingest_buffer:
+        await app.state.ingest_buffer.stop()
+    await async_engine.dispose()
+
 app = FastAPI(
     title="WhoWhyWhen API",
     description="API for WhoWhyWhen - Supercharge your APIsm",
     version="0.1.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -39,60 +95,7 @@ class IPMiddleware(BaseHTTPMiddleware):
 
 app.add_middleware(IPMiddleware)
 
-class APILogMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = datetime.now()
-        response = await call_next(request)
-        end_time = datetime.now()
-
-        ip_address = request.client.host
-        url = str(request.url)
-        user_agent = request.headers.get("User-Agent")
-        response_code = response.status_code
-        response_time = (end_time - start_time).total_seconds()
-        
-        background_tasks = request.state.background_tasks
-        background_tasks.add_task(
-            self.log_to_db,
-            ip_address,
-            url,
-            user_agent,
-            response_code,
-            response_time,
-        )
-
-        return response
-
-    async def log_to_db(
-        self,
-        ip_address,
-        url,
-        user_agent,
-        response_code,
-        response_time,
-    ):
-        session = next(get_session())
-        project_id = uuid.UUID("20bd946c-a24e-4f92-a3ff-e30c8f36794c")
-
-        apilog = APILog(
-            user_project_id=project_id,
-            url=url,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            response_code=response_code,
-            response_time=response_time,
-        )
-
-        await create_apilog(session, project_id, apilog)
-
-
-app.add_middleware(APILogMiddleware)
-
-@app.middleware("http")
-async def add_background_tasks(request: Request, call_next):
-    request.state.background_tasks = BackgroundTasks()
-    response = await call_next(request)
-    response.background = request.state.background_tasks
-    return response
+app.add_middleware(SelfTelemetryMiddleware)
 
 app.include_router(apilog.router_api, prefix="/api", tags=["apilog"])
+app.include_router(metrics.router, prefix="/api", tags=["metrics"])
@@ -1,20 +1,27 @@
 import asyncio
 import logging
-import uuid
 from contextlib import asynccontextmanager
-from datetime import datetime, timedelta
 
-from fastapi import BackgroundTasks, FastAPI, Request
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from sqlmodel import Session
 from starlette.middleware.base import BaseHTTPMiddleware
-from user_agents import parse
 
-from app.crud.apilog import create_apilog
-from app.database import create_db_and_tables, get_session
-from app.models.apilog import APILog
+from app.config import (ARCHIVE_INTERVAL, ARCHIVE_URI,
+                        DASH_TELEMETRY_PROJECT_ID, RETENTION_INTERVAL,
+                        ROLLUP_INTERVAL)
+from app.crud.apilog import parse_user_agent
+from app.database import create_db_and_tables, engine, get_session
+from app.models.apilog import ensure_sqlite_search
 from app.models.user import User, UserAlertConfig, UserProject
-from app.routers import apikey, apilog, auth, botinfo, event, alert
+from app.routers import apikey, apilog, auth, botinfo, event, alert, metrics
+from app.services.archive_service import archive_loop
 from app.services.monitoring_service import check_services
+from app.services.retention_service import retention_loop
+from app.services.rollup_service import rollup_loop
+from app.services.telemetry_service import (SelfTelemetryMiddleware,
+                                            start_self_telemetry,
+                                            stop_self_telemetry)
 from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
@@ -57,8 +64,22 @@ async def check_alerts():
 async def lifespan(app: FastAPI):
     # create_db_and_tables()  # Ensure this is uncommented if you want to create DB and tables on startup
     # app.state.db = next(get_session())
+    # SQLite databases created before the log search table get it, filled from their logs
+    with engine.begin() as connection:
+        ensure_sqlite_search(connection)
     task = asyncio.create_task(check_alerts())
+    # Rolls up new logs, then removes raw logs and rollups past their retention
+    retention_task = asyncio.create_task(retention_loop(engine, RETENTION_INTERVAL))
+    rollup_task = asyncio.create_task(rollup_loop(engine, ROLLUP_INTERVAL))
+    # Moves cold logs to Parquet files when an archive location is configured
+    archive_task = asyncio.create_task(archive_loop(engine, ARCHIVE_INTERVAL)) if ARCHIVE_URI else None
+    start_self_telemetry(app, DASH_TELEMETRY_PROJECT_ID)
     yield
+    await stop_self_telemetry(app)
+    retention_task.cancel()
+    rollup_task.cancel()
+    if archive_task:
+        archive_task.cancel()
     task.cancel()
     # app.state.db.close()
 
@@ -87,60 +108,7 @@ class IPMiddleware(BaseHTTPMiddleware):
 
 app.add_middleware(IPMiddleware)
 
-class APILogMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = datetime.now()
-        response = await call_next(request)
-        end_time = datetime.now()
-
-        ip_address = request.client.host
-        url = str(request.url)
-        user_agent = request.headers.get("User-Agent")
-        response_code = response.status_code
-        response_time = (end_time - start_time).total_seconds()
-        
-        background_tasks = request.state.background_tasks
-        background_tasks.add_task(
-            self.log_to_db,
-            ip_address,
-            url,
-            user_agent,
-            response_code,
-            response_time,
-        )
-
-        return response
-
-    async def log_to_db(
-        self,
-        ip_address,
-        url,
-        user_agent,
-        response_code,
-        response_time,
-    ):
-        session = next(get_session())
-        project_id = uuid.UUID("6863eb74-b5e8-4253-b7b0-2275e46c678f")
-
-        apilog = APILog(
-            user_project_id=project_id,
-            url=url,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            response_code=response_code,
-            response_time=response_time,
-        )
-
-        await create_apilog(session, project_id, apilog)
-
-app.add_middleware(APILogMiddleware)
-
-@app.middleware("http")
-async def add_background_tasks(request: Request, call_next):
-    request.state.background_tasks = BackgroundTasks()
-    response = await call_next(request)
-    response.background = request.state.background_tasks
-    return response
+app.add_middleware(SelfTelemetryMiddleware)
 
 @app.get("/dashapi/ip-location")
 async def get_ip_location(request: Request):
@@ -148,22 +116,22 @@ async def get_ip_location(request: Request):
     return {"ip": ip}
 
 @app.get("/dashapi/device-details")
-async def get_device_details(request: Request):
+async def get_device_details(request: Request, session: Session = Depends(get_session)):
     user_agent_str = request.headers.get("User-Agent")
     if not user_agent_str:
         return {"error": "User-Agent header not found"}
     
-    user_agent = parse(user_agent_str)
+    user_agent = parse_user_agent(user_agent_str, session)
     device_details = {
-        "browser": user_agent.browser.family,
-        "browser_version": user_agent.browser.version_string,
-        "os": user_agent.os.family,
-        "os_version": user_agent.os.version_string,
-        "device": user_agent.device.family,
-        "is_mobile": user_agent.is_mobile,
-        "is_tablet": user_agent.is_tablet,
-        "is_pc": user_agent.is_pc,
-        "is_bot": user_agent.is_bot,
+        "browser": user_agent.get("user_agent_browser_family"),
+        "browser_version": user_agent.get("user_agent_browser_version"),
+        "os": user_agent.get("user_agent_os_family"),
+        "os_version": user_agent.get("user_agent_os_version"),
+        "device": user_agent.get("user_agent_device_family"),
+        "is_mobile": user_agent.get("is_mobile"),
+        "is_tablet": user_agent.get("is_tablet"),
+        "is_pc": user_agent.get("is_pc"),
+        "is_bot": user_agent.get("is_bot"),
     }
     return device_details
 
@@ -173,3 +141,4 @@ app.include_router(apilog.router_dash, prefix="/dashapi", tags=["apilog"])
 app.include_router(botinfo.router, prefix="/dashapi", tags=["botinfo"])
 app.include_router(event.router_event, prefix="/dashapi", tags=["event"])
 app.include_router(alert.router, prefix="/dashapi", tags=["alert"])
+app.include_router(metrics.router, prefix="/dashapi", tags=["metrics"])
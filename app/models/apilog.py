@@ -1,11 +1,55 @@
 import uuid
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, Optional
 
+from sqlalchemy import DDL, JSON, Column, DateTime, Index, event, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
 from sqlmodel import Field, Relationship, SQLModel
 
 
+class database_now(FunctionElement):
+    """The database's current time as a naive timestamp: the transaction start on PostgreSQL."""
+    type = DateTime()
+    inherit_cache = True
+
+@compiles(database_now)
+def compile_database_now(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+@compiles(database_now, "postgresql")
+def compile_database_now_postgresql(element, compiler, **kw):
+    return "LOCALTIMESTAMP"
+
+@compiles(database_now, "sqlite")
+def compile_database_now_sqlite(element, compiler, **kw):
+    # CURRENT_TIMESTAMP only has whole seconds there
+    return "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
 class APILog(SQLModel, table=True):
+    __table_args__ = (
+        # Serves `query_params @> '{"key": "value"}'` filters
+        Index(
+            "ix_apilog_query_params", "query_params",
+            postgresql_using="gin", postgresql_ops={"query_params": "jsonb_path_ops"},
+        ),
+        # Dashboard queries: one project over a created_at window
+        Index("ix_apilog_project_created_at", "user_project_id", "created_at"),
+        # Lookups by user agent, and the bot backfill's keyset walk over each one's logs
+        Index("ix_apilog_user_agent_created_at", "user_agent_id", "created_at", "id"),
+        # Substring and prefix ILIKE searches (pg_trgm)
+        *(
+            Index(f"ix_apilog_{name}_trgm", name, postgresql_using="gin", postgresql_ops={name: "gin_trgm_ops"})
+            for name in ("path", "user_agent", "ip_address")
+        ),
+        # On PostgreSQL the table is range partitioned by created_at, see partition_service
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    # Fetch the server-set `created` with RETURNING on insert
+    __mapper_args__ = {"eager_defaults": True}
+
     id: Optional[uuid.UUID] = Field(default_factory=uuid.uuid4, primary_key=True)
     user_project_id: Optional[uuid.UUID] = Field(foreign_key="userproject.id")
     url: str
@@ -14,38 +58,111 @@ class APILog(SQLModel, table=True):
     location: Optional[str] = None    
 
     user_agent: str = Field(default="")
-    user_agent_browser_family: Optional[str] = Field(default="")
-    user_agent_browser_version: Optional[str] = Field(default="")
-    user_agent_os_family: Optional[str] = Field(default="")
-    user_agent_os_version: Optional[str] = Field(default="")
-    user_agent_device_family: Optional[str] = Field(default="")
-    user_agent_device_brand: Optional[str] = Field(default="")
-    user_agent_device_model: Optional[str] = Field(default="")
-    is_mobile: Optional[bool] = Field(default=None)
-    is_tablet: Optional[bool] = Field(default=None)
-    is_pc: Optional[bool] = Field(default=None)
-    is_touch_capable: Optional[bool] = Field(default=None)
-    is_bot: Optional[bool] = Field(default=None)
+    # Parsed browser/os/device fields live on the UserAgent dimension
+    user_agent_id: Optional[uuid.UUID] = Field(default=None, foreign_key="useragent.id")
     
     response_code: Optional[int] = Field(default=None)
     response_code_text: Optional[str] = Field(default=None)
     response_time: Optional[float] = Field(default=None)
     
     path: Optional[str] = Field(default=None)
-    query_params: List["APILogQueryParam"] = Relationship(back_populates="api_log")
+    # The endpoint the path belongs to (/users/{id}), see path_template_service
+    path_template: Optional[str] = Field(default=None)
+    # key -> value of the request's query string, JSONB on Postgres; SQL NULL when there is none
+    query_params: Optional[Dict[str, str]] = Field(
+        default=None, sa_column=Column(
+            JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"), nullable=True,
+        ),
+    )
     
-    created: datetime = Field(default_factory=datetime.now)
+    # Ingest time, set by the database at insert: the start of the inserting transaction on
+    # PostgreSQL. Rollups are built incrementally over it, see rollup_service.
+    created: Optional[datetime] = Field(
+        default=None, index=True, sa_column_kwargs={"server_default": database_now(), "nullable": False},
+    )
     
     user_project: "UserProject" = Relationship(back_populates="api_logs")
     botinfo: "BotInfo" = Relationship(back_populates="api_logs")
-    created_at: datetime = Field(default_factory=datetime.now)
+    # Part of the primary key: unique indexes of a partitioned table must include the partition key
+    created_at: datetime = Field(default_factory=datetime.now, primary_key=True)
+    event_id: Optional[str] = Field(default=None)
+
+event.listen(
+    APILog.__table__, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+# Rows no range partition covers go here, so inserts never fail for lack of a partition
+event.listen(
+    APILog.__table__, "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS apilog_default PARTITION OF apilog DEFAULT").execute_if(dialect="postgresql"),
+)
+# SQLite has no trigram indexes: an FTS5 trigram table kept in sync by triggers serves the
+# same substring searches there. It is keyed through apilog_search_key, whose INTEGER PRIMARY
+# KEY survives VACUUM, unlike the implicit rowid of apilog.
+SQLITE_SEARCH_KEY = "(SELECT search_rowid FROM apilog_search_key WHERE log_id = {row}.id)"
+SQLITE_SEARCH_DDL = (
+    "CREATE TABLE IF NOT EXISTS apilog_search_key ("
+    "search_rowid INTEGER PRIMARY KEY, log_id CHAR(32) NOT NULL UNIQUE)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS apilog_search USING fts5("
+    "path, user_agent, ip_address, tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS apilog_search_insert AFTER INSERT ON apilog BEGIN "
+    "INSERT INTO apilog_search_key (log_id) VALUES (new.id); "
+    "INSERT INTO apilog_search (rowid, path, user_agent, ip_address) "
+    f"VALUES ({SQLITE_SEARCH_KEY.format(row='new')}, new.path, new.user_agent, new.ip_address); END",
+    "CREATE TRIGGER IF NOT EXISTS apilog_search_delete AFTER DELETE ON apilog BEGIN "
+    f"DELETE FROM apilog_search WHERE rowid = {SQLITE_SEARCH_KEY.format(row='old')}; "
+    "DELETE FROM apilog_search_key WHERE log_id = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS apilog_search_update AFTER UPDATE OF path, user_agent, ip_address ON apilog BEGIN "
+    "UPDATE apilog_search SET path = new.path, user_agent = new.user_agent, ip_address = new.ip_address "
+    f"WHERE rowid = {SQLITE_SEARCH_KEY.format(row='new')}; END",
+)
+
+
+def ensure_sqlite_search(connection):
+    """
+    Create the apilog_search table and its triggers on SQLite if they are
+    missing, or still in the older layout keyed on apilog's rowid, and fill
+    it from the logs already there. Does nothing on other databases.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    if connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'apilog_search_key'")).first():
+        return
+    for trigger in ("apilog_search_insert", "apilog_search_delete", "apilog_search_update"):
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    connection.execute(text("DROP TABLE IF EXISTS apilog_search"))
+    for statement in SQLITE_SEARCH_DDL:
+        connection.execute(text(statement))
+    connection.execute(text("INSERT INTO apilog_search_key (log_id) SELECT id FROM apilog"))
+    connection.execute(text(
+        "INSERT INTO apilog_search (rowid, path, user_agent, ip_address) "
+        "SELECT k.search_rowid, a.path, a.user_agent, a.ip_address FROM apilog a "
+        "JOIN apilog_search_key k ON k.log_id = a.id"
+    ))
+
+
+@event.listens_for(APILog.__table__, "after_create")
+def create_sqlite_search(target, connection, **kw):
+    ensure_sqlite_search(connection)
+
+
+@event.listens_for(APILog.__table__, "before_drop")
+def drop_sqlite_search(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        connection.execute(text("DROP TABLE IF EXISTS apilog_search"))
+        connection.execute(text("DROP TABLE IF EXISTS apilog_search_key"))
+
+
+class APILogEvent(SQLModel, table=True):
+    """
+    Event ids of saved logs, one row per (project, event_id). Deduplication
+    is enforced here because a unique index on the partitioned apilog table
+    would have to include created_at.
+    """
+    user_project_id: uuid.UUID = Field(primary_key=True, foreign_key="userproject.id")
+    event_id: str = Field(primary_key=True)
+    created: datetime = Field(default_factory=datetime.now, index=True)
 
-class APILogQueryParam(SQLModel, table=True):
-    id: Optional[uuid.UUID] = Field(default_factory=uuid.uuid4, primary_key=True)
-    api_log_id: uuid.UUID = Field(foreign_key="apilog.id")
-    key: str
-    value: str
-    api_log: "APILog" = Relationship(back_populates="query_params")
 
 class APILogNotification(SQLModel, table=True):
     id: Optional[uuid.UUID] = Field(default_factory=uuid.uuid4, primary_key=True)
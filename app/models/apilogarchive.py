@@ -0,0 +1,16 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+
+class APILogArchive(SQLModel, table=True):
+    """A Parquet file holding the logs of one project with created_at in [period_start, period_end)."""
+    id: Optional[uuid.UUID] = Field(default_factory=uuid.uuid4, primary_key=True)
+    user_project_id: uuid.UUID = Field(foreign_key="userproject.id", index=True)
+    period_start: datetime
+    period_end: datetime
+    uri: str  # local path or object store URI of the file
+    rows: int = Field(default=0)
+    created: datetime = Field(default_factory=datetime.now)
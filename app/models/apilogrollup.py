@@ -0,0 +1,53 @@
+import uuid
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+
+
+class APILogRollupBase(SQLModel):
+    """Request counts of one project per time bucket of created_at, split by is_bot."""
+    user_project_id: uuid.UUID = Field(primary_key=True, foreign_key="userproject.id")
+    bucket: datetime = Field(primary_key=True)
+    is_bot: bool = Field(primary_key=True)
+
+    requests: int = Field(default=0)
+    count_2xx: int = Field(default=0)
+    count_3xx: int = Field(default=0)
+    count_4xx: int = Field(default=0)
+    count_5xx: int = Field(default=0)
+    # avg(response_time) = response_time_sum / response_time_count
+    response_time_sum: float = Field(default=0)
+    response_time_count: int = Field(default=0)
+
+
+class APILogMinutely(APILogRollupBase, table=True):
+    pass
+
+
+class APILogHourly(APILogRollupBase, table=True):
+    pass
+
+
+class APILogDaily(APILogRollupBase, table=True):
+    pass
+
+
+class APILogDimensionDaily(SQLModel, table=True):
+    """
+    Request counts of one project per day of created_at and value of a device
+    stats dimension ("user_agent" id or "response_code"), split by is_bot.
+    Labels such as browser or OS family are attached from UserAgent on read.
+    """
+    user_project_id: uuid.UUID = Field(primary_key=True, foreign_key="userproject.id")
+    day: datetime = Field(primary_key=True)
+    dimension: str = Field(primary_key=True)
+    value: str = Field(primary_key=True)  # "" when the log has none
+    is_bot: bool = Field(primary_key=True)
+
+    requests: int = Field(default=0)
+
+
+class RollupWatermark(SQLModel, table=True):
+    """Logs with `created` up to `watermark` are counted in the rollups."""
+    name: str = Field(primary_key=True)
+    watermark: datetime
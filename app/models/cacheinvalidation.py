@@ -0,0 +1,13 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func
+from sqlmodel import Field, SQLModel
+
+
+class CacheInvalidation(SQLModel, table=True):
+    """An entry to drop from a per-worker cache, published by one process for all the others."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    cache: str  # name a handler is registered under
+    key: Optional[str] = Field(default=None)  # None clears the whole cache
+    created: Optional[datetime] = Field(default=None, sa_column_kwargs={"server_default": func.now()})
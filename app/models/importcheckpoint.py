@@ -0,0 +1,13 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+
+class ImportCheckpoint(SQLModel, table=True):
+    """Progress of an offline log import or backfill, committed together with each chunk."""
+    source: str = Field(primary_key=True)  # file path plus a fingerprint of its first bytes
+    lines_done: int = Field(default=0)
+    rows_imported: int = Field(default=0)
+    last_key: Optional[str] = Field(default=None)  # keyset position, for sources not read by line
+    updated: datetime = Field(default_factory=datetime.now)
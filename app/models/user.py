@@ -4,6 +4,7 @@ from datetime import datetime
 from typing import List, Optional
 
 from pydantic import EmailStr
+from sqlalchemy import JSON, Column
 from sqlmodel import Field, Relationship, SQLModel, UniqueConstraint
 
 
@@ -29,6 +30,11 @@ class UserProject(SQLModel, table=True):
     active: bool = Field(default=True)
     is_default: bool = Field(default=False)
     user_id: uuid.UUID = Field(foreign_key="user.id")
+    # Days to keep raw logs and their rollups; None falls back to RAW_RETENTION_DAYS / ROLLUP_RETENTION_DAYS
+    raw_retention_days: Optional[int] = Field(default=None)
+    rollup_retention_days: Optional[int] = Field(default=None)
+    # Path templates such as /repos/{owner}/{repo}, tried in order before the built-in segment patterns
+    path_template_rules: Optional[List[str]] = Field(default=None, sa_column=Column(JSON, nullable=True))
     user: "User" = Relationship(back_populates="projects")
     api_keys: List["APIKey"] = Relationship(back_populates="user_project")
     api_logs: List["APILog"] = Relationship(back_populates="user_project")
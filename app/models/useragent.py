@@ -0,0 +1,50 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+# uuid5 namespace for UserAgent ids. Changing it orphans every existing row.
+USER_AGENT_NAMESPACE = uuid.UUID("6f1c2a8e-3b4d-5e6f-8a9b-0c1d2e3f4a5b")
+
+
+class UserAgent(SQLModel, table=True):
+    """One row per distinct user agent string, referenced by APILog.user_agent_id."""
+    id: uuid.UUID = Field(primary_key=True)  # uuid5(USER_AGENT_NAMESPACE, user_agent)
+    user_agent: str
+
+    user_agent_browser_family: Optional[str] = Field(default="")
+    user_agent_browser_version: Optional[str] = Field(default="")
+    user_agent_os_family: Optional[str] = Field(default="")
+    user_agent_os_version: Optional[str] = Field(default="")
+    user_agent_device_family: Optional[str] = Field(default="")
+    user_agent_device_brand: Optional[str] = Field(default="")
+    user_agent_device_model: Optional[str] = Field(default="")
+    is_mobile: Optional[bool] = Field(default=None)
+    is_tablet: Optional[bool] = Field(default=None)
+    is_pc: Optional[bool] = Field(default=None)
+    is_touch_capable: Optional[bool] = Field(default=None)
+    is_bot: Optional[bool] = Field(default=None)
+
+    created: datetime = Field(default_factory=datetime.now)
+
+
+def user_agent_id(user_agent: str) -> uuid.UUID:
+    return uuid.uuid5(USER_AGENT_NAMESPACE, user_agent)
+
+
+# Columns copied onto log dicts returned by the dashboard API
+USER_AGENT_LABELS = (
+    "user_agent_browser_family",
+    "user_agent_browser_version",
+    "user_agent_os_family",
+    "user_agent_os_version",
+    "user_agent_device_family",
+    "user_agent_device_brand",
+    "user_agent_device_model",
+    "is_mobile",
+    "is_tablet",
+    "is_pc",
+    "is_touch_capable",
+    "is_bot",
+)
@@ -2,17 +2,23 @@ import uuid
 from datetime import datetime, timedelta
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.config import (LOG_COUNT_MODE, STREAM_BATCH_SIZE,
+                        STREAM_MAX_LINE_BYTES, STREAM_MAX_REPORTED_ERRORS)
 from app.crud.apilog import (create_apilog, create_apilog_bulk, get_apilogs,
                              get_apilogs_stats, get_bot_logs_stats_data,
                              get_counts_data)
-from app.database import get_session
+from app.database import get_async_session, get_session
 from app.dependencies.apikey import get_api_key
 from app.dependencies.auth import get_current_user
 from app.models.user import User, UserProject
 from app.schemas.apilog import APILogCreate, APILogSearch
+from app.services.rate_limit_service import (enforce_rate_limit,
+                                             wait_for_rate_limit)
+from app.services.stream_ingest_service import ingest_ndjson
 
 router_api = APIRouter()
 router_dash = APIRouter()
@@ -21,8 +27,10 @@ router_dash = APIRouter()
 @router_api.post("/log", summary="Save a single API log", description="Save a single API log entry.")
 async def save_api_log(
     apilog: APILogCreate, 
+    request: Request,
+    response: Response,
     current_user_project: UserProject = Depends(get_api_key), 
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Save a single API log entry.
@@ -33,23 +41,76 @@ async def save_api_log(
     - **location**: Location of the request (optional).
     - **response_code**: HTTP response code (optional).
     - **response_time**: Response time in seconds (optional).
+    - **event_id**: Idempotency key (optional); a retry with the same id is not saved twice.
+
+    When the ingest queue is enabled the entry is queued and acknowledged with
+    202 Accepted; it is written to the database by the background flusher.
+    Over the key or project rate limit the API answers 429 with Retry-After.
     """
-    return await create_apilog(session, current_user_project.id, apilog)
+    await enforce_rate_limit(request, current_user_project)
+    if ingest_buffer := getattr(request.app.state, "ingest_buffer", None):
+        queued = await ingest_buffer.put(current_user_project.id, apilog)
+        response.status_code = 202
+        return {"status": "accepted" if queued else "dropped"}
+    db_apilog = await create_apilog(session, current_user_project.id, apilog)
+    return db_apilog if db_apilog else {"status": "duplicate"}
 
 
 @router_api.post("/log/bulk", summary="Save multiple API logs", description="Save multiple API log entries in bulk.")
 async def save_api_log_bulk(
     apilogs: List[APILogCreate], 
+    request: Request,
     current_user_project: UserProject = Depends(get_api_key), 
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Save multiple API log entries in bulk.
 
     - **apilogs**: List of API log entries.
+
+    All entries are written in a single transaction. The response is an
+    acknowledgement with the number of saved logs, their ids and the number
+    of entries skipped as duplicate event ids. The rate
+    limit is charged one token per entry.
     """
+    await enforce_rate_limit(request, current_user_project, len(apilogs))
     return await create_apilog_bulk(session, current_user_project.id, apilogs)
 
+
+@router_api.post("/log/stream", summary="Stream API logs as NDJSON", description="Save API log entries from a newline-delimited JSON body, optionally gzip-compressed.")
+async def save_api_log_stream(
+    request: Request,
+    current_user_project: UserProject = Depends(get_api_key),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Save API log entries from an NDJSON body (one log entry per line).
+
+    The body is read incrementally and may be sent chunked; send
+    `Content-Encoding: gzip` for a gzip-compressed body. Valid lines are saved
+    in batches as they arrive, invalid lines are skipped and reported by line
+    number in `errors` (at most STREAM_MAX_REPORTED_ERRORS of them). Over
+    the rate limit the upload is slowed down rather than rejected.
+    """
+    async def flush(apilogs):
+        await wait_for_rate_limit(request, current_user_project, len(apilogs))
+        try:
+            return (await create_apilog_bulk(session, current_user_project.id, apilogs))["count"]
+        except Exception:
+            await session.rollback()
+            raise
+
+    gzipped = request.headers.get("content-encoding", "").lower() == "gzip"
+    result = await ingest_ndjson(
+        request.stream(),
+        flush,
+        gzipped=gzipped,
+        batch_size=STREAM_BATCH_SIZE,
+        max_line_bytes=STREAM_MAX_LINE_BYTES,
+        max_errors=STREAM_MAX_REPORTED_ERRORS,
+    )
+    return result.dict()
+
 @router_dash.post("/logs/project/{project_id}")
 def get_api_logs(
     project_id: uuid.UUID,
@@ -62,10 +123,16 @@ def get_api_logs(
     start_datetime: Optional[datetime] = None,
     end_datetime: Optional[datetime] = None,
     bots_only: bool = False,  # Add this parameter
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    count_mode: str = LOG_COUNT_MODE,
     current_user: User = Depends(get_current_user),
     session: Session = Depends(get_session)
 ):
-    return get_apilogs(session, current_user.id, page, limit, project_id, search_params, query, sort, sort_direction, start_datetime, end_datetime, bots_only)
+    return get_apilogs(
+        session, current_user.id, page, limit, project_id, search_params, query, sort, sort_direction,
+        start_datetime, end_datetime, bots_only, cursor=cursor, include_total=include_total, count_mode=count_mode,
+    )
 
 
 @router_dash.post("/logs/project/stats/{project_id}")
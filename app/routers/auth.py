@@ -1,3 +1,4 @@
+import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -20,12 +21,17 @@ from app.crud.user import (
     get_user_by_email,
     get_user_projects,
     save_user_project,
+    update_project_path_rules,
+    update_project_retention,
 )
 from app.database import get_session
 from app.dependencies.auth import get_current_user, verify_password
 from app.models.apilog import APILog
 from app.models.user import User, UserAlertNotification
-from app.schemas.user import ChangePasswordForm, UserCreate, UserRead, UserStatusRead
+from app.schemas.user import (ChangePasswordForm, UserCreate,
+                              UserProjectPathRulesUpdate,
+                              UserProjectRetentionUpdate, UserRead,
+                              UserStatusRead)
 from app.services.email_service import send_password_reset_email
 from app.services.fa_service import (
     generate_totp_secret,
@@ -307,3 +313,23 @@ def read_user_projects(
     session: Session = Depends(get_session),
 ):
     return get_user_projects(session, current_user.id)
+
+
+@router.put("/users/me/projects/{project_id}/retention")
+def set_project_retention(
+    project_id: uuid.UUID,
+    retention: UserProjectRetentionUpdate,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    return update_project_retention(session, current_user.id, project_id, retention)
+
+
+@router.put("/users/me/projects/{project_id}/path-rules")
+def set_project_path_rules(
+    project_id: uuid.UUID,
+    rules: UserProjectPathRulesUpdate,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    return update_project_path_rules(session, current_user.id, project_id, rules)
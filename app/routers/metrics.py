@@ -0,0 +1,17 @@
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+
+from app.config import METRICS_TOKEN
+from app.services.metrics_service import collect_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", summary="Service metrics", description="In-process cache and queue counters for this worker.")
+def get_metrics(x_metrics_token: Optional[str] = Header(None)):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_metrics_token != METRICS_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid metrics token")
+    return collect_metrics()
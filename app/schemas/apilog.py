@@ -1,8 +1,8 @@
 import uuid
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class APILogCreate(BaseModel):
@@ -13,6 +13,8 @@ class APILogCreate(BaseModel):
     response_code: Optional[int] = None
     response_time: Optional[float] = None
     created_at: Optional[datetime] = None
+    # Idempotency key: entries repeating an event_id already saved for the project are skipped
+    event_id: Optional[str] = Field(default=None, max_length=128)
 
 
 class APILogSearch(BaseModel):
@@ -21,6 +23,7 @@ class APILogSearch(BaseModel):
     user_agent: Optional[str] = None
     location: Optional[str] = None
     response_code: Optional[int] = None
+    query_params: Optional[Dict[str, str]] = None
 
 
 class APILogRead(BaseModel):
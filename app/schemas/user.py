@@ -1,8 +1,8 @@
 import uuid
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
 
 class UserCreate(BaseModel):
@@ -25,6 +25,17 @@ class UserProjectRead(BaseModel):
     active: bool
 
 
+class UserProjectRetentionUpdate(BaseModel):
+    # Days to keep raw logs / hourly and daily rollups; None uses the server default
+    raw_retention_days: Optional[int] = Field(default=None, ge=1)
+    rollup_retention_days: Optional[int] = Field(default=None, ge=1)
+
+
+class UserProjectPathRulesUpdate(BaseModel):
+    # Templates such as /repos/{owner}/{repo}, tried in order; an empty list uses the built-in patterns only
+    path_template_rules: List[str] = Field(default_factory=list)
+
+
 class UserRead(BaseModel):
     id: uuid.UUID
     email: str
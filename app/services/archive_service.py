@@ -0,0 +1,414 @@
+"""
+Archive of cold apilog rows to Parquet files, queried with DuckDB.
+
+archive_logs exports each closed period older than ARCHIVE_AFTER_DAYS to
+compressed Parquet files under ARCHIVE_URI, one file per project. It records
+the files in the apilogarchive catalog and removes the period from apilog.
+On partitioned PostgreSQL tables a period is a partition, dropped whole in
+the transaction that records its files, once its row count matches theirs.
+Otherwise a period is a calendar month: its files are recorded first, then
+exactly the rows they hold are deleted by key, RETENTION_BATCH_SIZE per
+transaction. A run interrupted between the two finishes the deletes on the
+next run. Only periods whose rows are all folded into the rollups are
+archived, so unfiltered charts keep covering them from the rollups.
+
+Filtered stats and device stats reaching into archived periods read the
+catalog's files with DuckDB and add their counts to those of the hot rows.
+Writing needs the optional pyarrow package, reading needs duckdb (see
+requirements-archive.txt). Without duckdb the archived counts are left out.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, insert, or_, select, text, true
+from sqlmodel import Session
+
+from app.config import (ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_URI,
+                        RETENTION_BATCH_SIZE)
+from app.database import escape_like
+from app.models.apilog import APILog
+from app.models.apilogarchive import APILogArchive
+from app.models.user import UserProject
+from app.models.useragent import UserAgent
+from app.services.metrics_service import register_metrics
+from app.services.partition_service import (is_partitioned, list_partitions,
+                                            next_start, partition_start)
+from app.services.retention_service import raw_horizon
+from app.services.rollup_service import read_watermark
+
+logger = logging.getLogger(__name__)
+
+last_run = {}
+register_metrics("archive", lambda: dict(last_run))
+
+# A created_at window [lower, upper]; None leaves that end open
+Range = Tuple[Optional[datetime], Optional[datetime]]
+
+UUID_COLUMNS = ("id", "user_project_id", "bot_id", "user_agent_id")
+SEARCH_COLUMNS = ("path", "user_agent", "ip_address")
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.fs
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Archiving logs to Parquet requires the pyarrow package")
+    return pyarrow
+
+
+def import_duckdb():
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError("Querying archived logs requires the duckdb package")
+    return duckdb
+
+
+@lru_cache(maxsize=None)
+def archive_reader():
+    """The duckdb module, or None with a warning, once, when it is not installed."""
+    try:
+        return import_duckdb()
+    except ImportError as e:
+        logger.warning(f"{e}; archived logs are left out of the stats")
+        return None
+
+
+def parquet_schema(pa):
+    """The apilog columns, with ids as strings and query_params as a JSON string."""
+    return pa.schema([
+        ("id", pa.string()),
+        ("user_project_id", pa.string()),
+        ("url", pa.string()),
+        ("bot_id", pa.string()),
+        ("ip_address", pa.string()),
+        ("location", pa.string()),
+        ("user_agent", pa.string()),
+        ("user_agent_id", pa.string()),
+        ("response_code", pa.int32()),
+        ("response_code_text", pa.string()),
+        ("response_time", pa.float64()),
+        ("path", pa.string()),
+        ("path_template", pa.string()),
+        ("query_params", pa.string()),
+        ("created", pa.timestamp("us")),
+        ("created_at", pa.timestamp("us")),
+        ("event_id", pa.string()),
+    ])
+
+
+def parquet_row(row) -> dict:
+    row = dict(row)
+    for name in UUID_COLUMNS:
+        if row[name] is not None:
+            row[name] = str(row[name])
+    if row["query_params"] is not None:
+        row["query_params"] = json.dumps(row["query_params"])
+    return row
+
+
+def archive_uri(relative_path: str) -> str:
+    if "://" in ARCHIVE_URI:
+        return f"{ARCHIVE_URI.rstrip('/')}/{relative_path}"
+    return os.path.join(os.path.abspath(ARCHIVE_URI), relative_path)
+
+
+def delete_file(uri: str):
+    pa = import_pyarrow()
+    filesystem, path = pa.fs.FileSystem.from_uri(uri)
+    try:
+        filesystem.delete_file(path)
+    except FileNotFoundError:
+        pass
+
+
+def export_logs(engine, project_id: uuid.UUID, start: datetime, end: datetime, watermark: datetime) -> Tuple[str, int]:
+    """
+    Write the logs of `project_id` with created_at in [start, end), ingested
+    up to `watermark`, to a new Parquet file. Returns its URI and row count.
+    """
+    pa = import_pyarrow()
+    uri = archive_uri(f"{project_id}/{start:%Y%m%d}-{end:%Y%m%d}-{uuid.uuid4().hex[:8]}.parquet")
+    filesystem, path = pa.fs.FileSystem.from_uri(uri)
+    filesystem.create_dir(path.rsplit("/", 1)[0])
+    schema = parquet_schema(pa)
+    query = (
+        select(APILog.__table__)
+        .where(APILog.user_project_id == project_id, APILog.created_at >= start, APILog.created_at < end)
+        .where(APILog.created <= watermark)
+        .order_by(APILog.created_at)
+    )
+    rows = 0
+    with engine.connect() as connection, \
+            pa.parquet.ParquetWriter(path, schema, filesystem=filesystem, compression="zstd") as writer:
+        for batch in connection.execution_options(yield_per=ARCHIVE_BATCH_SIZE).execute(query).partitions():
+            writer.write_table(pa.Table.from_pylist([parquet_row(row._mapping) for row in batch], schema=schema))
+            rows += len(batch)
+    return uri, rows
+
+
+def archived_keys(uri: str):
+    """Yield lists of the log ids held by the archive file at `uri`."""
+    pa = import_pyarrow()
+    filesystem, path = pa.fs.FileSystem.from_uri(uri)
+    with filesystem.open_input_file(path) as source:
+        for batch in pa.parquet.ParquetFile(source).iter_batches(batch_size=RETENTION_BATCH_SIZE, columns=["id"]):
+            yield [uuid.UUID(log_id) for log_id in batch.column(0).to_pylist()]
+
+
+def delete_archived(engine, start: datetime, end: datetime, uri: str) -> int:
+    """
+    Delete the logs held by the archive file at `uri` from apilog, one batch
+    per transaction. Rows that arrived after the export are not touched.
+    """
+    deleted = 0
+    for ids in archived_keys(uri):
+        with engine.begin() as connection:
+            deleted += connection.execute(
+                delete(APILog.__table__)
+                .where(APILog.id.in_(ids), APILog.created_at >= start, APILog.created_at < end)
+            ).rowcount
+    return deleted
+
+
+def archive_periods(connection, horizon: datetime) -> List[Tuple[datetime, datetime, Optional[str]]]:
+    """
+    (start, end, partition) of the closed periods ending by `horizon`: the
+    range partitions of a partitioned apilog, calendar months otherwise.
+    """
+    if is_partitioned(connection):
+        return [(start, end, name) for name, start, end in list_partitions(connection) if end <= horizon]
+    first = connection.execute(select(func.min(APILog.created_at))).scalar()
+    periods = []
+    start = partition_start(first, "month") if first else horizon
+    while (end := next_start(start, "month")) <= horizon:
+        periods.append((start, end, None))
+        start = end
+    return periods
+
+
+def archive_period(engine, start: datetime, end: datetime, partition: Optional[str], watermark: datetime) -> Optional[int]:
+    """
+    Archive the logs with created_at in [start, end). Returns how many were
+    archived, or None if the period holds logs not rolled up yet.
+    """
+    in_period = [APILog.created_at >= start, APILog.created_at < end]
+    with engine.connect() as connection:
+        if connection.execute(select(APILog.id).where(*in_period, APILog.created > watermark).limit(1)).first():
+            return None
+        project_ids = connection.execute(select(APILog.user_project_id).where(*in_period).distinct()).scalars().all()
+        recorded = [] if partition or not project_ids else connection.execute(
+            select(APILogArchive.uri).where(APILogArchive.period_start == start, APILogArchive.period_end == end)
+        ).scalars().all()
+
+    # Finish the deletes of a run interrupted after recording its files
+    for uri in recorded:
+        delete_archived(engine, start, end, uri)
+    if recorded:
+        with engine.connect() as connection:
+            project_ids = connection.execute(select(APILog.user_project_id).where(*in_period).distinct()).scalars().all()
+
+    files = []
+    try:
+        for project_id in project_ids:
+            files.append((project_id, *export_logs(engine, project_id, start, end, watermark)))
+        archived = sum(rows for _, _, rows in files)
+        with engine.begin() as connection:
+            if partition:
+                connection.execute(text("SET LOCAL lock_timeout = '5s'"))
+                connection.execute(text(f"LOCK TABLE {partition} IN ACCESS EXCLUSIVE MODE"))
+                # Late logs may have arrived while the files were written
+                if connection.execute(text(f"SELECT count(*) FROM {partition}")).scalar() != archived:
+                    raise RuntimeError(f"{partition} changed while it was being archived")
+                connection.execute(text(f"DROP TABLE {partition}"))
+            if files:
+                connection.execute(insert(APILogArchive.__table__), [
+                    {
+                        "id": uuid.uuid4(), "user_project_id": project_id, "period_start": start, "period_end": end,
+                        "uri": uri, "rows": rows, "created": datetime.now(),
+                    }
+                    for project_id, uri, rows in files
+                ])
+    except Exception:
+        for _, uri, _ in files:
+            delete_file(uri)
+        raise
+
+    if not partition:
+        # Only the rows written to the files go, whatever arrived since the export stays
+        deleted = sum(delete_archived(engine, start, end, uri) for _, uri, _ in files)
+        if deleted != archived:
+            logger.warning(f"Archived {archived} logs from {start} to {end} but deleted {deleted}")
+    return archived
+
+
+def expire_archives(engine, now: datetime) -> int:
+    """Delete the archive files of periods past their project's raw retention."""
+    with Session(engine) as session:
+        projects = session.execute(select(UserProject)).scalars().all()
+    expired = 0
+    for project in projects:
+        if not (horizon := raw_horizon(project, now)):
+            continue
+        with engine.begin() as connection:
+            archives = connection.execute(
+                delete(APILogArchive.__table__)
+                .where(APILogArchive.user_project_id == project.id, APILogArchive.period_end <= horizon)
+                .returning(APILogArchive.uri)
+            ).scalars().all()
+        # Files go once the catalog no longer points at them
+        for uri in archives:
+            delete_file(uri)
+        expired += len(archives)
+    return expired
+
+
+def archive_logs(engine, now: Optional[datetime] = None) -> dict:
+    now = now or datetime.now()
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        watermark = read_watermark(connection)
+        periods = archive_periods(connection, now - timedelta(days=ARCHIVE_AFTER_DAYS)) if watermark else []
+
+    result = {"archived_periods": [], "archived_logs": 0, "expired_files": expire_archives(engine, now)}
+    for start, end, partition in periods:
+        try:
+            archived = archive_period(engine, start, end, partition, watermark)
+        except Exception as e:
+            logger.warning(f"Could not archive logs from {start} to {end}: {e}")
+            continue
+        if archived or (partition and archived is not None):
+            result["archived_periods"].append(f"{start.isoformat()}/{end.isoformat()}")
+            result["archived_logs"] += archived
+
+    last_run.clear()
+    last_run.update(result, finished=datetime.now().isoformat(), seconds=round(time.perf_counter() - started, 3))
+    return result
+
+
+async def archive_loop(engine, period: float):
+    while True:
+        try:
+            result = await asyncio.to_thread(archive_logs, engine)
+            logger.info(f"Archive run: {result}")
+        except Exception as e:
+            logger.error(f"Error in archive run: {e}")
+        await asyncio.sleep(period)
+
+
+def archived_files(db: Session, project_id: uuid.UUID, ranges: List[Range]) -> List[str]:
+    """URIs of the archive files of `project_id` overlapping any of `ranges`."""
+    overlaps = []
+    for lower, upper in ranges:
+        conditions = []
+        if lower:
+            conditions.append(APILogArchive.period_end > lower)
+        if upper:
+            conditions.append(APILogArchive.period_start <= upper)
+        overlaps.append(and_(true(), *conditions))
+    if not overlaps:
+        return []
+    query = select(APILogArchive.uri).where(APILogArchive.user_project_id == project_id, or_(*overlaps))
+    return db.execute(query).scalars().all()
+
+
+def archive_conditions(db: Session, ranges: List[Range], search_params=None, q: Optional[str] = None,
+                       bots_only: bool = False) -> Tuple[str, list]:
+    """DuckDB WHERE clause and parameters matching the explorer's search filters on archived logs."""
+    conditions, params = [], []
+
+    windows = []
+    for lower, upper in ranges:
+        window = ["true"]
+        if lower:
+            window.append("created_at >= ?")
+            params.append(lower)
+        if upper:
+            window.append("created_at <= ?")
+            params.append(upper)
+        windows.append(" AND ".join(window))
+    conditions.append("(" + " OR ".join(f"({window})" for window in windows) + ")")
+
+    def like(columns, term: str, prefix: bool = False) -> str:
+        pattern = f"{escape_like(term)}%" if prefix else f"%{escape_like(term)}%"
+        params.extend([pattern] * len(columns))
+        return "(" + " OR ".join(f"{name} ILIKE ? ESCAPE '\\'" for name in columns) + ")"
+
+    if search_params:
+        if search_params.path:
+            conditions.append(like(["path"], search_params.path, prefix=True))
+        if search_params.ip_address:
+            conditions.append(like(["ip_address"], search_params.ip_address, prefix=True))
+        if search_params.user_agent:
+            conditions.append(like(["user_agent"], search_params.user_agent))
+        if search_params.location:
+            conditions.append(like(["location"], search_params.location, prefix=True))
+        if search_params.response_code:
+            conditions.append("response_code = ?")
+            params.append(search_params.response_code)
+        for key, value in (search_params.query_params or {}).items():
+            conditions.append("json_extract_string(query_params, ?) = ?")
+            params.extend(['$."' + key.replace('"', '\\"') + '"', value])
+    if q:
+        conditions.append(like(SEARCH_COLUMNS, q))
+    if bots_only:
+        bot_ids = db.execute(select(UserAgent.id).where(UserAgent.is_bot == True)).scalars().all()
+        conditions.append("list_contains(?, user_agent_id)")
+        params.append([str(bot_id) for bot_id in bot_ids])
+    return " AND ".join(conditions), params
+
+
+def query_archive(duckdb, files: List[str], columns: str, where: str, params: list) -> list:
+    sources = ", ".join("'" + uri.replace("'", "''") + "'" for uri in files)
+    with duckdb.connect() as connection:
+        return connection.execute(
+            # union_by_name: files written before a column was added lack it
+            f"SELECT {columns} FROM read_parquet([{sources}], union_by_name = true) WHERE {where} GROUP BY 1", params
+        ).fetchall()
+
+
+def archive_stats(db: Session, project_id: uuid.UUID, granularity: str, ranges: List[Range], search_params=None,
+                  q: Optional[str] = None, bots_only: bool = False) -> Dict[datetime, Tuple]:
+    """
+    (2xx, 3xx, 4xx, 5xx, response time sum, response time count) per
+    `granularity` bucket of the archived logs in `ranges`, like rollup_totals.
+    """
+    files = archived_files(db, project_id, ranges)
+    if not files or not (duckdb := archive_reader()):
+        return {}
+    where, params = archive_conditions(db, ranges, search_params, q, bots_only)
+    status_counts = ", ".join(
+        f"count(*) FILTER (WHERE response_code BETWEEN {low} AND {low + 99})" for low in (200, 300, 400, 500)
+    )
+    rows = query_archive(
+        duckdb, files,
+        f"date_trunc('{granularity}', created_at)::TIMESTAMP, {status_counts}, "
+        "coalesce(sum(response_time), 0), count(response_time)",
+        where, params,
+    )
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def archive_counts(db: Session, project_id: uuid.UUID, ranges: List[Range], search_params=None,
+                   bots_only: bool = False) -> Tuple[Counter, Counter]:
+    """Archived logs in `ranges` per user agent id and per response code."""
+    user_agent_counts, response_code_counts = Counter(), Counter()
+    files = archived_files(db, project_id, ranges)
+    if not files or not (duckdb := archive_reader()):
+        return user_agent_counts, response_code_counts
+    where, params = archive_conditions(db, ranges, search_params, bots_only=bots_only)
+    for ua_id, count in query_archive(duckdb, files, "user_agent_id, count(*)", where, params):
+        user_agent_counts[uuid.UUID(ua_id) if ua_id else None] += count
+    for code, count in query_archive(duckdb, files, "response_code, count(response_code)", where, params):
+        response_code_counts[code] += count
+    return user_agent_counts, response_code_counts
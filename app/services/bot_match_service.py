@@ -0,0 +1,146 @@
+import re
+import threading
+from typing import Iterable, List, Optional
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+
+def required_literal(pattern: str) -> Optional[str]:
+    """
+    Return the longest run of literal characters every match of `pattern`
+    must contain, or None if no such run can be determined (case-insensitive
+    patterns, top-level alternation, no literals at all).
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return None
+    if parsed.state.flags & sre_parse.SRE_FLAG_IGNORECASE:
+        return None
+
+    best = ""
+    run = []
+    for op, arg in parsed:
+        if op == sre_parse.LITERAL:
+            run.append(chr(arg))
+            continue
+        if len(run) > len(best):
+            best = "".join(run)
+        run = []
+    if len(run) > len(best):
+        best = "".join(run)
+    return best or None
+
+
+def _trie_regex(tokens: Iterable[str]) -> str:
+    trie = {}
+    for token in tokens:
+        node = trie
+        for char in token:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Optional tails are greedy, so the longest token at a position wins
+        return "(?:" + body + ")?" if "" in node else body
+
+    return build(trie)
+
+
+class BotMatcher:
+    """
+    Resolves a user agent to the first BotInfo (in table order) whose pattern
+    matches it, like the old linear scan, but compiles every pattern once and
+    only evaluates patterns whose required literal occurs in the user agent.
+
+    Literals are found in a single pass with a trie-shaped regex wrapped in a
+    lookahead so overlapping occurrences are reported. At each position the
+    longest literal is reported; shorter literals that are prefixes of it are
+    added through `_prefix_owners`.
+    """
+
+    def __init__(self, bot_infos: List[dict]):
+        self._ids = []
+        self._patterns = []
+        self._always = []
+        owners = {}
+        for bot_info in bot_infos:
+            pattern = bot_info.get("pattern")
+            if not pattern:
+                continue
+            try:
+                compiled = re.compile(pattern)
+            except re.error:
+                continue
+            index = len(self._patterns)
+            self._ids.append(bot_info.get("id"))
+            self._patterns.append(compiled)
+            if literal := required_literal(pattern):
+                owners.setdefault(literal, []).append(index)
+            else:
+                self._always.append(index)
+
+        # literal -> indexes of every pattern whose literal is a prefix of it
+        self._prefix_owners = {
+            literal: sorted(
+                index
+                for end in range(1, len(literal) + 1)
+                for index in owners.get(literal[:end], ())
+            )
+            for literal in owners
+        }
+        self._prefilter = re.compile("(?=(" + _trie_regex(owners) + "))") if owners else None
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def candidates(self, user_agent: str) -> List[int]:
+        indexes = set(self._always)
+        if self._prefilter:
+            for literal in {match.group(1) for match in self._prefilter.finditer(user_agent)}:
+                indexes.update(self._prefix_owners[literal])
+        return sorted(indexes)
+
+    def match(self, user_agent: str):
+        if not user_agent:
+            return None
+        for index in self.candidates(user_agent):
+            if self._patterns[index].search(user_agent):
+                return self._ids[index]
+        return None
+
+
+_matcher: Optional[BotMatcher] = None
+_matcher_lock = threading.Lock()
+
+
+def get_bot_matcher(load_bot_infos) -> BotMatcher:
+    """
+    Return the process-wide matcher, building it on first use from
+    `load_bot_infos()`, a callable returning BotInfo rows as dicts.
+    """
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _matcher = BotMatcher(load_bot_infos())
+    return _matcher
+
+
+def current_bot_matcher() -> Optional[BotMatcher]:
+    """The matcher if it has been built already, without building it."""
+    return _matcher
+
+
+def reset_bot_matcher():
+    """Drop the cached matcher so the next lookup rebuilds it from the BotInfo table."""
+    global _matcher
+    with _matcher_lock:
+        _matcher = None
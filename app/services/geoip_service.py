@@ -0,0 +1,245 @@
+"""
+Offline IP geolocation.
+
+Two database formats are supported:
+
+- ``.mmdb`` (MaxMind GeoLite2/GeoIP2 City), read with the optional
+  ``maxminddb`` package in memory-mapped mode.
+- ``.csv`` of IP ranges, one ``start_ip,end_ip,country,region,city`` row per
+  range (IPv4 and IPv6). On first use the CSV is compiled next to itself into
+  a single ``.idx`` file: a fixed-width, sorted interval index followed by
+  its label table. The index is memory-mapped and searched with a binary
+  search, so start-up and per-worker memory do not depend on the CSV size.
+
+Lookups are fronted by a bounded LRU cache keyed by IP.
+"""
+import csv
+import ipaddress
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+from app.config import GEOIP_CACHE_SIZE, GEOIP_DATABASE_PATH
+from app.services.cache_service import MISSING, TTLCache
+from app.services.metrics_service import register_metrics
+
+logger = logging.getLogger(__name__)
+
+# Version 2 holds the labels after the records; version 1 indexes kept them in a separate file
+INDEX_MAGIC = b"WWWGEO2\0"
+HEADER = struct.Struct(">8sI")
+KEY_SIZE = 16
+RECORD = struct.Struct(">16s16sI")
+
+
+def ip_key(ip: str) -> Optional[bytes]:
+    """16-byte big-endian key for an IP; IPv4 is mapped into ::ffff:0:0/96."""
+    try:
+        address = ipaddress.ip_address(ip.strip())
+    except ValueError:
+        return None
+    if address.version == 4:
+        return b"\0" * 10 + b"\xff\xff" + address.packed
+    return address.packed
+
+
+def format_location(city: str, region: str, country: str) -> str:
+    return f"{city or ''}, {region or ''}, {country or ''}"
+
+
+@contextmanager
+def replace_atomically(path: str, mode: str):
+    """
+    Write to a temporary file of this process next to `path`, then move it
+    over `path`, so workers compiling the same index at once never share or
+    expose a partial file.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    f = tempfile.NamedTemporaryFile(mode, dir=directory, prefix=f".{name}.", suffix=".tmp", delete=False)
+    try:
+        with f:
+            yield f
+        os.replace(f.name, path)
+    except BaseException:
+        os.unlink(f.name)
+        raise
+
+
+def compile_csv_index(csv_path: str, index_path: str):
+    records = []
+    labels = {}
+    with open(csv_path, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 5:
+                continue
+            start, end = ip_key(row[0]), ip_key(row[1])
+            if start is None or end is None:  # header or malformed row
+                continue
+            label = format_location(row[4], row[3], row[2])
+            records.append((start, end, labels.setdefault(label, len(labels))))
+    records.sort()
+
+    # One file, replaced in one rename, so a reader never pairs an index with another one's labels
+    with replace_atomically(index_path, "wb") as f:
+        f.write(HEADER.pack(INDEX_MAGIC, len(records)))
+        for record in records:
+            f.write(RECORD.pack(*record))
+        f.write(json.dumps(sorted(labels, key=labels.get)).encode())
+    logger.info(f"Compiled {len(records)} IP ranges from {csv_path}")
+
+
+def is_current_index(index_path: str, csv_path: str) -> bool:
+    """Whether `index_path` exists in the current format and is not older than the CSV."""
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(csv_path):
+        return False
+    with open(index_path, "rb") as f:
+        return f.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+
+
+class RangeIndexGeoIP:
+    """Binary search over a memory-mapped, sorted array of (start, end, label) records."""
+
+    def __init__(self, csv_path: str):
+        index_path = csv_path + ".idx"
+        if not is_current_index(index_path, csv_path):
+            compile_csv_index(csv_path, index_path)
+
+        self._file = open(index_path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self._mm, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{index_path} is not a GeoIP range index")
+        self.labels = json.loads(self._mm[HEADER.size + self.count * RECORD.size:])
+
+    def _start(self, position: int) -> bytes:
+        offset = HEADER.size + position * RECORD.size
+        return self._mm[offset:offset + KEY_SIZE]
+
+    def _search(self, key: bytes, lo: int = 0) -> int:
+        """Index of the last record whose start <= key, or lo - 1 if none."""
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._start(mid) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def _label(self, position: int, key: bytes) -> Optional[str]:
+        if position < 0:
+            return None
+        start, end, label = RECORD.unpack_from(self._mm, HEADER.size + position * RECORD.size)
+        return self.labels[label] if key <= end else None
+
+    def lookup(self, ip: str) -> Optional[str]:
+        key = ip_key(ip)
+        return self._label(self._search(key), key) if key else None
+
+    def lookup_many(self, ips: Iterable[str]) -> Dict[str, Optional[str]]:
+        # Sorted keys let each search start where the previous one ended
+        keyed = sorted((key, ip) for ip in set(ips) if (key := ip_key(ip)))
+        results = {}
+        lo = 0
+        for key, ip in keyed:
+            position = self._search(key, lo)
+            results[ip] = self._label(position, key)
+            lo = max(position, 0)
+        return results
+
+
+class MaxMindGeoIP:
+    def __init__(self, mmdb_path: str):
+        try:
+            import maxminddb
+        except ImportError:
+            raise ImportError("Reading .mmdb GeoIP databases requires the maxminddb package")
+        self._reader = maxminddb.open_database(mmdb_path, maxminddb.MODE_MMAP)
+
+    def lookup(self, ip: str) -> Optional[str]:
+        try:
+            record = self._reader.get(ip.strip())
+        except ValueError:
+            return None
+        if not record:
+            return None
+        city = record.get("city", {}).get("names", {}).get("en")
+        subdivisions = record.get("subdivisions") or [{}]
+        region = subdivisions[0].get("names", {}).get("en")
+        country = record.get("country", {}).get("iso_code")
+        return format_location(city, region, country)
+
+    def lookup_many(self, ips: Iterable[str]) -> Dict[str, Optional[str]]:
+        return {ip: self.lookup(ip) for ip in set(ips)}
+
+
+_database = None
+_database_loaded = False
+_database_lock = threading.Lock()
+
+
+def get_geoip_database():
+    """The configured GeoIP database, or None if GEOIP_DATABASE_PATH is unset or unreadable."""
+    global _database, _database_loaded
+    if not _database_loaded:
+        with _database_lock:
+            if not _database_loaded:
+                if GEOIP_DATABASE_PATH:
+                    try:
+                        if GEOIP_DATABASE_PATH.endswith(".mmdb"):
+                            _database = MaxMindGeoIP(GEOIP_DATABASE_PATH)
+                        else:
+                            _database = RangeIndexGeoIP(GEOIP_DATABASE_PATH)
+                    except Exception as e:
+                        logger.error(f"Could not load GeoIP database {GEOIP_DATABASE_PATH}: {e}")
+                _database_loaded = True
+    return _database
+
+
+def client_ip(ip: str) -> str:
+    # X-Forwarded-For style lists: the first entry is the client
+    return ip.split(',')[0].strip() if ip else ip
+
+
+# ip -> location (or None when not found); the database never changes while running
+location_cache = TTLCache(maxsize=GEOIP_CACHE_SIZE, ttl=float("inf"))
+
+
+def get_location(ip: str) -> Optional[str]:
+    return get_locations([ip]).get(ip)
+
+
+def get_locations(ips: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Resolve a batch of IPs; cache misses are looked up together in one sorted pass."""
+    database = get_geoip_database()
+    if not database:
+        return {}
+    results = {}
+    misses = set()
+    for ip in set(ips):
+        if not ip:
+            continue
+        location = location_cache.get(ip)
+        if location is MISSING:
+            misses.add(ip)
+        else:
+            results[ip] = location
+    if misses:
+        found = database.lookup_many(client_ip(ip) for ip in misses)
+        for ip in misses:
+            results[ip] = found.get(client_ip(ip))
+            location_cache.set(ip, results[ip])
+    return results
+
+
+def geoip_stats():
+    return dict(location_cache.stats(), database=GEOIP_DATABASE_PATH if get_geoip_database() else None)
+
+
+register_metrics("geoip", geoip_stats)
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import math
+from collections import defaultdict
+
+from fastapi import HTTPException
+
+from app.crud.apilog import create_apilog_bulk
+from app.database import async_session_maker
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("block", "drop", "reject")
+
+# Queued by stop(): the flusher writes the batch it holds and returns
+STOP = object()
+
+
+class IngestBuffer:
+    """
+    In-process write-behind queue for API logs.
+
+    Requests enqueue validated payloads and return immediately; a background
+    task drains the queue in batches of up to `max_batch_size` entries, or
+    whatever has arrived within `flush_interval` seconds, and writes them
+    through the bulk insert path. Must be created inside the running event loop.
+    """
+
+    def __init__(self, max_size: int, max_batch_size: int, flush_interval: float, overflow: str = "reject"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}")
+        self.queue = asyncio.Queue(maxsize=max_size)
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.accepted = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.duplicates = 0
+        self.failed = 0
+        self._task = None
+
+    async def put(self, user_project_id, apilog) -> bool:
+        """Enqueue a log. Returns False if it was dropped, raises 429 if rejected."""
+        item = (user_project_id, apilog)
+        if self.overflow == "block":
+            await self.queue.put(item)
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except asyncio.QueueFull:
+                if self.overflow == "drop":
+                    self.dropped += 1
+                    return False
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=429,
+                    detail="Ingest queue is full, retry later",
+                    headers={"Retry-After": str(math.ceil(self.flush_interval))},
+                )
+        self.accepted += 1
+        return True
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write out whatever is still queued."""
+        if self._task:
+            # Not cancelled: that would lose the batch being collected or flushed
+            await self.queue.put(STOP)
+            await self._task
+            self._task = None
+        while not self.queue.empty():
+            batch = []
+            while not self.queue.empty() and len(batch) < self.max_batch_size:
+                batch.append(self.queue.get_nowait())
+            await self.flush(batch)
+
+    async def _next_batch(self):
+        """The next batch to write, and whether stop() was called."""
+        loop = asyncio.get_running_loop()
+        item = await self.queue.get()
+        if item is STOP:
+            return [], True
+        batch = [item]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if item is STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self):
+        while True:
+            batch, stopping = await self._next_batch()
+            if batch:
+                await self.flush(batch)
+            if stopping:
+                return
+
+    async def flush(self, batch):
+        by_project = defaultdict(list)
+        for user_project_id, apilog in batch:
+            by_project[user_project_id].append(apilog)
+
+        for user_project_id, apilogs in by_project.items():
+            try:
+                async with async_session_maker() as session:
+                    ack = await create_apilog_bulk(session, user_project_id, apilogs)
+                self.flushed += ack["count"]
+                self.duplicates += ack["duplicates"]
+            except Exception as e:
+                self.failed += len(apilogs)
+                logger.error(f"Error flushing {len(apilogs)} logs for project {user_project_id}: {e}")
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_max_size": self.queue.maxsize,
+            "max_batch_size": self.max_batch_size,
+            "flush_interval": self.flush_interval,
+            "overflow": self.overflow,
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+        }
@@ -0,0 +1,73 @@
+"""
+Cache invalidation across processes.
+
+The per-worker caches of the API service (API keys, parsed user agents) go
+stale through changes made in the dashboard service, such as deleting a key
+or adding a bot. publish_invalidation records what to drop in the
+cacheinvalidation table, in the caller's transaction. Every process running
+invalidation_loop polls the table and passes the entries it has not handled
+yet to the handler registered for their cache.
+
+Ids come from a sequence, so an entry can commit after one with a higher id.
+Each poll re-reads the last LOOKBACK ids and skips the ones already handled.
+"""
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlmodel import Session
+
+from app.models.cacheinvalidation import CacheInvalidation
+
+logger = logging.getLogger(__name__)
+
+LOOKBACK = 100
+# Entries kept in the table; workers only need the recent ones
+KEEP = 1000
+
+# cache name -> handler called with the key to drop, or None to clear the cache
+handlers: Dict[str, Callable[[Optional[str]], None]] = {}
+
+
+def register_invalidation_handler(cache: str, handler: Callable[[Optional[str]], None]):
+    handlers[cache] = handler
+
+
+def publish_invalidation(db: Session, cache: str, key: Optional[str] = None):
+    """Ask every worker to drop `key` (or everything) from `cache` once `db` commits."""
+    table = CacheInvalidation.__table__
+    db.execute(insert(table).values(cache=cache, key=key))
+    db.execute(delete(table).where(table.c.id < select(func.max(table.c.id)).scalar_subquery() - KEEP))
+
+
+def poll_invalidations(engine, position: Optional[int], handled: Set[int]) -> Tuple[int, Set[int]]:
+    """
+    Apply the entries with ids above `position` - LOOKBACK that are not in
+    `handled`. Returns the new position and handled ids. With `position`
+    None only records the current entries: a starting process has nothing
+    cached yet.
+    """
+    table = CacheInvalidation.__table__
+    with engine.connect() as connection:
+        start = position
+        if start is None:
+            start = connection.execute(select(func.max(table.c.id))).scalar() or 0
+        rows = connection.execute(
+            select(table.c.id, table.c.cache, table.c.key).where(table.c.id > start - LOOKBACK).order_by(table.c.id)
+        ).all()
+    if position is not None:
+        for row in rows:
+            if row.id not in handled and (handler := handlers.get(row.cache)):
+                handler(row.key)
+    return max([start] + [row.id for row in rows]), {row.id for row in rows}
+
+
+async def invalidation_loop(engine, period: float):
+    position, handled = None, set()
+    while True:
+        try:
+            position, handled = await asyncio.to_thread(poll_invalidations, engine, position, handled)
+        except Exception as e:
+            logger.error(f"Error polling cache invalidations: {e}")
+        await asyncio.sleep(period)
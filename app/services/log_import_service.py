@@ -0,0 +1,157 @@
+"""
+Parsing, enrichment and COPY writing for the offline log importer
+(import_logs.py). Parsing and enrichment run in worker processes, so the
+worker entry points here are module-level functions.
+"""
+import io
+import json
+import re
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.crud.apilog import build_apilog
+from app.schemas.apilog import APILogCreate
+from app.services.bot_match_service import BotMatcher
+from app.services.geoip_service import get_locations
+from app.services.path_template_service import (PathTemplater,
+                                                get_path_templater)
+
+FORMATS = ("caddy", "nginx", "jsonl")
+
+# $remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent "$http_referer" "$http_user_agent",
+# optionally followed by $request_time
+NGINX_COMBINED = re.compile(
+    r'(?P<ip>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<request>[^"]*)" (?P<status>\d{3}) \S+ '
+    r'"(?:[^"\\]|\\.)*" "(?P<user_agent>(?:[^"\\]|\\.)*)"(?: (?P<request_time>[\d.]+))?'
+)
+
+
+def local_naive(moment: datetime) -> datetime:
+    # Logs are stored with naive local timestamps (datetime.now())
+    return moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+
+
+def address_host(address: str) -> str:
+    """The host of a host:port address, without the brackets of an IPv6 host ([::1]:443)."""
+    if address.startswith("["):
+        return address[1:].split("]", 1)[0]
+    return address.rsplit(":", 1)[0] if address.count(":") == 1 else address
+
+
+def parse_caddy(line: str, host: str) -> Optional[APILogCreate]:
+    entry = json.loads(line)
+    request = entry.get("request")
+    if not request:
+        return None  # not an access log entry
+    ip_address = request.get("client_ip") or request.get("remote_ip") or address_host(request.get("remote_addr", ""))
+    scheme = "https" if "tls" in request else "http"
+    user_agent = (request.get("headers", {}).get("User-Agent") or [""])[0]
+    return APILogCreate(
+        url=f"{scheme}://{request.get('host') or host}{request.get('uri', '/')}",
+        ip_address=ip_address,
+        user_agent=user_agent,
+        response_code=entry.get("status"),
+        response_time=entry.get("duration"),
+        created_at=datetime.fromtimestamp(entry["ts"]) if entry.get("ts") else None,
+    )
+
+
+def parse_nginx(line: str, host: str) -> Optional[APILogCreate]:
+    match = NGINX_COMBINED.match(line)
+    if not match:
+        raise ValueError("not an nginx combined log line")
+    request = match["request"].split(" ")
+    uri = request[1] if len(request) > 1 else "/"
+    return APILogCreate(
+        url=f"http://{host}{uri}" if uri.startswith("/") else uri,
+        ip_address=match["ip"],
+        user_agent="" if match["user_agent"] == "-" else match["user_agent"],
+        response_code=int(match["status"]),
+        response_time=float(match["request_time"]) if match["request_time"] else None,
+        created_at=local_naive(datetime.strptime(match["time"], "%d/%b/%Y:%H:%M:%S %z")),
+    )
+
+
+def parse_jsonl(line: str, host: str) -> Optional[APILogCreate]:
+    return APILogCreate.parse_obj(json.loads(line))
+
+
+PARSERS = {"caddy": parse_caddy, "nginx": parse_nginx, "jsonl": parse_jsonl}
+
+
+def detect_format(first_line: str) -> str:
+    if NGINX_COMBINED.match(first_line):
+        return "nginx"
+    entry = json.loads(first_line)
+    return "caddy" if "request" in entry and "ts" in entry else "jsonl"
+
+
+_bot_matcher: Optional[BotMatcher] = None
+_path_templater: Optional[PathTemplater] = None
+
+
+def init_worker(bot_infos: List[dict], path_template_rules: Optional[List[str]] = None):
+    global _bot_matcher, _path_templater
+    _bot_matcher = BotMatcher(bot_infos)
+    _path_templater = get_path_templater(path_template_rules)
+
+
+def parse_chunk(fmt: str, lines: List[str], user_project_id: uuid.UUID, host: str, update_location: bool = True):
+    """
+    Parse and enrich one chunk of log lines in a worker. Returns
+    (apilog rows, useragent rows, unparseable line count, seconds spent).
+    """
+    start = time.perf_counter()
+    parse = PARSERS[fmt]
+    entries = []
+    errors = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            entry = parse(line, host)
+        # ValueError includes JSON and validation errors; the others come from
+        # JSON of the wrong shape, such as a list or a string instead of an object
+        except (ValueError, AttributeError, TypeError, OverflowError):
+            errors += 1
+            continue
+        if entry:
+            entries.append(entry)
+
+    locations = get_locations(entry.ip_address for entry in entries if not entry.location) if update_location else {}
+    apilog_rows = []
+    user_agent_rows = {}
+    for entry in entries:
+        db_apilog, user_agent_row = build_apilog(_bot_matcher, user_project_id, entry, _path_templater)
+        if not entry.location:
+            db_apilog.location = locations.get(entry.ip_address)
+        # Left out so the database sets it
+        apilog_rows.append(db_apilog.dict(exclude={"created"}))
+        if user_agent_row:
+            user_agent_rows[user_agent_row["id"]] = user_agent_row
+    return apilog_rows, list(user_agent_rows.values()), errors, time.perf_counter() - start
+
+
+def copy_text_value(value) -> str:
+    """Encode a value for COPY ... FROM STDIN in text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_rows(cursor, table: str, columns: List[str], rows: List[Dict]):
+    """COPY rows into `table` through a psycopg2 cursor."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(copy_text_value(row.get(column)) for column in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
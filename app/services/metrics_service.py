@@ -0,0 +1,12 @@
+from typing import Callable, Dict
+
+_collectors: Dict[str, Callable[[], dict]] = {}
+
+
+def register_metrics(name: str, collector: Callable[[], dict]):
+    """Register a callable whose result is reported under `name` by the metrics endpoint."""
+    _collectors[name] = collector
+
+
+def collect_metrics():
+    return {name: collector() for name, collector in _collectors.items()}
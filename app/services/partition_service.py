@@ -0,0 +1,131 @@
+"""
+Range partitions of apilog by created_at (PostgreSQL only).
+
+Partitions are named apilog_pYYYY_MM (monthly) or apilog_pYYYY_MM_DD (daily)
+and cover [start, next start). Rows outside every partition land in
+apilog_default, which is created with the table. Creating a partition moves
+any rows it covers out of the default partition first.
+"""
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+INTERVALS = ("day", "month")
+DEFAULT_PARTITION = "apilog_default"
+BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def partition_start(moment: datetime, interval: str) -> datetime:
+    if interval == "day":
+        return datetime(moment.year, moment.month, moment.day)
+    if interval == "month":
+        return datetime(moment.year, moment.month, 1)
+    raise ValueError(f"Unknown partition interval {interval!r}, expected one of {INTERVALS}")
+
+
+def next_start(start: datetime, interval: str) -> datetime:
+    if interval == "day":
+        return start + timedelta(days=1)
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def partition_name(start: datetime, interval: str) -> str:
+    return start.strftime("apilog_p%Y_%m_%d" if interval == "day" else "apilog_p%Y_%m")
+
+
+def is_partitioned(connection, table: str = "apilog") -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :table AND c.relnamespace = current_schema()::regnamespace"
+    ), {"table": table}).first() is not None
+
+
+def list_partitions(connection, table: str = "apilog") -> List[Tuple[str, datetime, datetime]]:
+    """(name, start, end) of the range partitions of `table`, oldest first; the default partition is left out."""
+    rows = connection.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :table AND p.relnamespace = current_schema()::regnamespace"
+    ), {"table": table}).all()
+    partitions = []
+    for name, bound in rows:
+        if match := BOUND_PATTERN.search(bound):
+            partitions.append((name, datetime.fromisoformat(match[1]), datetime.fromisoformat(match[2])))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partition(connection, start: datetime, end: datetime, name: str):
+    """
+    Attach partition `name` for [start, end), taking over the rows of the
+    default partition that fall in it. Runs in the caller's transaction.
+    """
+    bounds = {"start": start, "end": end}
+    connection.execute(text(f"CREATE TABLE {name} (LIKE apilog INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = connection.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), bounds).rowcount
+    connection.execute(text(
+        f"ALTER TABLE apilog ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start.isoformat(sep=' ')}') TO ('{end.isoformat(sep=' ')}')"
+    ))
+    if moved:
+        logger.info(f"Moved {moved} rows from {DEFAULT_PARTITION} into {name}")
+
+
+def ensure_partitions(connection, interval: str, start: datetime, end: datetime) -> List[str]:
+    """
+    Create the missing `interval` partitions covering [start, end]. Ranges
+    that overlap an existing partition (e.g. after switching between daily
+    and monthly) are left to it. Returns the names created; does nothing if
+    apilog is not partitioned.
+    """
+    if not is_partitioned(connection):
+        return []
+    # Serialize with other workers doing the same
+    connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('apilog_partitions'))"))
+    existing = list_partitions(connection)
+    created = []
+    partition = partition_start(start, interval)
+    while partition <= end:
+        following = next_start(partition, interval)
+        if not any(lower < following and partition < upper for _, lower, upper in existing):
+            name = partition_name(partition, interval)
+            create_partition(connection, partition, following, name)
+            created.append(name)
+        partition = following
+    return created
+
+
+def ahead_end(now: datetime, interval: str, ahead: int) -> datetime:
+    end = partition_start(now, interval)
+    for _ in range(ahead):
+        end = next_start(end, interval)
+    return end
+
+
+def maintain_partitions(engine, interval: str, ahead: int, now: Optional[datetime] = None) -> List[str]:
+    """Create the partitions for the current interval and the `ahead` following ones."""
+    now = now or datetime.now()
+    with engine.begin() as connection:
+        created = ensure_partitions(connection, interval, now, ahead_end(now, interval, ahead))
+    if created:
+        logger.info(f"Created apilog partitions {', '.join(created)}")
+    return created
+
+
+async def partition_maintenance_loop(engine, interval: str, ahead: int, period: float):
+    while True:
+        try:
+            await asyncio.to_thread(maintain_partitions, engine, interval, ahead)
+        except Exception as e:
+            logger.error(f"Error creating apilog partitions: {e}")
+        await asyncio.sleep(period)
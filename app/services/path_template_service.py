@@ -0,0 +1,117 @@
+"""
+Path templates, which group the raw paths of logs by endpoint:
+/users/123/orders/9f86d081884c7d65 becomes /users/{id}/orders/{hash}.
+
+A project's rules are tried first, in order. Each rule is a template such as
+/repos/{owner}/{repo}, where a {placeholder} matches exactly one segment, and
+the first rule matching the whole path is the path's template. Paths that no
+rule matches get their variable-looking segments replaced: {uuid}, {id} for
+numbers, {hash} for hex digests and long tokens, {slug} for dated or numbered
+hyphenated names.
+
+Segments are classified one at a time with anchored patterns, and every
+project's rules are compiled into a single alternation, cached per project,
+so templating a path takes time linear in its length and the number of rules.
+"""
+import re
+import uuid
+from typing import Iterable, List, Optional
+
+from app.config import PATH_TEMPLATE_CACHE_SIZE, PATH_TEMPLATE_CACHE_TTL
+from app.services.cache_service import TTLCache
+from app.services.invalidation_service import register_invalidation_handler
+from app.services.metrics_service import register_metrics
+
+# Longer segments are left as they are, keeping the work per segment bounded
+MAX_SEGMENT_LENGTH = 200
+UUID = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+NUMBER = re.compile(r"[0-9]+")
+HEX = re.compile(r"[0-9a-fA-F]{16,}")
+SLUG_WORD = re.compile(r"[a-z0-9]+")
+TOKEN = re.compile(r"[A-Za-z0-9_-]{20,}")
+LETTER = re.compile(r"[A-Za-z]")
+DIGIT = re.compile(r"[0-9]")
+PLACEHOLDER = re.compile(r"\{[^/{}]*\}")
+
+
+def is_slug(segment: str) -> bool:
+    """
+    Hyphenated lowercase words with a number of two or more digits (order-1234,
+    2024-01-05), or with four or more words (how-to-reset-a-password).
+    """
+    words = segment.split("-")
+    if len(words) < 2 or not all(SLUG_WORD.fullmatch(word) for word in words):
+        return False
+    return len(words) >= 4 or any(len(word) >= 2 and word.isdigit() for word in words)
+
+
+def segment_label(segment: str) -> Optional[str]:
+    """The placeholder replacing `segment`, or None to keep it."""
+    if not segment or len(segment) > MAX_SEGMENT_LENGTH:
+        return None
+    if UUID.fullmatch(segment):
+        return "{uuid}"
+    if NUMBER.fullmatch(segment):
+        return "{id}"
+    if HEX.fullmatch(segment):
+        return "{hash}"
+    if is_slug(segment):
+        return "{slug}"
+    # Base64url-style tokens of 20+ characters mixing letters and digits
+    if TOKEN.fullmatch(segment) and LETTER.search(segment) and DIGIT.search(segment):
+        return "{hash}"
+    return None
+
+
+def default_template(path: str) -> str:
+    # Every pattern is anchored to a single segment, so none can backtrack across the path
+    head, *segments = path.split("/")
+    return "/".join([head] + [segment_label(segment) or segment for segment in segments])
+
+
+def rule_pattern(rule: str) -> str:
+    """Regex for the paths matching `rule`, without capturing groups."""
+    if not rule.startswith("/"):
+        raise ValueError(f"Path template rule {rule!r} must start with /")
+    segments = []
+    for segment in rule.split("/"):
+        if PLACEHOLDER.fullmatch(segment):
+            segments.append("[^/]+")
+        elif PLACEHOLDER.search(segment):
+            # Placeholders sharing a segment with text could backtrack on long segments
+            raise ValueError(f"Path template rule {rule!r}: a placeholder must be a whole segment")
+        else:
+            segments.append(re.escape(segment))
+    return "/".join(segments) + "/?"
+
+
+class PathTemplater:
+    """Templates paths with a project's rules, falling back to the segment patterns."""
+
+    def __init__(self, rules: Iterable[str] = ()):
+        self.rules: List[str] = [rule for rule in rules if rule]
+        self._rules = None
+        if self.rules:
+            # One group per rule; match.lastindex tells which rule matched
+            self._rules = re.compile("|".join(f"({rule_pattern(rule)})" for rule in self.rules))
+
+    def template(self, path: Optional[str]) -> Optional[str]:
+        if not path:
+            return path
+        if self._rules and (match := self._rules.fullmatch(path)):
+            return self.rules[match.lastindex - 1]
+        return default_template(path)
+
+
+DEFAULT_TEMPLATER = PathTemplater()
+
+# user_project_id -> PathTemplater of the project's rules
+path_templaters = TTLCache(maxsize=PATH_TEMPLATE_CACHE_SIZE, ttl=PATH_TEMPLATE_CACHE_TTL)
+register_metrics("path_templater_cache", path_templaters.stats)
+register_invalidation_handler(
+    "path_templates", lambda key: path_templaters.invalidate(uuid.UUID(key)) if key else path_templaters.clear()
+)
+
+
+def get_path_templater(rules: Optional[List[str]]) -> PathTemplater:
+    return PathTemplater(rules) if rules else DEFAULT_TEMPLATER
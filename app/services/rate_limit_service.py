@@ -0,0 +1,219 @@
+"""
+Token-bucket rate limiting for the ingest API.
+
+Every request is charged against two buckets, one for its API key and one for
+its project, with one token per log row. A charge is all-or-nothing across
+both buckets. A bucket that holds at least `min(cost, burst)` tokens accepts
+the charge and may go negative, so a bulk payload larger than the burst is
+still accepted from a full bucket and then pays the debt off before the next
+request gets through.
+
+Buckets live in worker memory by default. With RATE_LIMIT_REDIS_URL set they
+are shared through Redis, and the in-memory backend stands in whenever Redis
+is unreachable. Key buckets are named after a digest of the API key, so the
+key itself is never stored in memory or in Redis.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+from app.dependencies.apikey import API_KEY_NAME
+
+logger = logging.getLogger(__name__)
+
+# (bucket key, tokens per second, burst)
+Bucket = Tuple[str, float, float]
+
+
+def key_bucket(api_key: Optional[str]) -> str:
+    digest = hashlib.sha256((api_key or "").encode()).hexdigest()[:32]
+    return f"key:{digest}"
+
+
+def refill(tokens: float, updated: float, now: float, rate: float, burst: float) -> float:
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+class LocalRateLimitBackend:
+    """Per-worker buckets; the least recently used are evicted (and so start full again)."""
+
+    def __init__(self, max_buckets: int = 100000):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, buckets: List[Bucket], cost: float) -> Tuple[bool, float]:
+        """Charge `cost` to every bucket or to none. Returns (allowed, seconds to wait)."""
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for key, rate, burst in buckets:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                tokens = refill(tokens, updated, now, rate, burst)
+                needed = min(cost, burst)
+                if tokens < needed:
+                    wait = max(wait, (needed - tokens) / rate)
+                levels.append(tokens)
+            if wait > 0:
+                return False, wait
+            for (key, rate, burst), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens - cost, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return True, 0.0
+
+    def stats(self):
+        return {"backend": "local", "buckets": len(self._buckets)}
+
+
+# KEYS: bucket keys; ARGV: cost, then rate and burst per key
+TAKE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    local needed = math.min(cost, burst)
+    if tokens < needed then
+        wait = math.max(wait, (needed - tokens) / rate)
+    end
+    levels[i] = tokens
+end
+if wait > 0 then
+    return {0, tostring(wait)}
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    local tokens = levels[i] - cost
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'updated', tostring(now))
+    -- Once refilled the bucket is indistinguishable from a missing one
+    redis.call('EXPIRE', key, math.ceil((burst - tokens) / rate) + 1)
+end
+return {1, '0'}
+"""
+
+
+class RedisRateLimitBackend:
+    """Buckets shared by all workers, updated atomically by a Lua script."""
+
+    def __init__(self, url: str, fallback: LocalRateLimitBackend, prefix: str = "ratelimit:"):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self._script = self._redis.register_script(TAKE_SCRIPT)
+        self.fallback = fallback
+        self.prefix = prefix
+        self.errors = 0
+        self._last_error_log = 0.0
+
+    async def take(self, buckets: List[Bucket], cost: float) -> Tuple[bool, float]:
+        args = [cost]
+        for key, rate, burst in buckets:
+            args += [rate, burst]
+        try:
+            allowed, wait = await self._script(keys=[self.prefix + key for key, _, _ in buckets], args=args)
+            return bool(allowed), float(wait)
+        except Exception as e:
+            self.errors += 1
+            if time.monotonic() - self._last_error_log > 60:
+                self._last_error_log = time.monotonic()
+                logger.warning(f"Rate limit backend unavailable, using per-worker buckets: {e}")
+            return await self.fallback.take(buckets, cost)
+
+    def stats(self):
+        return {"backend": "redis", "errors": self.errors, "fallback_buckets": len(self.fallback._buckets)}
+
+
+class RateLimiter:
+    def __init__(self, backend, key_rate: float, key_burst: float, project_rate: float, project_burst: float):
+        self.backend = backend
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.project_rate = project_rate
+        self.project_burst = project_burst
+        self.throttled_requests = Counter()
+        self.throttled_rows = Counter()
+
+    async def take(self, api_key: str, project_id, cost: int, count_throttled: bool = True) -> Tuple[bool, float]:
+        """
+        Charge `cost` rows to the key and project buckets. A refused charge is
+        counted as throttled unless `count_throttled` is False, for retries of
+        a request already counted.
+        """
+        buckets = [
+            (key_bucket(api_key), self.key_rate, self.key_burst),
+            (f"project:{project_id}", self.project_rate, self.project_burst),
+        ]
+        allowed, wait = await self.backend.take(buckets, cost)
+        if not allowed and count_throttled:
+            self.throttled_requests[str(project_id)] += 1
+            self.throttled_rows[str(project_id)] += cost
+        return allowed, wait
+
+    def stats(self):
+        return dict(
+            self.backend.stats(),
+            key_rate=self.key_rate,
+            key_burst=self.key_burst,
+            project_rate=self.project_rate,
+            project_burst=self.project_burst,
+            throttled_requests=dict(self.throttled_requests),
+            throttled_rows=dict(self.throttled_rows),
+        )
+
+
+def create_rate_limiter(redis_url: Optional[str], max_buckets: int, **limits) -> RateLimiter:
+    backend = LocalRateLimitBackend(max_buckets)
+    if redis_url:
+        try:
+            backend = RedisRateLimitBackend(redis_url, fallback=backend)
+        except ImportError:
+            logger.error("RATE_LIMIT_REDIS_URL is set but the redis package is not installed; using per-worker buckets")
+    return RateLimiter(backend, **limits)
+
+
+async def enforce_rate_limit(request: Request, user_project, cost: int = 1):
+    """Charge `cost` rows to the caller's key and project, raising 429 when over the limit."""
+    rate_limiter = getattr(request.app.state, "rate_limiter", None)
+    if not rate_limiter or cost <= 0:
+        return
+    allowed, wait = await rate_limiter.take(request.headers.get(API_KEY_NAME), user_project.id, cost)
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded, retry later",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
+
+
+async def wait_for_rate_limit(request: Request, user_project, cost: int):
+    """Backpressure for streamed uploads: wait until the buckets can pay for `cost` rows."""
+    rate_limiter = getattr(request.app.state, "rate_limiter", None)
+    if not rate_limiter or cost <= 0:
+        return
+    throttled = False
+    while True:
+        allowed, wait = await rate_limiter.take(
+            request.headers.get(API_KEY_NAME), user_project.id, cost, count_throttled=not throttled
+        )
+        if allowed:
+            return
+        throttled = True
+        await asyncio.sleep(wait)
@@ -0,0 +1,138 @@
+"""
+Retention of raw logs and rollups.
+
+Each run first brings the rollups up to date, so raw rows are always counted
+before they go. Raw rows older than a project's horizon are then removed:
+whole partitions when every project's horizon has passed them, otherwise in
+bounded batches of RETENTION_BATCH_SIZE rows, one short transaction each.
+Only rows already folded into the rollups (created up to the watermark) are
+deleted.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, select, text, tuple_
+from sqlmodel import Session
+
+from app.config import (MINUTE_ROLLUP_RETENTION_DAYS, RAW_RETENTION_DAYS,
+                        RETENTION_BATCH_SIZE, ROLLUP_RETENTION_DAYS)
+from app.models.apilog import APILog, APILogEvent
+from app.models.apilogrollup import APILogDimensionDaily
+from app.models.user import UserProject
+from app.services.metrics_service import register_metrics
+from app.services.partition_service import is_partitioned, list_partitions
+from app.services.rollup_service import ROLLUPS, compact_rollups
+
+logger = logging.getLogger(__name__)
+
+last_run = {}
+register_metrics("retention", lambda: dict(last_run))
+
+
+def raw_horizon(project: UserProject, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Raw logs of `project` created before this are expired; None keeps them forever."""
+    days = project.raw_retention_days or RAW_RETENTION_DAYS
+    return (now or datetime.now()) - timedelta(days=days) if days else None
+
+
+def rollup_horizon(project: UserProject, now: Optional[datetime] = None) -> Optional[datetime]:
+    days = project.rollup_retention_days or ROLLUP_RETENTION_DAYS
+    return (now or datetime.now()) - timedelta(days=days) if days else None
+
+
+def delete_in_batches(engine, table, key_columns, conditions, batch_size: int = RETENTION_BATCH_SIZE) -> int:
+    """Delete the rows matching `conditions`, at most `batch_size` per transaction."""
+    deleted = 0
+    while True:
+        keys = select(*key_columns).where(*conditions).limit(batch_size)
+        with engine.begin() as connection:
+            count = connection.execute(delete(table).where(tuple_(*key_columns).in_(keys))).rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+        time.sleep(0.01)  # let other writers in between batches
+
+
+def drop_expired_partitions(engine, horizon: datetime, watermark: datetime) -> List[str]:
+    """
+    Drop the apilog partitions that end before `horizon` and hold no rows
+    newer than the rollup watermark. A partition whose lock is not granted
+    within a few seconds is left for the next run.
+    """
+    dropped = []
+    with engine.connect() as connection:
+        if not is_partitioned(connection):
+            return dropped
+        partitions = [partition for partition in list_partitions(connection) if partition[2] <= horizon]
+    for name, _, _ in partitions:
+        try:
+            with engine.begin() as connection:
+                connection.execute(text("SET LOCAL lock_timeout = '5s'"))
+                if connection.execute(
+                    text(f"SELECT 1 FROM {name} WHERE created > :watermark LIMIT 1"), {"watermark": watermark}
+                ).first():
+                    continue
+                connection.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+        except Exception as e:
+            logger.warning(f"Could not drop partition {name}: {e}")
+    return dropped
+
+
+def run_retention(engine, now: Optional[datetime] = None) -> dict:
+    now = now or datetime.now()
+    started = time.perf_counter()
+    # On the database clock, which sets `created`
+    watermark = compact_rollups(engine)
+    with Session(engine) as session:
+        projects = session.execute(select(UserProject)).scalars().all()
+
+    result = {"dropped_partitions": [], "deleted_logs": 0, "deleted_event_ids": 0, "deleted_rollup_rows": 0}
+    horizons = {project.id: raw_horizon(project, now) for project in projects}
+    if projects and all(horizons.values()):
+        # Partitions are shared by all projects
+        result["dropped_partitions"] = drop_expired_partitions(engine, min(horizons.values()), watermark)
+
+    for project in projects:
+        if horizon := horizons[project.id]:
+            result["deleted_logs"] += delete_in_batches(engine, APILog.__table__, [APILog.id, APILog.created_at], [
+                APILog.user_project_id == project.id, APILog.created_at < horizon, APILog.created <= watermark,
+            ])
+            result["deleted_event_ids"] += delete_in_batches(
+                engine, APILogEvent.__table__, [APILogEvent.user_project_id, APILogEvent.event_id],
+                [APILogEvent.user_project_id == project.id, APILogEvent.created < horizon],
+            )
+        if horizon := rollup_horizon(project, now):
+            for model in (ROLLUPS["hour"], ROLLUPS["day"]):
+                result["deleted_rollup_rows"] += delete_in_batches(
+                    engine, model.__table__, [model.user_project_id, model.bucket, model.is_bot],
+                    [model.user_project_id == project.id, model.bucket < horizon],
+                )
+            dimensions = APILogDimensionDaily
+            result["deleted_rollup_rows"] += delete_in_batches(
+                engine, dimensions.__table__,
+                [dimensions.user_project_id, dimensions.day, dimensions.dimension, dimensions.value, dimensions.is_bot],
+                [dimensions.user_project_id == project.id, dimensions.day < horizon],
+            )
+    minutely = ROLLUPS["minute"]
+    result["deleted_rollup_rows"] += delete_in_batches(
+        engine, minutely.__table__, [minutely.user_project_id, minutely.bucket, minutely.is_bot],
+        [minutely.bucket < now - timedelta(days=MINUTE_ROLLUP_RETENTION_DAYS)],
+    )
+
+    last_run.clear()
+    last_run.update(result, finished=datetime.now().isoformat(), seconds=round(time.perf_counter() - started, 3))
+    return result
+
+
+async def retention_loop(engine, period: float):
+    while True:
+        try:
+            result = await asyncio.to_thread(run_retention, engine)
+            logger.info(f"Retention run: {result}")
+        except Exception as e:
+            logger.error(f"Error in retention run: {e}")
+        await asyncio.sleep(period)
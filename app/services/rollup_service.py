@@ -0,0 +1,245 @@
+"""
+Minute, hourly and daily rollups of apilog for the stats charts, and daily
+per-dimension counts for the device stats.
+
+compact_rollups folds the logs ingested since the watermark (by `created`)
+into the rollup tables, bucketed by created_at, and advances the watermark
+in the same transaction. Every log is counted exactly once, however old its
+created_at is.
+
+`created` is set by the database at insert, so it is never later than the
+commit, and the watermark stays behind the start of every transaction still
+writing. A log committed after the watermark passed its `created` would be
+skipped by the rollups, then deleted by retention as if it had been counted.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import (DateTime, String, case, cast, func, literal, select,
+                        text, type_coerce, update)
+from sqlmodel import Session
+
+from app.config import ROLLUP_LAG, ROLLUP_STEP
+from app.database import dialect_insert, insert_ignore
+from app.models.apilog import APILog, database_now
+from app.models.apilogrollup import (APILogDaily, APILogDimensionDaily,
+                                     APILogHourly, APILogMinutely,
+                                     RollupWatermark)
+from app.models.useragent import UserAgent
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS = {"minute": APILogMinutely, "hour": APILogHourly, "day": APILogDaily}
+WATERMARK = "apilog_rollup"
+ROLLUP_KEYS = ("user_project_id", "bucket", "is_bot")
+ROLLUP_COUNTS = (
+    "requests", "count_2xx", "count_3xx", "count_4xx", "count_5xx", "response_time_sum", "response_time_count",
+)
+# Device stats dimensions: dimension name -> apilog column counted per value
+DIMENSIONS = {"user_agent": APILog.user_agent_id, "response_code": APILog.response_code}
+DIMENSION_KEYS = ("user_project_id", "day", "dimension", "value", "is_bot")
+BUCKET_STEPS = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+# SQLAlchemy's text format for SQLite datetimes, which compare as strings there
+SQLITE_BUCKET_FORMATS = {
+    "minute": "%Y-%m-%d %H:%M:00.000000", "hour": "%Y-%m-%d %H:00:00.000000", "day": "%Y-%m-%d 00:00:00.000000",
+}
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(second=0, microsecond=0)
+
+
+def full_buckets(start: datetime, end: datetime, granularity: str) -> Tuple[datetime, datetime]:
+    """
+    [first, last) bounds of the `granularity` buckets lying wholly inside
+    [start, end]. The bucket holding `end` is never whole, since the window
+    stops at `end`. Empty when first >= last.
+    """
+    first = bucket_start(start, granularity)
+    if first < start:
+        first += BUCKET_STEPS[granularity]
+    return first, bucket_start(end, granularity)
+
+
+def bucket_expression(column, granularity: str, dialect_name: str):
+    if dialect_name == "postgresql":
+        return func.date_trunc(granularity, column)
+    # Read back as a datetime, like date_trunc
+    return type_coerce(func.strftime(SQLITE_BUCKET_FORMATS[granularity], column), DateTime)
+
+
+def rollup_select(granularity: str, dialect_name: str, lower: datetime, upper: datetime):
+    """Per (project, bucket, is_bot) counts of the logs ingested in (lower, upper]."""
+    bucket = bucket_expression(APILog.created_at, granularity, dialect_name)
+    is_bot = func.coalesce(UserAgent.is_bot, False)
+    status_counts = [
+        func.count(case((APILog.response_code.between(low, low + 99), 1), else_=None)).label(f"count_{low // 100}xx")
+        for low in (200, 300, 400, 500)
+    ]
+    return (
+        select(
+            APILog.user_project_id,
+            bucket.label("bucket"),
+            is_bot.label("is_bot"),
+            func.count().label("requests"),
+            *status_counts,
+            func.coalesce(func.sum(APILog.response_time), 0).label("response_time_sum"),
+            func.count(APILog.response_time).label("response_time_count"),
+        )
+        .select_from(APILog)
+        .outerjoin(UserAgent, UserAgent.id == APILog.user_agent_id)
+        .where(APILog.created > lower, APILog.created <= upper)
+        .group_by(APILog.user_project_id, bucket, is_bot)
+    )
+
+
+def dimension_select(dimension: str, dialect_name: str, lower: datetime, upper: datetime):
+    """Per (project, day, value, is_bot) counts of `dimension` for the logs ingested in (lower, upper]."""
+    day = bucket_expression(APILog.created_at, "day", dialect_name)
+    value = func.coalesce(cast(DIMENSIONS[dimension], String), "")
+    is_bot = func.coalesce(UserAgent.is_bot, False)
+    return (
+        select(
+            APILog.user_project_id,
+            day.label("day"),
+            literal(dimension).label("dimension"),
+            value.label("value"),
+            is_bot.label("is_bot"),
+            func.count().label("requests"),
+        )
+        .select_from(APILog)
+        .outerjoin(UserAgent, UserAgent.id == APILog.user_agent_id)
+        .where(APILog.created > lower, APILog.created <= upper)
+        .group_by(APILog.user_project_id, day, value, is_bot)
+    )
+
+
+def add_to_rollup(connection, model, rows_select, keys=ROLLUP_KEYS, counts=ROLLUP_COUNTS):
+    """Add the counts selected by `rows_select` onto the rows of `model`, creating missing ones."""
+    table = model.__table__
+    statement = dialect_insert(table, connection.dialect.name).from_select(keys + counts, rows_select)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={column: table.c[column] + statement.excluded[column] for column in counts},
+    ))
+
+
+def read_watermark(connection, for_update: bool = False) -> Optional[datetime]:
+    query = select(RollupWatermark.watermark).where(RollupWatermark.name == WATERMARK)
+    return connection.execute(query.with_for_update() if for_update else query).scalar()
+
+
+def compaction_limit(connection, now: Optional[datetime], lag: float) -> datetime:
+    """
+    Latest `created` up to which every log is committed: `lag` seconds before
+    `now` (the database clock by default), and on PostgreSQL before the start
+    of the oldest other transaction that has written, whose logs may still
+    commit with that start as `created`.
+    """
+    if connection.dialect.name != "postgresql":
+        return (now or connection.execute(select(database_now())).scalar()) - timedelta(seconds=lag)
+    clock, oldest_writer = connection.execute(text(
+        "SELECT LOCALTIMESTAMP, (SELECT min(xact_start)::timestamp FROM pg_stat_activity "
+        "WHERE datname = current_database() AND backend_xid IS NOT NULL AND pid <> pg_backend_pid())"
+    )).one()
+    limit = (now or clock) - timedelta(seconds=lag)
+    if oldest_writer:
+        limit = min(limit, oldest_writer - timedelta(microseconds=1))
+    return limit
+
+
+def compact_rollups(engine, now: Optional[datetime] = None, lag: float = ROLLUP_LAG, step: float = ROLLUP_STEP) -> datetime:
+    """
+    Fold the logs ingested since the watermark, up to compaction_limit, into
+    every rollup, `step` seconds of ingest time per transaction. Returns the
+    new watermark.
+    """
+    with engine.begin() as connection:
+        limit = compaction_limit(connection, now, lag)
+        if read_watermark(connection) is None:
+            first = connection.execute(select(func.min(APILog.created))).scalar()
+            start = first - timedelta(microseconds=1) if first else limit
+            connection.execute(
+                insert_ignore(RollupWatermark.__table__, connection.dialect.name).values(name=WATERMARK, watermark=start)
+            )
+
+    while True:
+        with engine.begin() as connection:
+            # The row lock serializes workers compacting at the same time
+            watermark = read_watermark(connection, for_update=True)
+            if watermark >= limit:
+                return watermark
+            upper = min(watermark + timedelta(seconds=step), limit)
+            for granularity, model in ROLLUPS.items():
+                add_to_rollup(connection, model, rollup_select(granularity, connection.dialect.name, watermark, upper))
+            for dimension in DIMENSIONS:
+                add_to_rollup(
+                    connection, APILogDimensionDaily,
+                    dimension_select(dimension, connection.dialect.name, watermark, upper),
+                    DIMENSION_KEYS, ("requests",),
+                )
+            connection.execute(
+                update(RollupWatermark.__table__).where(RollupWatermark.name == WATERMARK).values(watermark=upper)
+            )
+
+
+def rollup_totals(
+    db: Session, granularity: str, project_id, start: datetime, end: datetime, bots_only: bool = False,
+) -> Dict[datetime, Tuple]:
+    """
+    (2xx, 3xx, 4xx, 5xx, response time sum, response time count) per bucket of
+    the `granularity` rollup starting in [start, end). Callers pass bucket
+    bounds, see full_buckets.
+    """
+    model = ROLLUPS[granularity]
+    query = (
+        select(
+            model.bucket,
+            func.sum(model.count_2xx), func.sum(model.count_3xx), func.sum(model.count_4xx), func.sum(model.count_5xx),
+            func.sum(model.response_time_sum), func.sum(model.response_time_count),
+        )
+        .where(model.user_project_id == project_id)
+        .where(model.bucket >= start, model.bucket < end)
+        .group_by(model.bucket)
+    )
+    if bots_only:
+        query = query.where(model.is_bot)
+    return {row[0]: tuple(row[1:]) for row in db.execute(query)}
+
+
+def dimension_totals(
+    db: Session, project_id, start_day: Optional[datetime], end_day: Optional[datetime], bots_only: bool = False,
+) -> List[Tuple[str, str, int]]:
+    """(dimension, value, requests) of the daily dimension rollup over the days in [start_day, end_day)."""
+    model = APILogDimensionDaily
+    query = (
+        select(model.dimension, model.value, func.sum(model.requests))
+        .where(model.user_project_id == project_id)
+        .group_by(model.dimension, model.value)
+    )
+    if start_day:
+        query = query.where(model.day >= start_day)
+    if end_day:
+        query = query.where(model.day < end_day)
+    if bots_only:
+        query = query.where(model.is_bot)
+    return db.execute(query).all()
+
+
+def current_watermark(db: Session) -> Optional[datetime]:
+    return read_watermark(db.connection())
+
+
+async def rollup_loop(engine, period: float):
+    while True:
+        try:
+            await asyncio.to_thread(compact_rollups, engine)
+        except Exception as e:
+            logger.error(f"Error compacting rollups: {e}")
+        await asyncio.sleep(period)
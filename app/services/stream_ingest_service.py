@@ -0,0 +1,168 @@
+import json
+import logging
+import zlib
+from typing import AsyncIterator, Awaitable, Callable, List
+
+from pydantic import ValidationError
+
+from app.schemas.apilog import APILogCreate
+
+logger = logging.getLogger(__name__)
+
+
+class LineTooLong(Exception):
+    pass
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], gzipped: bool, max_line_bytes: int):
+    """
+    Yield (line_number, line_or_exception) for an NDJSON byte stream, decompressing
+    gzip on the fly. Every member of a multi-member gzip stream (concatenated .gz
+    files) is read. Lines longer than `max_line_bytes` are skipped and reported
+    as LineTooLong instead of being buffered.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+    # No input fed to the current gzip member yet
+    member_start = True
+    buffer = b""
+    line_number = 0
+    skipping = False
+
+    def split(data: bytes):
+        nonlocal buffer, line_number, skipping
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if skipping:
+                skipping = False
+                yield line_number, LineTooLong()
+            elif len(line) > max_line_bytes:
+                yield line_number, LineTooLong()
+            else:
+                yield line_number, line
+        if len(buffer) > max_line_bytes:
+            # Drop the partial line now; it is reported once its newline arrives
+            buffer = b""
+            skipping = True
+
+    def inflate(data: bytes):
+        nonlocal decompressor, member_start
+        while True:
+            if member_start:
+                # Like gzip.open, ignore the zero padding some writers leave between members
+                data = data.lstrip(b"\0")
+                if not data:
+                    return
+                member_start = False
+            # Bound each step so a small compressed chunk cannot inflate unboundedly
+            yield decompressor.decompress(data, max_line_bytes)
+            if decompressor.eof:
+                # The member ended; whatever follows starts the next one. Checked first,
+                # since the rest of the input is then in unconsumed_tail as well.
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                member_start = True
+            elif decompressor.unconsumed_tail:
+                data = decompressor.unconsumed_tail
+            else:
+                return
+
+    async for chunk in chunks:
+        for data in inflate(chunk) if decompressor else (chunk,):
+            for item in split(data):
+                yield item
+    if decompressor:
+        for item in split(decompressor.flush()):
+            yield item
+    if buffer or skipping:
+        line_number += 1
+        yield line_number, LineTooLong() if skipping else buffer
+
+
+class StreamIngestResult:
+    def __init__(self, max_errors: int):
+        self.max_errors = max_errors
+        self.lines = 0
+        self.saved = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors = []
+        self.errors_truncated = False
+
+    def error(self, line: int, message, last_line: int = None):
+        if len(self.errors) >= self.max_errors:
+            self.errors_truncated = True
+            return
+        error = {"line": line, "error": message}
+        if last_line is not None:
+            error["last_line"] = last_line
+        self.errors.append(error)
+
+    def dict(self):
+        return {
+            "lines": self.lines,
+            "saved": self.saved,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.errors_truncated,
+        }
+
+
+async def ingest_ndjson(
+    chunks: AsyncIterator[bytes],
+    flush: Callable[[List[APILogCreate]], Awaitable[int]],
+    gzipped: bool = False,
+    batch_size: int = 500,
+    max_line_bytes: int = 1 << 20,
+    max_errors: int = 100,
+) -> StreamIngestResult:
+    """
+    Validate an NDJSON stream of APILogCreate objects line by line and pass
+    valid entries to `flush` in batches of `batch_size`; `flush` returns how
+    many of them were saved (the rest were duplicates). Invalid lines are
+    recorded (up to `max_errors` messages) and skipped; a failed flush is
+    reported for its line range and does not stop the upload.
+    """
+    result = StreamIngestResult(max_errors)
+    batch = []
+    batch_lines = []
+
+    async def flush_batch():
+        try:
+            saved = await flush(batch)
+            result.saved += saved
+            result.duplicates += len(batch) - saved
+        except Exception as e:
+            logger.error(f"Error saving streamed logs (lines {batch_lines[0]}-{batch_lines[-1]}): {e}")
+            result.failed += len(batch)
+            result.error(batch_lines[0], "batch could not be saved", last_line=batch_lines[-1])
+        batch.clear()
+        batch_lines.clear()
+
+    try:
+        async for line_number, line in iter_lines(chunks, gzipped, max_line_bytes):
+            if isinstance(line, LineTooLong):
+                result.lines += 1
+                result.failed += 1
+                result.error(line_number, f"line exceeds {max_line_bytes} bytes")
+                continue
+            if not line.strip():
+                continue
+            result.lines += 1
+            try:
+                batch.append(APILogCreate.parse_obj(json.loads(line)))
+                batch_lines.append(line_number)
+            except (ValueError, ValidationError) as e:
+                # JSONDecodeError and UnicodeDecodeError are ValueErrors
+                result.failed += 1
+                result.error(line_number, e.errors() if isinstance(e, ValidationError) else str(e))
+                continue
+            if len(batch) >= batch_size:
+                await flush_batch()
+    except zlib.error as e:
+        result.error(result.lines + 1, f"invalid gzip stream: {e}")
+    if batch:
+        await flush_batch()
+    return result
@@ -0,0 +1,65 @@
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.config import (SELF_TELEMETRY_FLUSH_INTERVAL,
+                        SELF_TELEMETRY_MAX_BATCH_SIZE,
+                        SELF_TELEMETRY_QUEUE_MAX_SIZE)
+from app.schemas.apilog import APILogCreate
+from app.services.ingest_service import IngestBuffer
+from app.services.metrics_service import register_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def start_self_telemetry(app: FastAPI, project_id: Optional[str]):
+    """
+    Start the sink that logs this service's own requests into `project_id`.
+    Records are queued in memory and written through the bulk insert path on
+    an interval; when the queue is full they are dropped rather than slowing
+    requests down. Does nothing if `project_id` is unset.
+    """
+    app.state.telemetry_sink = None
+    app.state.telemetry_project_id = None
+    if not project_id:
+        return
+    app.state.telemetry_project_id = uuid.UUID(project_id)
+    app.state.telemetry_sink = IngestBuffer(
+        max_size=SELF_TELEMETRY_QUEUE_MAX_SIZE,
+        max_batch_size=SELF_TELEMETRY_MAX_BATCH_SIZE,
+        flush_interval=SELF_TELEMETRY_FLUSH_INTERVAL,
+        overflow="drop",
+    )
+    app.state.telemetry_sink.start()
+    register_metrics("self_telemetry", app.state.telemetry_sink.stats)
+
+
+async def stop_self_telemetry(app: FastAPI):
+    """Write out whatever is still queued."""
+    if sink := getattr(app.state, "telemetry_sink", None):
+        await sink.stop()
+
+
+class SelfTelemetryMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        created_at = datetime.now()
+        start_time = time.perf_counter()
+        response = await call_next(request)
+
+        if sink := getattr(request.app.state, "telemetry_sink", None):
+            apilog = APILogCreate(
+                url=str(request.url),
+                ip_address=request.client.host if request.client else "",
+                user_agent=request.headers.get("User-Agent"),
+                response_code=response.status_code,
+                response_time=time.perf_counter() - start_time,
+                created_at=created_at,
+            )
+            await sink.put(request.app.state.telemetry_project_id, apilog)
+
+        return response
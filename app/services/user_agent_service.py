@@ -0,0 +1,74 @@
+import logging
+from functools import lru_cache
+from types import MappingProxyType
+
+from user_agents import parse
+
+from app.config import USER_AGENT_CACHE_SIZE
+from app.services.bot_match_service import BotMatcher, reset_bot_matcher
+from app.services.invalidation_service import register_invalidation_handler
+from app.services.metrics_service import register_metrics
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=USER_AGENT_CACHE_SIZE)
+def _parse_user_agent(user_agent: str, bot_matcher: BotMatcher):
+    # The matcher is part of the key so a rebuilt matcher never serves stale bot ids
+    details = {"bot_id": bot_matcher.match(user_agent)}
+    try:
+        parsed_user_agent = parse(user_agent)
+        details.update({
+            "user_agent_browser_family": parsed_user_agent.browser.family,
+            "user_agent_browser_version": parsed_user_agent.browser.version_string,
+            "user_agent_os_family": parsed_user_agent.os.family,
+            "user_agent_os_version": parsed_user_agent.os.version_string,
+            "user_agent_device_family": parsed_user_agent.device.family,
+            "user_agent_device_brand": parsed_user_agent.device.brand,
+            "user_agent_device_model": parsed_user_agent.device.model,
+            "is_mobile": parsed_user_agent.is_mobile,
+            "is_tablet": parsed_user_agent.is_tablet,
+            "is_pc": parsed_user_agent.is_pc,
+            "is_touch_capable": parsed_user_agent.is_touch_capable,
+            "is_bot": parsed_user_agent.is_bot,
+        })
+    except Exception:
+        logger.exception(f"Error parsing user agent {user_agent!r}")
+    return MappingProxyType(details)
+
+
+def get_user_agent_details(user_agent: str, bot_matcher: BotMatcher):
+    """
+    Parsed browser/os/device fields, is_* flags and bot id for a user agent,
+    keyed by UserAgent column name. Results are cached per UA string and
+    shared, hence read-only.
+    """
+    return _parse_user_agent(user_agent, bot_matcher)
+
+
+def reset_user_agent_cache():
+    """
+    Call after BotInfo rows change so bot ids are recomputed. Resets this
+    process only; other processes reset through the "user_agents" invalidation.
+    """
+    reset_bot_matcher()
+    _parse_user_agent.cache_clear()
+
+
+# Bots are added through the dashboard service, which publishes the invalidation
+register_invalidation_handler("user_agents", lambda key: reset_user_agent_cache())
+
+
+def user_agent_cache_stats():
+    info = _parse_user_agent.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0,
+    }
+
+
+register_metrics("user_agent_cache", user_agent_cache_stats)
@@ -0,0 +1,117 @@
+"""
+Compare single-log ingestion throughput of the async engine against the old
+sync-in-async path (blocking Session calls inside the coroutine) at several
+levels of concurrency.
+
+    python -m benchmarks.bench_async_ingest --database-url postgresql://... --requests 2000
+    python -m benchmarks.bench_async_ingest --concurrency 1 8 32 128 --latency 0.002
+
+Each request resolves the API key without the key cache and writes one log,
+like POST /api/log with the ingest queue disabled. `--latency` adds a fixed
+sleep per database round trip (time.sleep on the sync path, asyncio.sleep on
+the async one) to approximate a remote database when running against a local
+one. Postgres is the interesting target; SQLite serialises writers either way.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from sqlmodel import Session, create_engine, select
+
+from app.crud.apilog import (build_apilog, create_apilog, load_bot_infos,
+                             load_bot_matcher)
+from app.database import insert_ignore
+from app.models.apikey import APIKey
+from app.models.user import UserProject
+from app.models.useragent import UserAgent
+from app.services.bot_match_service import get_bot_matcher
+from benchmarks.bench_bulk_ingest import make_payload, setup
+
+
+def create_sync_engine(database_url: str):
+    if database_url.startswith("sqlite"):
+        return create_engine(database_url, connect_args={"check_same_thread": False})
+    return create_engine(database_url, pool_size=20, max_overflow=100)
+
+
+async def create_api_key(session_maker, project_id):
+    async with session_maker() as session:
+        api_key = APIKey(key=uuid.uuid4().hex, user_project_id=project_id)
+        session.add(api_key)
+        await session.commit()
+        return api_key.key
+
+
+def api_key_query(key):
+    return select(UserProject).join(APIKey, APIKey.user_project_id == UserProject.id).where(APIKey.key == key)
+
+
+async def sync_request(engine, key, entry, latency):
+    # The pre-async get_api_key + create_apilog: every DB call blocks the loop
+    with Session(engine) as session:
+        time.sleep(latency)
+        user_project = session.exec(api_key_query(key)).first()
+        bot_matcher = get_bot_matcher(lambda: load_bot_infos(session))
+        db_apilog, user_agent_row = build_apilog(bot_matcher, user_project.id, entry)
+        if user_agent_row:
+            session.execute(insert_ignore(UserAgent.__table__, engine.dialect.name), [user_agent_row])
+        session.add(db_apilog)
+        time.sleep(latency)
+        session.commit()
+        session.refresh(db_apilog)
+
+
+async def async_request(session_maker, key, entry, latency):
+    async with session_maker() as session:
+        await asyncio.sleep(latency)
+        user_project = (await session.exec(api_key_query(key))).first()
+        await asyncio.sleep(latency)
+        await create_apilog(session, user_project.id, entry)
+
+
+async def drive(handler, payload, concurrency):
+    queue = iter(payload)
+
+    async def worker():
+        for entry in queue:
+            await handler(entry)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def run(args):
+    if args.database_url in ("sqlite://", "sqlite:///:memory:"):
+        raise SystemExit("In-memory SQLite gives each engine its own database; use a file or Postgres URL")
+    async_engine, session_maker, project_id = await setup(args.database_url)
+    key = await create_api_key(session_maker, project_id)
+    sync_engine = create_sync_engine(args.database_url)
+
+    async with session_maker() as session:
+        await load_bot_matcher(session)
+    payload = make_payload(args.requests)
+
+    print(f"{'concurrency':>11} {'sync-in-async':>15} {'async':>15}")
+    for concurrency in args.concurrency:
+        sync_elapsed = await drive(lambda entry: sync_request(sync_engine, key, entry, args.latency), payload, concurrency)
+        async_elapsed = await drive(lambda entry: async_request(session_maker, key, entry, args.latency), payload, concurrency)
+        print(f"{concurrency:>11} {len(payload) / sync_elapsed:>11,.0f} r/s {len(payload) / async_elapsed:>11,.0f} r/s")
+
+    sync_engine.dispose()
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///bench_async_ingest.db")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--latency", type=float, default=0.0, help="Extra seconds per DB round trip")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Check BotMatcher against the old linear get_bot_id scan on the `instances`
+corpus in user_agents.json, then compare the per-UA match cost.
+
+    python -m benchmarks.bench_bot_matcher
+"""
+import argparse
+import json
+import re
+import time
+
+from app.services.bot_match_service import BotMatcher
+
+
+def linear_scan(bot_infos, user_agent):
+    # The pre-matcher implementation of get_bot_id
+    for botinfo in bot_infos:
+        if pattern := botinfo.get('pattern'):
+            compiled_pattern = re.compile(pattern)
+            if compiled_pattern.search(user_agent):
+                return botinfo.get("id")
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-agents", default="user_agents.json")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(args.user_agents) as f:
+        data = json.load(f)
+    bot_infos = [{"id": index, "pattern": bot.get("pattern")} for index, bot in enumerate(data)]
+    corpus = [instance for bot in data for instance in bot.get("instances", [])]
+    # Browser traffic never matches and exercises the full scan
+    corpus += [
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+        "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Mobile/15E148 Safari/604.1",
+    ] * 50
+
+    start = time.perf_counter()
+    matcher = BotMatcher(bot_infos)
+    build_time = time.perf_counter() - start
+    print(f"Built matcher for {len(matcher)} patterns in {build_time * 1000:.1f} ms")
+
+    mismatches = [ua for ua in corpus if matcher.match(ua) != linear_scan(bot_infos, ua)]
+    if mismatches:
+        for ua in mismatches[:20]:
+            print("MISMATCH", matcher.match(ua), linear_scan(bot_infos, ua), ua)
+        raise SystemExit(f"{len(mismatches)} of {len(corpus)} user agents differ from the linear scan")
+    print(f"Identical results on {len(corpus)} user agents")
+
+    for name, match in (("linear scan", lambda ua: linear_scan(bot_infos, ua)), ("BotMatcher", matcher.match)):
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            for ua in corpus:
+                match(ua)
+        per_ua = (time.perf_counter() - start) / (args.rounds * len(corpus))
+        print(f"{name:<12} {per_ua * 1e6:,.1f} us/UA")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Compare rows/sec of the original per-entry ingest path against create_apilog_bulk.
+
+    python -m benchmarks.bench_bulk_ingest --rows 1000
+    python -m benchmarks.bench_bulk_ingest --database-url postgresql://... --rows 5000
+
+Defaults to an in-memory SQLite database (through aiosqlite). Tables are
+created if missing and the benchmark rows are written to a throwaway project.
+
+The baseline is the per-entry create_apilog that /api/log/bulk looped over
+before the bulk path, not today's create_apilog (which shares the bulk path's
+caches). It is reproduced here against the current schema: every entry parses
+its user agent from scratch, compiles and tries each bot pattern in turn,
+writes its UserAgent row, and is committed and refreshed on its own.
+"""
+import argparse
+import asyncio
+import random
+import re
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from user_agents import parse
+
+from app.config import get_async_database_url
+from app.crud.apilog import (build_user_agent_row, create_apilog_bulk,
+                             get_response_code_text, get_url_components)
+from app.database import insert_ignore
+from app.models import apikey, apilog, botinfo, user, useragent
+from app.models.apilog import APILog
+from app.models.botinfo import BotInfo
+from app.models.useragent import UserAgent
+from app.schemas.apilog import APILogCreate
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "curl/8.4.0",
+]
+
+
+def make_payload(rows: int):
+    return [
+        APILogCreate(
+            url=f"https://api.example.com/items/{i}?page={i % 7}&q=test",
+            ip_address=f"10.0.{i % 255}.{i % 13}",
+            user_agent=random.choice(USER_AGENTS),
+            response_code=random.choice([200, 200, 200, 301, 404, 500]),
+            response_time=random.random(),
+        )
+        for i in range(rows)
+    ]
+
+
+def create_async_bench_engine(database_url: str):
+    url = get_async_database_url(database_url)
+    if database_url in ("sqlite://", "sqlite:///:memory:"):
+        return create_async_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    return create_async_engine(url)
+
+
+async def create_project(session_maker):
+    async with session_maker() as session:
+        db_user = user.User(name="bench", email=f"bench-{time.time_ns()}@example.com", password_hash="x")
+        session.add(db_user)
+        await session.commit()
+        project = user.UserProject(name="bench", user_id=db_user.id)
+        session.add(project)
+        await session.commit()
+        return project.id
+
+
+async def setup(database_url: str):
+    engine = create_async_bench_engine(database_url)
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+    session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    return engine, session_maker, await create_project(session_maker)
+
+
+def legacy_user_agent_details(user_agent: str) -> dict:
+    parsed = parse(user_agent)
+    return {
+        "user_agent_browser_family": parsed.browser.family,
+        "user_agent_browser_version": parsed.browser.version_string,
+        "user_agent_os_family": parsed.os.family,
+        "user_agent_os_version": parsed.os.version_string,
+        "user_agent_device_family": parsed.device.family,
+        "user_agent_device_brand": parsed.device.brand,
+        "user_agent_device_model": parsed.device.model,
+        "is_mobile": parsed.is_mobile,
+        "is_tablet": parsed.is_tablet,
+        "is_pc": parsed.is_pc,
+        "is_touch_capable": parsed.is_touch_capable,
+        "is_bot": parsed.is_bot,
+    }
+
+
+def legacy_bot_id(user_agent: str, bot_infos):
+    for bot_info in bot_infos:
+        if (pattern := bot_info.get("pattern")) and re.compile(pattern).search(user_agent):
+            return bot_info.get("id")
+    return None
+
+
+async def legacy_create_apilog(session, project_id, entry: APILogCreate, bot_infos):
+    """The original per-entry create_apilog, on the current schema."""
+    db_apilog = APILog(**entry.dict())
+    db_apilog.user_project_id = project_id
+    if code := entry.response_code:
+        db_apilog.response_code_text = get_response_code_text(code)
+    if entry.url:
+        url, path, query_params = get_url_components(entry.url)
+        db_apilog.path = path
+        db_apilog.query_params = query_params or None
+    if entry.user_agent:
+        user_agent_row = build_user_agent_row(entry.user_agent, legacy_user_agent_details(entry.user_agent))
+        await session.execute(insert_ignore(UserAgent.__table__, session.bind.dialect.name), [user_agent_row])
+        db_apilog.user_agent_id = user_agent_row["id"]
+        db_apilog.bot_id = legacy_bot_id(entry.user_agent, bot_infos)
+    session.add(db_apilog)
+    await session.commit()
+    await session.refresh(db_apilog)
+    return db_apilog
+
+
+async def run_loop(session_maker, project_id, payload):
+    async with session_maker() as session:
+        # The original loaded the bots once per process too
+        bot_infos = [bot_info.dict() for bot_info in (await session.exec(select(BotInfo))).all()]
+        for entry in payload:
+            await legacy_create_apilog(session, project_id, entry, bot_infos)
+
+
+async def run_bulk(session_maker, project_id, payload):
+    async with session_maker() as session:
+        await create_apilog_bulk(session, project_id, payload)
+
+
+async def run(args):
+    engine, session_maker, project_id = await setup(args.database_url)
+    payload = make_payload(args.rows)
+
+    for name, runner in (("per-entry baseline", run_loop), ("create_apilog_bulk", run_bulk)):
+        start = time.perf_counter()
+        await runner(session_maker, project_id, payload)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<20} {args.rows} rows in {elapsed:.2f}s -> {args.rows / elapsed:,.0f} rows/sec")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite://")
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Measure the per-request overhead the tracking middleware adds to an ASGI app,
+against a local fake WhoWhyWhen server.
+
+    pip install ./clients/python
+    python -m benchmarks.bench_client_sdk --requests 2000 --concurrency 16
+
+Compares no tracking, the old per-request httpx.AsyncClient middleware from
+docs/INTEGRATION.md, and WhoWhyWhenASGIMiddleware. The fake server validates
+every received entry against app.schemas.apilog.APILogCreate and reports how
+many arrived, so the SDK is checked against the real schema as well.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from app.schemas.apilog import APILogCreate
+from whowhywhen import WhoWhyWhenASGIMiddleware, WhoWhyWhenClient
+
+
+class FakeServer:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.received = 0
+        self.invalid = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        entries = json.loads(body)
+        if not isinstance(entries, list):
+            entries = [entries]
+        for entry in entries:
+            try:
+                APILogCreate.parse_obj(entry)
+                self.received += 1
+            except ValueError:
+                self.invalid += 1
+        await asyncio.sleep(self.latency)
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"status": "ok"}'})
+
+
+async def hello_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"hello"})
+
+
+class PerRequestMiddleware:
+    # The pre-SDK integration: one new AsyncClient and POST /api/log per request
+    def __init__(self, app, api_url):
+        self.app = app
+        self.api_url = api_url
+
+    async def __call__(self, scope, receive, send):
+        start = time.perf_counter()
+        await self.app(scope, receive, send)
+        try:
+            async with httpx.AsyncClient() as client:
+                await client.post(
+                    f"{self.api_url}/api/log",
+                    headers={"X-API-KEY": "bench"},
+                    json={"url": scope["path"], "ip_address": "127.0.0.1", "response_code": 200,
+                          "response_time": time.perf_counter() - start},
+                    timeout=2.0,
+                )
+        except Exception:
+            pass
+
+
+async def drive(app, requests: int, concurrency: int):
+    latencies = []
+    transport = httpx.ASGITransport(app=app, client=("10.0.0.1", 12345))
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as http:
+        remaining = iter(range(requests))
+
+        async def worker():
+            for i in remaining:
+                start = time.perf_counter()
+                await http.get(f"/items/{i}?page=1", headers={"User-Agent": "bench/1.0"})
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return elapsed, latencies
+
+
+async def run(args, api_url, server):
+    results = {}
+    results["no tracking"] = await drive(hello_app, args.requests, args.concurrency)
+    results["per-request POST"] = await drive(PerRequestMiddleware(hello_app, api_url), args.requests, args.concurrency)
+
+    client = WhoWhyWhenClient(api_key="bench", api_url=api_url, max_batch_size=args.batch_size)
+    received_before = server.received
+    results["WhoWhyWhen SDK"] = await drive(WhoWhyWhenASGIMiddleware(hello_app, client), args.requests, args.concurrency)
+    await client.aclose()
+
+    baseline = statistics.mean(results["no tracking"][1])
+    print(f"{'':<18} {'req/s':>9} {'mean':>9} {'p99':>9} {'overhead':>9}")
+    for name, (elapsed, latencies) in results.items():
+        mean = statistics.mean(latencies)
+        p99 = statistics.quantiles(latencies, n=100)[98]
+        print(f"{name:<18} {args.requests / elapsed:>9,.0f} {mean * 1e3:>7.2f}ms {p99 * 1e3:>7.2f}ms "
+              f"{(mean - baseline) * 1e6:>7,.0f}us")
+    print(f"SDK delivered {server.received - received_before}/{args.requests} logs, {server.invalid} invalid; {client.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--server-latency", type=float, default=0.005, help="Seconds the fake server takes per request")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = FakeServer(args.server_latency)
+    config = uvicorn.Config(server, host="127.0.0.1", port=args.port, log_level="warning", lifespan="off")
+    fake = uvicorn.Server(config)
+    thread = threading.Thread(target=fake.run, daemon=True)
+    thread.start()
+    while not fake.started:
+        time.sleep(0.05)
+
+    try:
+        asyncio.run(run(args, f"http://127.0.0.1:{args.port}", server))
+    finally:
+        fake.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
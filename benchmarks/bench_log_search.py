@@ -0,0 +1,139 @@
+"""
+Compare the log explorer's substring searches as sequential scans (plain
+ILIKE, the old query) against the indexed rewrite in search_conditions.
+
+    python -m benchmarks.bench_log_search --rows 2000000
+    python -m benchmarks.bench_log_search --database-url postgresql://... --rows 5000000
+
+Defaults to an in-memory SQLite database, where the rewrite goes through the
+apilog_search FTS5 trigram table. On Postgres it uses the pg_trgm GIN
+indexes; the scan baseline runs with index scans disabled. Every search is
+checked to match the same number of logs both ways.
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.crud.apilog import SEARCH_COLUMNS, search_conditions
+from app.models import apikey, apilog, apilogrollup, botinfo, user, useragent
+from app.models.apilog import APILog
+from app.schemas.apilog import APILogSearch
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148",
+    "curl/8.5.0",
+    "python-requests/2.32.3",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+]
+RESOURCES = ["orders", "items", "users", "invoices", "carts", "search", "health"]
+
+SEARCHES = [
+    ("q=firefox", None, "firefox"),
+    ("q=invoices/12", None, "invoices/12"),
+    ("q=10.7.3.", None, "10.7.3."),
+    ("user_agent=iphone", APILogSearch(user_agent="iphone"), None),
+    ("path=/api/orders/42", APILogSearch(path="/api/orders/42"), None),
+]
+
+
+def make_rows(project_id, rows: int, now: datetime):
+    for i in range(rows):
+        yield {
+            "id": uuid.uuid4(), "user_project_id": project_id,
+            "url": "https://api.example.com", "path": f"/api/{random.choice(RESOURCES)}/{random.randrange(100000)}",
+            "ip_address": f"10.{random.randrange(256)}.{random.randrange(256)}.{random.randrange(256)}",
+            "user_agent": random.choice(USER_AGENTS), "response_code": 200,
+            "created": now, "created_at": now - timedelta(seconds=i % 86400),
+        }
+
+
+def old_conditions(search_params, q):
+    """The ILIKE filters as they were before the indexed rewrite."""
+    conditions = []
+    if search_params and search_params.path:
+        conditions.append(APILog.path.ilike(f"{search_params.path}%"))
+    if search_params and search_params.user_agent:
+        conditions.append(APILog.user_agent.ilike(f"%{search_params.user_agent}%"))
+    if q:
+        conditions.append(sa.or_(*(getattr(APILog, name).ilike(f"%{q}%") for name in SEARCH_COLUMNS)))
+    return conditions
+
+
+def timed(fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite://")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.database_url.startswith("sqlite"):
+        engine = create_engine(args.database_url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(args.database_url)
+    SQLModel.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        db_user = user.User(name="bench", email=f"bench-{time.time_ns()}@example.com", password_hash="x")
+        session.add(db_user)
+        session.commit()
+        project = user.UserProject(name="bench-search", user_id=db_user.id)
+        session.add(project)
+        session.commit()
+        project_id = project.id
+
+    start = time.perf_counter()
+    rows = make_rows(project_id, args.rows, datetime.now())
+    while batch := [row for _, row in zip(range(args.batch_size), rows)]:
+        with engine.begin() as connection:
+            connection.execute(APILog.__table__.insert(), batch)
+    print(f"inserted {args.rows:,} rows in {time.perf_counter() - start:.1f}s")
+    with engine.begin() as connection:
+        connection.execute(sa.text("ANALYZE"))
+
+    failed = False
+    print(f"{'search':<24} {'matches':>9} {'scan ms':>10} {'indexed ms':>11} {'speedup':>8}")
+    for label, search_params, q in SEARCHES:
+        def count(conditions_for, scan):
+            with Session(engine) as session:
+                if scan and engine.dialect.name == "postgresql":
+                    session.execute(sa.text("SET LOCAL enable_bitmapscan = off"))
+                    session.execute(sa.text("SET LOCAL enable_indexscan = off"))
+                query = select(sa.func.count()).select_from(APILog).where(
+                    APILog.user_project_id == project_id, *conditions_for(session)
+                )
+                return session.execute(query).scalar()
+
+        scan_seconds, scan_count = timed(lambda: count(lambda session: old_conditions(search_params, q), True), args.repeat)
+        indexed_seconds, indexed_count = timed(
+            lambda: count(lambda session: search_conditions(session, search_params, q), False), args.repeat
+        )
+        print(f"{label:<24} {indexed_count:>9,} {scan_seconds * 1000:>10.1f} {indexed_seconds * 1000:>11.1f} "
+              f"{scan_seconds / indexed_seconds:>7.1f}x")
+        if scan_count != indexed_count:
+            print(f"  mismatch: scan found {scan_count}, indexed found {indexed_count}")
+            failed = True
+
+    if failed:
+        raise SystemExit("FAIL: indexed searches differ from scans")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Compare the old apilogqueryparam side table against the inline query_params
+JSON column: insert cost, reading a dashboard page with its params, and
+filtering by one key/value pair.
+
+    python -m benchmarks.bench_query_params --rows 20000
+    python -m benchmarks.bench_query_params --database-url postgresql://... --rows 200000
+
+Defaults to an in-memory SQLite database. On Postgres the inline filter is a
+JSONB containment test served by the GIN index.
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime
+
+import sqlalchemy as sa
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.crud.apilog import get_url_components, query_param_conditions
+from app.models import apikey, apilog, botinfo, user, useragent
+from app.models.apilog import APILog
+
+# The pre-JSON schema, outside SQLModel.metadata
+legacy_metadata = sa.MetaData()
+legacy_params = sa.Table(
+    "bench_apilogqueryparam", legacy_metadata,
+    sa.Column("id", sa.Uuid, primary_key=True),
+    sa.Column("api_log_id", sa.Uuid, index=True),
+    sa.Column("key", sa.String),
+    sa.Column("value", sa.String),
+)
+
+
+def make_rows(project_id, rows: int):
+    for i in range(rows):
+        url = f"https://api.example.com/items/{i}?page={i % 50}&sort={random.choice(['asc', 'desc'])}&q=term{i % 1000}"
+        _, path, query_params = get_url_components(url)
+        yield {
+            "id": uuid.uuid4(), "user_project_id": project_id, "url": url, "path": path,
+            "ip_address": "10.0.0.1", "user_agent": "", "created": datetime.now(), "created_at": datetime.now(),
+        }, query_params
+
+
+def timed(label, rows, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed * 1000:>9.1f} ms" + (f"  ({rows / elapsed:,.0f} rows/sec)" if rows else ""))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite://")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--reads", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.database_url.startswith("sqlite"):
+        engine = create_engine(args.database_url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(args.database_url)
+    SQLModel.metadata.create_all(engine)
+    legacy_metadata.create_all(engine)
+
+    with Session(engine) as session:
+        db_user = user.User(name="bench", email=f"bench-{time.time_ns()}@example.com", password_hash="x")
+        session.add(db_user)
+        session.commit()
+        legacy_project = user.UserProject(name="bench-legacy", user_id=db_user.id)
+        inline_project = user.UserProject(name="bench-inline", user_id=db_user.id)
+        session.add_all([legacy_project, inline_project])
+        session.commit()
+        legacy_project_id, inline_project_id = legacy_project.id, inline_project.id
+
+    legacy_data = list(make_rows(legacy_project_id, args.rows))
+    inline_data = list(make_rows(inline_project_id, args.rows))
+
+    def insert_legacy():
+        for start in range(0, len(legacy_data), args.batch_size):
+            batch = legacy_data[start:start + args.batch_size]
+            with engine.begin() as connection:
+                connection.execute(APILog.__table__.insert(), [row for row, _ in batch])
+                connection.execute(legacy_params.insert(), [
+                    {"id": uuid.uuid4(), "api_log_id": row["id"], "key": key, "value": value}
+                    for row, params in batch for key, value in params.items()
+                ])
+
+    def insert_inline():
+        for start in range(0, len(inline_data), args.batch_size):
+            batch = inline_data[start:start + args.batch_size]
+            with engine.begin() as connection:
+                connection.execute(APILog.__table__.insert(), [dict(row, query_params=params) for row, params in batch])
+
+    timed("insert: side table", args.rows, insert_legacy)
+    timed("insert: inline JSON", args.rows, insert_inline)
+
+    def page_query(project_id, offset):
+        return (
+            select(APILog).where(APILog.user_project_id == project_id)
+            .order_by(APILog.created_at.desc()).offset(offset).limit(args.page_size)
+        )
+
+    def read_legacy():
+        with Session(engine) as session:
+            for i in range(args.reads):
+                logs = session.exec(page_query(legacy_project_id, i * args.page_size % args.rows)).all()
+                params = session.execute(
+                    sa.select(legacy_params).where(legacy_params.c.api_log_id.in_([log.id for log in logs]))
+                ).all()
+                by_log = {}
+                for param in params:
+                    by_log.setdefault(param.api_log_id, []).append({"key": param.key, "value": param.value})
+
+    def read_inline():
+        with Session(engine) as session:
+            for i in range(args.reads):
+                logs = session.exec(page_query(inline_project_id, i * args.page_size % args.rows)).all()
+                [[{"key": key, "value": value} for key, value in (log.query_params or {}).items()] for log in logs]
+
+    timed(f"read {args.reads} pages: side table", 0, read_legacy)
+    timed(f"read {args.reads} pages: inline JSON", 0, read_inline)
+
+    def filter_legacy():
+        with Session(engine) as session:
+            matching = sa.select(legacy_params.c.api_log_id).where(legacy_params.c.key == "q", legacy_params.c.value == "term7")
+            query = select(sa.func.count()).select_from(APILog).where(
+                APILog.user_project_id == legacy_project_id, APILog.id.in_(matching)
+            )
+            return session.execute(query).scalar()
+
+    def filter_inline():
+        with Session(engine) as session:
+            query = select(sa.func.count()).select_from(APILog).where(
+                APILog.user_project_id == inline_project_id, *query_param_conditions(session, {"q": "term7"})
+            )
+            return session.execute(query).scalar()
+
+    legacy_count = timed("filter q=term7: side table", 0, filter_legacy)
+    inline_count = timed("filter q=term7: inline JSON", 0, filter_inline)
+    if legacy_count != inline_count:
+        raise SystemExit(f"Filter results differ: {legacy_count} vs {inline_count}")
+
+
+if __name__ == "__main__":
+    main()
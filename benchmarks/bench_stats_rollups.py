@@ -0,0 +1,122 @@
+"""
+Compare get_apilogs_stats on raw rows against the rollup path on a large project.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_stats_rollups --rows 10000000
+
+Generates `--rows` logs spread over the last 30 days into a new project
+(server side, with generate_series), compacts them into the rollups and
+times the default minute (1h), hourly (24h) and daily (30d) charts with and
+without rollups. Also checks that both paths return the same chart, for
+windows starting on a bucket boundary and for windows starting and ending
+mid-bucket, whose partial edge buckets come from the raw rows.
+Requires PostgreSQL 13+ with the migrations applied.
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlmodel import Session
+
+from app.config import APILOG_PARTITION_INTERVAL
+from app.crud.apilog import get_apilogs_stats
+from app.database import engine
+from app.models import user
+from app.services.partition_service import ensure_partitions
+from app.services.rollup_service import bucket_start, compact_rollups
+
+SPAN_SECONDS = 30 * 86400
+# Default chart windows
+WINDOWS = {"minute": timedelta(hours=1), "hour": timedelta(hours=24), "day": timedelta(days=30)}
+
+GENERATE = text("""
+INSERT INTO apilog (id, user_project_id, url, ip_address, user_agent, response_code, response_time, path,
+                    created, created_at)
+SELECT gen_random_uuid(), :project_id, 'https://api.example.com/items', '10.0.' || (i % 250) || '.1', '',
+       (ARRAY[200, 200, 200, 201, 301, 404, 500])[1 + i % 7], random(), '/items',
+       :now, :now - make_interval(secs => (i * 7919) % :span)
+FROM generate_series(:first, :last) AS i
+""")
+
+
+def create_project():
+    with Session(engine) as session:
+        db_user = user.User(name="rollup-bench", email=f"rollup-bench-{time.time_ns()}@example.com", password_hash="x")
+        session.add(db_user)
+        session.commit()
+        project = user.UserProject(name="rollup-bench", user_id=db_user.id)
+        session.add(project)
+        session.commit()
+        return db_user.id, project.id
+
+
+def timed(fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--chunk", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    user_id, project_id = create_project()
+    # Mid-bucket at every granularity (and in the past), so the unaligned windows have partial buckets at both ends
+    now = (datetime.now() - timedelta(days=1)).replace(hour=12, minute=30, second=30, microsecond=0)
+    with engine.begin() as connection:
+        ensure_partitions(connection, APILOG_PARTITION_INTERVAL, now - timedelta(seconds=SPAN_SECONDS), now)
+
+    start = time.perf_counter()
+    for first in range(0, args.rows, args.chunk):
+        with engine.begin() as connection:
+            connection.execute(GENERATE, {
+                "project_id": project_id, "now": now, "span": SPAN_SECONDS,
+                "first": first, "last": min(first + args.chunk, args.rows) - 1,
+            })
+    print(f"generated {args.rows:,} rows in {time.perf_counter() - start:.1f}s")
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE apilog"))
+
+    start = time.perf_counter()
+    compact_rollups(engine, now=now + timedelta(seconds=1), lag=0, step=86400)
+    print(f"compacted into rollups in {time.perf_counter() - start:.1f}s")
+
+    failed = False
+    print(f"{'chart':<18} {'raw ms':>10} {'rollup ms':>10} {'speedup':>8}")
+    charts = [(frequency, window, aligned) for frequency, window in WINDOWS.items() for aligned in (True, False)]
+    for frequency, window, aligned in charts:
+        start_datetime = now - window - timedelta(seconds=17)
+        if aligned:
+            start_datetime = bucket_start(start_datetime, frequency)
+        label = f"{frequency} {'aligned' if aligned else 'unaligned'}"
+
+        def run(use_rollups):
+            with Session(engine) as session:
+                return get_apilogs_stats(
+                    session, user_id, project_id, frequency=frequency,
+                    start_datetime=start_datetime, end_datetime=now, use_rollups=use_rollups,
+                )
+
+        raw_seconds, raw = timed(lambda: run(False), args.repeat)
+        rollup_seconds, rolled = timed(lambda: run(True), args.repeat)
+        print(f"{label:<18} {raw_seconds * 1000:>10.1f} {rollup_seconds * 1000:>10.1f} {raw_seconds / rollup_seconds:>7.1f}x")
+        for raw_period, rollup_period in zip(raw, rolled):
+            if any(raw_period[key] != rollup_period[key] for key in ("2xx_count", "3xx_count", "4xx_count", "5xx_count")) \
+                    or abs(raw_period["avg_response_time"] - rollup_period["avg_response_time"]) > 1e-9:
+                print(f"  {label} mismatch in {raw_period['period']}: raw {raw_period} rollup {rollup_period}")
+                failed = True
+                break
+
+    if failed:
+        raise SystemExit("FAIL: rollup charts differ from raw charts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Check that dashboard queries over the default 24 hour and 30 day windows only
+scan the apilog partitions those windows overlap.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.check_partition_pruning [--project-id <uuid>]
+
+Runs get_apilogs, get_apilogs_stats, get_counts_data and
+get_bot_logs_stats_data against the configured (migrated) database, EXPLAINs
+every statement they send and lists the apilog partitions each plan reads.
+Exits non-zero if a plan reads a partition outside its window.
+"""
+import argparse
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.crud.apilog import (get_apilogs, get_apilogs_stats,
+                             get_bot_logs_stats_data, get_counts_data)
+from app.database import engine
+from app.models.user import UserProject
+from app.services.partition_service import (DEFAULT_PARTITION, is_partitioned,
+                                            list_partitions)
+
+
+def plan_relations(plan) -> set:
+    relations = set()
+    if isinstance(plan, list):
+        for item in plan:
+            relations |= plan_relations(item)
+    elif isinstance(plan, dict):
+        if "Relation Name" in plan:
+            relations.add(plan["Relation Name"])
+        for value in plan.values():
+            if isinstance(value, (list, dict)):
+                relations |= plan_relations(value)
+    return relations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--project-id", type=uuid.UUID)
+    args = parser.parse_args()
+
+    with engine.connect() as connection:
+        if not is_partitioned(connection):
+            raise SystemExit("apilog is not partitioned; run `alembic upgrade head` on PostgreSQL first")
+        partitions = list_partitions(connection)
+    partition_names = {name for name, _, _ in partitions} | {DEFAULT_PARTITION}
+
+    plans = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "apilog" in statement:
+            with conn.connection.cursor() as explain_cursor:
+                explain_cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+                plans.append(plan_relations(explain_cursor.fetchone()[0]) & partition_names)
+
+    now = datetime.now()
+    # The functions take their own now() a moment later
+    end = now + timedelta(minutes=1)
+    day_start, month_start = now - timedelta(hours=24), now - timedelta(days=30)
+
+    with Session(engine) as session:
+        query = select(UserProject)
+        if args.project_id:
+            query = query.where(UserProject.id == args.project_id)
+        project = session.exec(query).first()
+        if not project:
+            raise SystemExit("No project found")
+        user_id, project_id = project.user_id, project.id
+
+        checks = [
+            ("get_apilogs 24h", day_start, lambda: get_apilogs(
+                session, user_id, project_id=project_id, start_datetime=day_start, end_datetime=now)),
+            ("get_apilogs 30d", month_start, lambda: get_apilogs(
+                session, user_id, project_id=project_id, start_datetime=month_start, end_datetime=now)),
+            ("get_apilogs_stats hour (default 24h)", day_start, lambda: get_apilogs_stats(
+                session, user_id, project_id=project_id, frequency="hour")),
+            ("get_apilogs_stats day (default 30d)", month_start, lambda: get_apilogs_stats(
+                session, user_id, project_id=project_id, frequency="day")),
+            ("get_counts_data 24h", day_start, lambda: get_counts_data(
+                session, user_id, project_id=project_id, start_datetime=day_start, end_datetime=now)),
+            ("get_counts_data 30d", month_start, lambda: get_counts_data(
+                session, user_id, project_id=project_id, start_datetime=month_start, end_datetime=now)),
+            ("get_bot_logs_stats_data (default 30d)", month_start, lambda: get_bot_logs_stats_data(
+                session, user_id, project_id=project_id)),
+        ]
+
+        failures = []
+        for label, start, run in checks:
+            expected = {name for name, lower, upper in partitions if lower <= end and start < upper}
+            expected.add(DEFAULT_PARTITION)
+            plans.clear()
+            run()
+            scanned = set().union(*plans) if plans else set()
+            unexpected = scanned - expected
+            print(f"{label:<40} {len(plans)} statements, partitions: {', '.join(sorted(scanned)) or '-'}")
+            if unexpected:
+                failures.append(f"{label} read {', '.join(sorted(unexpected))}")
+
+    print(f"{len(partitions)} range partitions in total")
+    if failures:
+        raise SystemExit("FAIL: " + "; ".join(failures))
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Check that the self-telemetry sink holds database connections only while it
+flushes and returns all of them, under sustained request load.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.check_self_telemetry --requests 20000
+
+Runs a small app with SelfTelemetryMiddleware against the configured database
+(the sink uses the shared async engine), logging into a throwaway project.
+Samples the async engine's pool while requests are served and exits non-zero
+if more than one connection was ever checked out, if any is still checked out
+after shutdown, or if logs went missing.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+from sqlmodel import SQLModel, func, select
+
+from app.database import async_session_maker, get_async_engine
+from app.models import apikey, apilog, botinfo, user, useragent
+from app.models.apilog import APILog
+from app.services.telemetry_service import (SelfTelemetryMiddleware,
+                                            start_self_telemetry,
+                                            stop_self_telemetry)
+
+
+async def create_project():
+    async with async_session_maker() as session:
+        db_user = user.User(name="telemetry-check", email=f"telemetry-{time.time_ns()}@example.com", password_hash="x")
+        session.add(db_user)
+        await session.commit()
+        project = user.UserProject(name="telemetry-check", user_id=db_user.id)
+        session.add(project)
+        await session.commit()
+        return project.id
+
+
+async def run(args):
+    async_engine = get_async_engine()
+    async with async_engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+    project_id = await create_project()
+
+    app = FastAPI()
+    app.add_middleware(SelfTelemetryMiddleware)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    pool = async_engine.sync_engine.pool
+    max_checked_out = 0
+    sampling = True
+
+    async def sample():
+        nonlocal max_checked_out
+        while sampling:
+            max_checked_out = max(max_checked_out, pool.checkedout())
+            await asyncio.sleep(0.001)
+
+    start_self_telemetry(app, str(project_id))
+    sampler = asyncio.create_task(sample())
+    transport = httpx.ASGITransport(app=app, client=("10.0.0.1", 12345))
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as http:
+        remaining = iter(range(args.requests))
+
+        async def worker():
+            for i in remaining:
+                await http.get(f"/ping?i={i}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    await stop_self_telemetry(app)
+    sampling = False
+    await sampler
+
+    async with async_session_maker() as session:
+        saved = (await session.exec(
+            select(func.count()).select_from(APILog).where(APILog.user_project_id == project_id)
+        )).one()
+    stats = app.state.telemetry_sink.stats()
+    leftover = pool.checkedout()
+
+    print(f"{args.requests} requests in {elapsed:.1f}s ({args.requests / elapsed:,.0f} req/s)")
+    print(f"max connections checked out: {max_checked_out}, after shutdown: {leftover}")
+    print(f"logs saved: {saved}, sink: {stats}")
+    await async_engine.dispose()
+
+    problems = []
+    if max_checked_out > 1:
+        problems.append(f"{max_checked_out} connections were checked out at once")
+    if leftover:
+        problems.append(f"{leftover} connections still checked out")
+    if saved != args.requests - stats["dropped"]:
+        problems.append(f"{saved} logs saved, expected {args.requests - stats['dropped']}")
+    if problems:
+        raise SystemExit("FAIL: " + "; ".join(problems))
+    print("OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
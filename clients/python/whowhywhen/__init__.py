@@ -0,0 +1,6 @@
+from whowhywhen.client import LogEntry, WhoWhyWhenClient
+from whowhywhen.middleware import (WhoWhyWhenASGIMiddleware,
+                                   WhoWhyWhenWSGIMiddleware)
+
+__all__ = ["LogEntry", "WhoWhyWhenClient", "WhoWhyWhenASGIMiddleware", "WhoWhyWhenWSGIMiddleware"]
+__version__ = "0.1.0"
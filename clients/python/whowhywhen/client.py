@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import random
+import threading
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import List, Optional, Union
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop_new", "drop_oldest")
+
+
+@dataclass
+class LogEntry:
+    """One API log, mirroring the server's APILogCreate schema."""
+    url: str
+    ip_address: str
+    user_agent: Optional[str] = None
+    location: Optional[str] = None
+    response_code: Optional[int] = None
+    response_time: Optional[float] = None
+    created_at: Optional[datetime] = None
+    # Lets the server drop copies re-sent by retries
+    event_id: Optional[str] = field(default_factory=lambda: uuid.uuid4().hex)
+
+    def to_json(self) -> dict:
+        data = {key: value for key, value in asdict(self).items() if value is not None}
+        if self.created_at is not None:
+            data["created_at"] = self.created_at.isoformat()
+        return data
+
+
+class WhoWhyWhenClient:
+    """
+    Buffers log entries in memory and ships them to POST /api/log/bulk from a
+    background task over one pooled HTTP connection.
+
+    A batch is sent once `max_batch_size` entries are buffered or
+    `flush_interval` seconds have passed. Failed sends (network errors, 429
+    and 5xx) are retried with full-jitter exponential backoff, honouring
+    Retry-After. The buffer holds at most `max_queue_size` entries; when it is
+    full `overflow` decides whether the new entry (`drop_new`) or the oldest
+    buffered one (`drop_oldest`) is discarded. `log()` never blocks and is
+    safe to call from any thread.
+
+    Use it inside a running event loop with `await client.start()` /
+    `await client.aclose()` (or `async with client`), or from synchronous code
+    with `client.start_in_thread()` / `client.close()`.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        api_url: str = "https://api.whowhywhen.com",
+        max_batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 10000,
+        overflow: str = "drop_new",
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        timeout: float = 5.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}")
+        self.api_key = api_key
+        self.bulk_url = api_url.rstrip("/") + "/api/log/bulk"
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.overflow = overflow
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.transport = transport
+
+        self.queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retries = 0
+
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closing = False
+
+    @property
+    def started(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        """Start the background flusher in the running event loop."""
+        if self._task:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._http = httpx.AsyncClient(
+            headers={"X-API-KEY": self.api_key},
+            timeout=self.timeout,
+            transport=self.transport,
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+        )
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    def start_in_thread(self):
+        """Run the flusher on its own event loop in a daemon thread, for sync applications."""
+        if self._thread:
+            return
+        started = threading.Event()
+        errors = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(self.start())
+            except BaseException as e:
+                errors.append(e)
+                loop.close()
+                return
+            finally:
+                # Set on failure too, or the caller would wait forever
+                started.set()
+            loop.run_until_complete(self._task)
+            loop.close()
+
+        self._thread = threading.Thread(target=run, name="whowhywhen-flusher", daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            self._thread = None
+            raise errors[0]
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def log(self, entry: Union[LogEntry, dict]) -> bool:
+        """Buffer an entry for sending. Returns False if it was dropped."""
+        data = entry.to_json() if isinstance(entry, LogEntry) else entry
+        with self._lock:
+            if len(self._buffer) >= self.max_queue_size:
+                self.dropped += 1
+                if self.overflow == "drop_new":
+                    return False
+                self._buffer.popleft()
+            self._buffer.append(data)
+            self.queued += 1
+            full = len(self._buffer) >= self.max_batch_size
+        if full:
+            self._wake()
+        return True
+
+    def _wake(self):
+        if not self._loop or self._loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _take(self, size: int) -> List[dict]:
+        with self._lock:
+            return [self._buffer.popleft() for _ in range(min(size, len(self._buffer)))]
+
+    async def _run(self):
+        try:
+            while not self._closing:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush()
+            # Entries logged while the last flush was in flight
+            await self.flush()
+        finally:
+            await self._http.aclose()
+
+    async def flush(self):
+        """Send everything buffered so far."""
+        while batch := self._take(self.max_batch_size):
+            await self._send(batch)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: spreads retries from many clients over the whole window
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _send(self, batch: List[dict]) -> bool:
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = await self._http.post(self.bulk_url, json=batch)
+            except httpx.TransportError as e:
+                logger.debug(f"WhoWhyWhen send failed: {e!r}")
+            else:
+                if response.status_code < 300:
+                    self.sent += len(batch)
+                    return True
+                if response.status_code != 429 and response.status_code < 500:
+                    # The batch itself was refused (bad key, invalid payload); retrying cannot help
+                    logger.warning(f"WhoWhyWhen rejected {len(batch)} logs: {response.status_code} {response.text[:200]}")
+                    self.failed += len(batch)
+                    return False
+                try:
+                    retry_after = float(response.headers.get("Retry-After", ""))
+                except ValueError:
+                    pass
+            if attempt == self.max_retries or self._closing:
+                break
+            self.retries += 1
+            delay = self._backoff(attempt)
+            await asyncio.sleep(max(delay, retry_after) if retry_after is not None else delay)
+        logger.warning(f"WhoWhyWhen dropped {len(batch)} logs after {attempt + 1} attempts")
+        self.failed += len(batch)
+        return False
+
+    async def aclose(self):
+        """Flush what is buffered and stop the background task."""
+        if not self._task:
+            return
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await self._task
+        finally:
+            self._task = None
+
+    def close(self, timeout: float = 10.0):
+        """Stop a client started with `start_in_thread()`, waiting up to `timeout` seconds."""
+        if not self._thread:
+            return
+        loop = self._loop
+        if loop and not loop.is_closed():
+            def stop():
+                self._closing = True
+                self._wakeup.set()
+            loop.call_soon_threadsafe(stop)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "queued": self.queued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
@@ -0,0 +1,151 @@
+import time
+from typing import Optional
+
+from whowhywhen.client import LogEntry, WhoWhyWhenClient
+
+
+def _header(headers, name: bytes) -> Optional[str]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+class WhoWhyWhenASGIMiddleware:
+    """
+    Pure ASGI middleware (FastAPI, Starlette, Django ASGI, ...) logging every
+    HTTP request through a shared WhoWhyWhenClient. The client is started on
+    the first request and flushed on lifespan shutdown.
+
+        app.add_middleware(WhoWhyWhenASGIMiddleware, client=WhoWhyWhenClient(api_key="..."))
+    """
+
+    def __init__(self, app, client: WhoWhyWhenClient, trust_forwarded_for: bool = False):
+        self.app = app
+        self.client = client
+        self.trust_forwarded_for = trust_forwarded_for
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.app(scope, self._lifespan_receive(receive), send)
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if not self.client.started:
+            await self.client.start()
+
+        start = time.perf_counter()
+        status = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            status = status or 500
+            raise
+        finally:
+            self.client.log(self._entry(scope, status, time.perf_counter() - start))
+
+    def _lifespan_receive(self, receive):
+        async def wrapped():
+            message = await receive()
+            if message["type"] == "lifespan.shutdown":
+                await self.client.aclose()
+            return message
+        return wrapped
+
+    def _entry(self, scope, status, elapsed) -> LogEntry:
+        headers = scope.get("headers", [])
+        host = _header(headers, b"host")
+        if not host and scope.get("server"):
+            host = "%s:%s" % scope["server"]
+        url = f"{scope.get('scheme', 'http')}://{host or ''}{scope.get('root_path', '')}{scope['path']}"
+        if scope.get("query_string"):
+            url += "?" + scope["query_string"].decode("latin-1")
+
+        ip_address = scope["client"][0] if scope.get("client") else ""
+        if self.trust_forwarded_for and (forwarded := _header(headers, b"x-forwarded-for")):
+            ip_address = forwarded.split(",")[0].strip()
+
+        return LogEntry(
+            url=url,
+            ip_address=ip_address,
+            user_agent=_header(headers, b"user-agent"),
+            response_code=status,
+            response_time=elapsed,
+        )
+
+
+class WhoWhyWhenWSGIMiddleware:
+    """
+    WSGI middleware (Flask, Django, ...) logging every request through a
+    WhoWhyWhenClient running on its own background thread. The response time
+    covers the whole response body, up to the server closing the iterable.
+
+        app.wsgi_app = WhoWhyWhenWSGIMiddleware(app.wsgi_app, client=WhoWhyWhenClient(api_key="..."))
+    """
+
+    def __init__(self, app, client: WhoWhyWhenClient, trust_forwarded_for: bool = False):
+        self.app = app
+        self.client = client
+        self.trust_forwarded_for = trust_forwarded_for
+        self.client.start_in_thread()
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        status = []
+
+        def start_response_wrapper(status_line, headers, exc_info=None):
+            status[:] = [int(status_line.split(" ", 1)[0])]
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            body = self.app(environ, start_response_wrapper)
+        except Exception:
+            self.client.log(self._entry(environ, 500, time.perf_counter() - start))
+            raise
+        return _ClosingIterator(body, lambda: self.client.log(
+            self._entry(environ, status[0] if status else None, time.perf_counter() - start)
+        ))
+
+    def _entry(self, environ, status, elapsed) -> LogEntry:
+        url = f"{environ.get('wsgi.url_scheme', 'http')}://{environ.get('HTTP_HOST') or environ.get('SERVER_NAME', '')}"
+        url += environ.get("SCRIPT_NAME", "") + environ.get("PATH_INFO", "")
+        if environ.get("QUERY_STRING"):
+            url += "?" + environ["QUERY_STRING"]
+
+        ip_address = environ.get("REMOTE_ADDR", "")
+        if self.trust_forwarded_for and environ.get("HTTP_X_FORWARDED_FOR"):
+            ip_address = environ["HTTP_X_FORWARDED_FOR"].split(",")[0].strip()
+
+        return LogEntry(
+            url=url,
+            ip_address=ip_address,
+            user_agent=environ.get("HTTP_USER_AGENT"),
+            response_code=status,
+            response_time=elapsed,
+        )
+
+
+class _ClosingIterator:
+    def __init__(self, iterable, on_close):
+        self._iterable = iterable
+        self._iterator = iter(iterable)
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, "close"):
+                self._iterable.close()
+        finally:
+            self._on_close()
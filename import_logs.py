@@ -0,0 +1,228 @@
+"""
+Import historical access logs into a project.
+
+    python import_logs.py --project-id <uuid> access.log.gz more.log --format nginx --host example.com
+
+Reads Caddy JSON access logs, nginx combined logs (optionally followed by
+$request_time) or JSONL files of /api/log payloads, plain or gzipped.
+Parsing and enrichment (user agent, bot match, path/query params, GeoIP)
+run in a process pool; rows are written with COPY on Postgres, one
+transaction per chunk. Each transaction also records how far into the file
+the import got, so an interrupted import rerun with the same arguments
+continues after the last committed chunk.
+"""
+import argparse
+import gzip
+import hashlib
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import insert, update
+from sqlmodel import Session
+
+from app.config import APILOG_PARTITION_INTERVAL
+from app.crud.apilog import load_bot_infos
+from app.database import engine, insert_ignore
+from app.models.apilog import APILog, APILogEvent
+from app.models.importcheckpoint import ImportCheckpoint
+from app.models.user import UserProject
+from app.models.useragent import UserAgent
+from app.services.log_import_service import (FORMATS, copy_rows,
+                                             detect_format, init_worker,
+                                             parse_chunk)
+from app.services.partition_service import ensure_partitions
+
+# `created` is left to the database default
+APILOG_COLUMNS = [column.name for column in APILog.__table__.columns if column.name != "created"]
+
+
+def open_log(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "rt", encoding="utf-8", errors="replace")
+
+
+def source_key(path: str) -> str:
+    # Rotated logs reuse file names, so the key includes a hash of the first bytes
+    with open_log(path) as f:
+        head = f.read(65536)
+    return f"{os.path.abspath(path)}:{hashlib.sha1(head.encode()).hexdigest()[:16]}"
+
+
+def load_checkpoint(source: str) -> ImportCheckpoint:
+    with Session(engine) as session:
+        return session.get(ImportCheckpoint, source) or ImportCheckpoint(source=source)
+
+
+class StageTimer:
+    def __init__(self):
+        self.seconds = {"read": 0.0, "parse": 0.0, "parse_cpu": 0.0, "write": 0.0}
+        self.lines = 0
+        self.rows = 0
+        self.errors = 0
+
+    def report(self, prefix: str = ""):
+        def rate(count, seconds):
+            return f"{count / seconds:,.0f}/s" if seconds else "-"
+
+        print(
+            f"{prefix}lines {self.lines:,} rows {self.rows:,} errors {self.errors:,} | "
+            f"read {rate(self.lines, self.seconds['read'])} | "
+            f"parse+enrich {rate(self.lines, self.seconds['parse'])} waited, "
+            f"{rate(self.lines, self.seconds['parse_cpu'])} per worker | "
+            f"write {rate(self.rows, self.seconds['write'])}"
+        )
+
+
+def claim_event_ids(connection, apilog_rows):
+    """Keep the rows whose event_id (if any) was not saved before, recording the new ids."""
+    event_ids = {(row["user_project_id"], row["event_id"]) for row in apilog_rows if row["event_id"]}
+    if not event_ids:
+        return apilog_rows
+    now = datetime.now()
+    table = APILogEvent.__table__
+    statement = insert_ignore(table, connection.dialect.name).returning(table.c.user_project_id, table.c.event_id)
+    claimed = set(map(tuple, connection.execute(statement, [
+        {"user_project_id": user_project_id, "event_id": event_id, "created": now}
+        for user_project_id, event_id in event_ids
+    ]).all()))
+    rows = []
+    for row in apilog_rows:
+        if row["event_id"]:
+            key = (row["user_project_id"], row["event_id"])
+            if key not in claimed:
+                continue
+            claimed.discard(key)  # later copies in the same chunk are duplicates too
+        rows.append(row)
+    return rows
+
+
+def write_chunk(connection, apilog_rows, user_agent_rows) -> int:
+    """Write one chunk in the caller's transaction. Returns the number of log rows inserted."""
+    dialect_name = connection.dialect.name
+    if user_agent_rows:
+        connection.execute(insert_ignore(UserAgent.__table__, dialect_name), user_agent_rows)
+    apilog_rows = claim_event_ids(connection, apilog_rows)
+    if not apilog_rows:
+        return 0
+    if dialect_name == "postgresql":
+        # Historical rows get their own partitions instead of piling up in the default one
+        ensure_partitions(
+            connection, APILOG_PARTITION_INTERVAL,
+            min(row["created_at"] for row in apilog_rows), max(row["created_at"] for row in apilog_rows),
+        )
+        copy_rows(connection.connection.cursor(), "apilog", APILOG_COLUMNS, apilog_rows)
+    else:
+        connection.execute(insert(APILog.__table__), apilog_rows)
+    return len(apilog_rows)
+
+
+def save_checkpoint(connection, checkpoint: ImportCheckpoint, lines_done: int, rows: int):
+    checkpoint.lines_done = lines_done
+    checkpoint.rows_imported += rows
+    checkpoint.updated = datetime.now()
+    values = {"lines_done": checkpoint.lines_done, "rows_imported": checkpoint.rows_imported, "updated": checkpoint.updated}
+    table = ImportCheckpoint.__table__
+    if not connection.execute(update(table).where(table.c.source == checkpoint.source).values(**values)).rowcount:
+        connection.execute(table.insert().values(source=checkpoint.source, **values))
+
+
+def read_chunks(f, skip: int, chunk_size: int, timer: StageTimer):
+    """Yield (lines, line number after the chunk) after skipping `skip` lines."""
+    start = time.perf_counter()
+    for _ in islice(f, skip):
+        pass
+    lines_done = skip
+    while True:
+        chunk = list(islice(f, chunk_size))
+        timer.seconds["read"] += time.perf_counter() - start
+        if not chunk:
+            return
+        lines_done += len(chunk)
+        timer.lines += len(chunk)
+        yield chunk, lines_done
+        start = time.perf_counter()
+
+
+def import_file(path: str, args, pool, timer: StageTimer):
+    source = source_key(path)
+    checkpoint = load_checkpoint(source)
+    if checkpoint.lines_done:
+        print(f"{path}: resuming after line {checkpoint.lines_done:,}")
+
+    fmt = args.format
+    if fmt == "auto":
+        with open_log(path) as f:
+            first_line = next((line for line in f if line.strip()), None)
+        if first_line is None:
+            return
+        fmt = detect_format(first_line)
+        print(f"{path}: detected {fmt} format")
+
+    pending = deque()
+
+    def finish_oldest():
+        future, lines_done = pending.popleft()
+        start = time.perf_counter()
+        apilog_rows, user_agent_rows, errors, worker_seconds = future.result()
+        timer.seconds["parse"] += time.perf_counter() - start
+        timer.seconds["parse_cpu"] += worker_seconds
+        timer.errors += errors
+
+        start = time.perf_counter()
+        with engine.begin() as connection:
+            rows = write_chunk(connection, apilog_rows, user_agent_rows)
+            save_checkpoint(connection, checkpoint, lines_done, rows)
+        timer.seconds["write"] += time.perf_counter() - start
+        timer.rows += rows
+
+    last_report = time.monotonic()
+    with open_log(path) as f:
+        for chunk, lines_done in read_chunks(f, checkpoint.lines_done, args.chunk_size, timer):
+            future = pool.submit(parse_chunk, fmt, chunk, args.project_id, args.host, not args.no_location)
+            pending.append((future, lines_done))
+            # Chunks are committed in file order, so the checkpoint never skips lines
+            if len(pending) >= 2 * args.workers:
+                finish_oldest()
+            if time.monotonic() - last_report > 10:
+                last_report = time.monotonic()
+                timer.report(f"{path}: ")
+        while pending:
+            finish_oldest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--project-id", type=uuid.UUID, required=True)
+    parser.add_argument("--format", choices=FORMATS + ("auto",), default="auto")
+    parser.add_argument("--host", default="localhost", help="host for nginx log URLs, which only contain the path")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=5000, help="lines per parse task and per transaction")
+    parser.add_argument("--no-location", action="store_true", help="skip the GeoIP lookup")
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        bot_infos = load_bot_infos(session)
+        project = session.get(UserProject, args.project_id)
+        if not project:
+            raise SystemExit(f"Project {args.project_id} not found")
+        path_template_rules = project.path_template_rules
+
+    timer = StageTimer()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(bot_infos, path_template_rules)) as pool:
+        for path in args.files:
+            import_file(path, args, pool, timer)
+    timer.report()
+    print(f"total {timer.rows:,} rows in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
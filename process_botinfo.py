@@ -1,32 +1,46 @@
+"""
+Load bot definitions and backfill apilog.bot_id from them.
+
+    python process_botinfo.py
+    python process_botinfo.py user_agents.json --batch-size 2000 --pause 0.1
+
+Adds the bots of the JSON file (pattern and url) that the botinfo table does
+not have yet. Then every distinct user agent in the useragent table is
+resolved with the same BotMatcher as ingest: each pattern is compiled once and
+applied as a regex. Logs are never loaded. The logs of each user agent that
+resolves to a bot are walked in (created_at, id) order on the
+ix_apilog_user_agent_created_at index, --batch-size at a time: each window is
+one UPDATE in its own short transaction, so every log is visited once however
+many the user agent has. Logs that already have the resolved bot are left
+alone.
+
+Progress is stored in the importcheckpoint table in the same transaction as
+each update: last_key is the user agent id, followed by the created_at and
+id of the last log updated while that user agent is unfinished. A rerun
+continues from there. It starts over when the bot definitions change.
+"""
+import argparse
+import hashlib
 import json
-from contextlib import contextmanager
+import time
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
 
-import sqlalchemy
-from sqlalchemy import select
-from sqlalchemy.orm import sessionmaker
-from tqdm import tqdm
+from sqlalchemy import select, tuple_, update
+from sqlmodel import Session
 
-from app.config import DATABASE_URL
-from app.models.apikey import APIKey
+from app.crud.apilog import load_bot_infos
+from app.database import engine
 from app.models.apilog import APILog
 from app.models.botinfo import BotInfo
-from app.models.user import User, UserProject
+from app.models.importcheckpoint import ImportCheckpoint
+from app.models.useragent import UserAgent
+from app.services.bot_match_service import BotMatcher
+from app.services.invalidation_service import publish_invalidation
 
-# Create a SQLAlchemy session
-engine = sqlalchemy.create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+APILOG = APILog.__table__
 
-@contextmanager
-def get_session():
-    session = SessionLocal()
-    try:
-        yield session
-        session.commit()
-    except:
-        session.rollback()
-        raise
-    finally:
-        session.close()
 
 def clean_pattern(pattern):
     # Remove any leading or trailing whitespace
@@ -37,40 +51,181 @@ def clean_pattern(pattern):
 
     return pattern
 
-with open('user_agents.json', 'r') as f:
-    # Load the JSON data
-    data = json.load(f)
-
-# Process the botinfo data
-for bot in tqdm(data):
-    # Extract the pattern and url from the bot
-    pattern = bot.get('pattern')
-    url = bot.get('url')
-    name = clean_pattern(pattern)
-
-    with get_session() as session:
-        print("Processing bot info:", name)
-        # Check if name is already in the database
-        bot_info = session.execute(select(BotInfo).where(BotInfo.bot_name == name)).scalar_one_or_none()
-        if bot_info:
-            continue
-
-        # Check if the pattern and url are present in the botinfo.json file
-        if pattern and url:
-            print("Adding bot info to the database...")
-            bot_info = BotInfo(
-                bot_name=name,
-                website=url,
-                pattern=pattern,
-            )
-            session.add(bot_info)
-            session.commit()
-            session.refresh(bot_info)
-
-            # For all APILog where user_agent contains the regex pattern, update the bot_type ID
-            api_logs = session.execute(select(APILog).where(APILog.user_agent.contains(pattern))).scalars().all()
-            print("Adding bot type to API logs...", len(api_logs))
-            for api_log in api_logs:
-                api_log.bot_id = bot_info.id
-                session.add(api_log)
-            session.commit()
+
+def add_bot_infos(path: str) -> int:
+    """Insert the bots of `path` whose name is not in botinfo yet. Returns how many were added."""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    with Session(engine) as session:
+        names = set(session.execute(select(BotInfo.bot_name)).scalars().all())
+        bot_infos = []
+        for bot in data:
+            pattern, url = bot.get('pattern'), bot.get('url')
+            name = clean_pattern(pattern or '')
+            if pattern and url and name not in names:
+                names.add(name)
+                bot_infos.append(BotInfo(bot_name=name, website=url, pattern=pattern))
+        session.add_all(bot_infos)
+        if bot_infos:
+            publish_invalidation(session, "user_agents")
+        session.commit()
+    return len(bot_infos)
+
+
+def backfill_source(bot_infos) -> str:
+    # Keyed by the bot definitions, so a rerun after they change starts over
+    digest = hashlib.sha1(json.dumps([(str(bot["id"]), bot["pattern"]) for bot in bot_infos]).encode())
+    return f"botinfo-backfill:{digest.hexdigest()[:16]}"
+
+
+def load_checkpoint(source: str) -> ImportCheckpoint:
+    with Session(engine) as session:
+        return session.get(ImportCheckpoint, source) or ImportCheckpoint(source=source)
+
+
+def save_checkpoint(connection, checkpoint: ImportCheckpoint, last_key: str, user_agents: int, rows: int):
+    checkpoint.last_key = last_key
+    checkpoint.lines_done += user_agents
+    checkpoint.rows_imported += rows
+    checkpoint.updated = datetime.now()
+    fields = {
+        "last_key": checkpoint.last_key, "lines_done": checkpoint.lines_done,
+        "rows_imported": checkpoint.rows_imported, "updated": checkpoint.updated,
+    }
+    table = ImportCheckpoint.__table__
+    if not connection.execute(update(table).where(table.c.source == checkpoint.source).values(**fields)).rowcount:
+        connection.execute(table.insert().values(source=checkpoint.source, **fields))
+
+
+def user_agent_batches(last_key: Optional[uuid.UUID], batch_size: int, include_last: bool = False):
+    """
+    Yield lists of (id, user_agent) from the useragent table in id order,
+    after `last_key` (from it with `include_last`).
+    """
+    while True:
+        query = select(UserAgent.id, UserAgent.user_agent).order_by(UserAgent.id).limit(batch_size)
+        if last_key is not None:
+            query = query.where(UserAgent.id >= last_key if include_last else UserAgent.id > last_key)
+        with engine.connect() as connection:
+            batch = connection.execute(query).all()
+        if not batch:
+            return
+        yield batch
+        last_key = batch[-1].id
+        include_last = False
+
+
+def encode_position(user_agent_id: uuid.UUID, log_key: Optional[Tuple[datetime, uuid.UUID]] = None) -> str:
+    if log_key is None:
+        return str(user_agent_id)
+    created_at, log_id = log_key
+    return f"{user_agent_id} {created_at.isoformat()} {log_id}"
+
+
+def decode_position(last_key: Optional[str]):
+    """(user agent id, (created_at, id) of its last updated log or None if it is done) of a checkpoint."""
+    if not last_key:
+        return None, None
+    user_agent_id, *log_key = last_key.split(" ")
+    if not log_key:
+        return uuid.UUID(user_agent_id), None
+    return uuid.UUID(user_agent_id), (datetime.fromisoformat(log_key[0]), uuid.UUID(log_key[1]))
+
+
+def next_window(connection, user_agent_id: uuid.UUID, after, limit: int):
+    """(created_at, id) of the `limit`-th log of `user_agent_id` after `after`, or of its last one."""
+    query = (
+        select(APILOG.c.created_at, APILOG.c.id)
+        .where(APILOG.c.user_agent_id == user_agent_id)
+        .order_by(APILOG.c.created_at, APILOG.c.id)
+        .offset(limit - 1)
+        .limit(1)
+    )
+    if after is not None:
+        query = query.where(tuple_(APILOG.c.created_at, APILOG.c.id) > after)
+    if row := connection.execute(query).first():
+        return tuple(row), True
+    # Fewer than `limit` logs are left: the window runs to the end
+    return None, False
+
+
+def bot_id_update(user_agent_id: uuid.UUID, bot_id: uuid.UUID, after, upto):
+    """UPDATE setting bot_id on the logs of `user_agent_id` in the keyset window (after, upto] whose bot_id differs."""
+    key = tuple_(APILOG.c.created_at, APILOG.c.id)
+    query = (
+        update(APILOG)
+        .where(APILOG.c.user_agent_id == user_agent_id, APILOG.c.bot_id.is_distinct_from(bot_id))
+        .values(bot_id=bot_id)
+    )
+    if after is not None:
+        query = query.where(key > after)
+    if upto is not None:
+        query = query.where(key <= upto)
+    return query
+
+
+def backfill_user_agent(checkpoint: ImportCheckpoint, user_agent_id: uuid.UUID, bot_id: uuid.UUID, after, args):
+    """Walk the logs of one user agent, window by window, from the keyset position `after`."""
+    while True:
+        with engine.begin() as connection:
+            upto, more = next_window(connection, user_agent_id, after, args.batch_size)
+            updated = connection.execute(bot_id_update(user_agent_id, bot_id, after, upto)).rowcount
+            # Each window commits the position after it; the last one marks the user agent done
+            save_checkpoint(connection, checkpoint, encode_position(user_agent_id, upto if more else None),
+                            0 if more else 1, updated)
+        if not more:
+            return
+        after = upto
+        if args.pause:
+            time.sleep(args.pause)
+
+
+def backfill(checkpoint: ImportCheckpoint, bot_matcher: BotMatcher, args):
+    start = time.perf_counter()
+    last_report = time.monotonic()
+    done = 0
+    last_user_agent, after = decode_position(checkpoint.last_key)
+    # An unfinished user agent is walked again from its saved position
+    for batch in user_agent_batches(last_user_agent, args.user_agent_batch_size, include_last=after is not None):
+        for row in batch:
+            if bot_id := bot_matcher.match(row.user_agent):
+                backfill_user_agent(checkpoint, row.id, bot_id, after if row.id == last_user_agent else None, args)
+            else:
+                checkpoint.lines_done += 1
+        # User agents without a bot only move the position, once per batch
+        with engine.begin() as connection:
+            save_checkpoint(connection, checkpoint, encode_position(batch[-1].id), 0, 0)
+
+        done += len(batch)
+        if time.monotonic() - last_report > 10:
+            last_report = time.monotonic()
+            print(f"user agents {checkpoint.lines_done:,} logs updated {checkpoint.rows_imported:,} "
+                  f"({done / (time.perf_counter() - start):,.0f} user agents/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("bots", nargs="?", default="user_agents.json", help="JSON list of {pattern, url} bots")
+    parser.add_argument("--user-agent-batch-size", type=int, default=1000,
+                        help="distinct user agents resolved per batch")
+    parser.add_argument("--batch-size", type=int, default=5000, help="maximum logs updated per transaction")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between full update batches")
+    args = parser.parse_args()
+
+    print(f"added {add_bot_infos(args.bots):,} bots")
+
+    with Session(engine) as session:
+        bot_infos = load_bot_infos(session)
+    bot_matcher = BotMatcher(bot_infos)
+    checkpoint = load_checkpoint(backfill_source(bot_infos))
+    if checkpoint.last_key:
+        print(f"resuming at {checkpoint.last_key} ({checkpoint.lines_done:,} user agents done)")
+
+    start = time.perf_counter()
+    backfill(checkpoint, bot_matcher, args)
+    print(f"total {checkpoint.lines_done:,} user agents, {checkpoint.rows_imported:,} logs updated "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import asyncio
+import os
+import tempfile
+import time
+
+# app.config reads the environment on import, so point it at a throwaway SQLite file first
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+import pytest
+from sqlmodel import Session, SQLModel
+
+from app.crud.apilog import create_apilog_bulk, recent_event_ids
+from app.crud.useragent import known_user_agent_ids
+from app.database import async_session_maker, engine, get_async_engine
+from app.models import (apikey, apilog, apilogarchive, apilogrollup, botinfo,
+                        cacheinvalidation, importcheckpoint, user, useragent)
+
+
+@pytest.fixture
+def db_engine():
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    SQLModel.metadata.drop_all(engine)
+    # Ids known to be saved, which the next test's database does not have
+    known_user_agent_ids.clear()
+    recent_event_ids.clear()
+
+
+@pytest.fixture
+def project_id(db_engine):
+    with Session(db_engine) as session:
+        db_user = user.User(name="test", email=f"test-{time.time_ns()}@example.com", password_hash="x")
+        session.add(db_user)
+        session.commit()
+        project = user.UserProject(name="test", user_id=db_user.id)
+        session.add(project)
+        session.commit()
+        return project.id
+
+
+@pytest.fixture
+def ingest(db_engine):
+    """Save APILogCreate entries for a project through the bulk ingest path."""
+    def ingest(project_id, entries):
+        async def run():
+            async with async_session_maker() as session:
+                result = await create_apilog_bulk(session, project_id, entries, update_location=False)
+            # Pooled connections belong to this event loop
+            await get_async_engine().dispose()
+            return result
+
+        return asyncio.run(run())
+
+    return ingest
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlmodel import Session
+
+from app.crud.apikey import create_api_key, delete_api_key
+from app.database import async_session_maker, get_async_engine
+from app.dependencies.apikey import api_key_cache, get_api_key
+from app.models.user import UserProject
+from app.services.invalidation_service import poll_invalidations
+
+
+def authenticate(key: str):
+    async def run():
+        async with async_session_maker() as session:
+            try:
+                return await get_api_key(key, session)
+            finally:
+                await session.close()
+                # Pooled connections belong to this event loop
+                await get_async_engine().dispose()
+
+    return asyncio.run(run())
+
+
+def test_deleted_key_stops_authenticating_in_every_worker(db_engine, project_id):
+    position, handled = poll_invalidations(db_engine, None, set())
+    with Session(db_engine) as session:
+        user_id = session.get(UserProject, project_id).user_id
+        api_key = create_api_key(session, user_id, "test", project_id)
+        key, key_id = api_key.key, api_key.id
+
+    assert authenticate(key).id == project_id
+    cached = api_key_cache.get(key)
+    with Session(db_engine) as session:
+        delete_api_key(session, key_id)
+    # As seen from an API worker, which only learns of the deletion through the table
+    api_key_cache.set(key, cached)
+    assert authenticate(key).id == project_id
+
+    position, handled = poll_invalidations(db_engine, position, handled)
+    with pytest.raises(HTTPException) as error:
+        authenticate(key)
+    assert error.value.status_code == 403
+
+    # Applied once: polling again does not drop entries cached since
+    api_key_cache.set(key, cached)
+    poll_invalidations(db_engine, position, handled)
+    assert api_key_cache.get(key) is cached
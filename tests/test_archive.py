@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+from sqlmodel import Session
+
+from app.crud.apilog import get_apilogs_stats, get_counts_data
+from app.models.apilog import APILog
+from app.models.apilogarchive import APILogArchive
+from app.schemas.apilog import APILogCreate, APILogSearch
+from app.services import archive_service
+from app.services.rollup_service import compact_rollups, current_watermark
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("duckdb")
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    None,
+]
+
+
+def snapshot(session, project_id, start, end):
+    """Every stats view of the window that can reach into the archive."""
+    views = []
+    for bots_only in (False, True):
+        for frequency in ("hour", "day"):
+            for use_rollups in (True, False):
+                views.append(get_apilogs_stats(session, None, project_id, frequency=frequency, start_datetime=start,
+                                               end_datetime=end, bots_only=bots_only, use_rollups=use_rollups))
+            views.append(get_apilogs_stats(session, None, project_id, APILogSearch(path="/items/1"), "day",
+                                           start_datetime=start, end_datetime=end, bots_only=bots_only))
+        for use_rollups in (True, False):
+            views.append(get_counts_data(session, None, project_id, start_datetime=start, end_datetime=end,
+                                         bots_only=bots_only, use_rollups=use_rollups))
+    for view in views:
+        for period in view if isinstance(view, list) else []:
+            period["avg_response_time"] = pytest.approx(period["avg_response_time"])
+    return views
+
+
+def test_archived_month_keeps_the_stats(db_engine, project_id, ingest, tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_service, "ARCHIVE_URI", str(tmp_path))
+    first = datetime(2026, 2, 27, 5, 30)
+    ingest(project_id, [
+        APILogCreate(url=f"https://api.example.com/items/{i % 20}", ip_address="10.0.0.1",
+                     user_agent=USER_AGENTS[i % 3], response_code=(200, 301, 404, 503)[i % 4],
+                     response_time=(i % 7) / 10 or None, created_at=first + timedelta(minutes=97) * i)
+        for i in range(600)
+    ])
+    compact_rollups(db_engine, lag=0)
+    # Unaligned ends, so the partial days at both ends are read from the archive
+    start, end = datetime(2026, 3, 2, 13, 40), datetime(2026, 3, 28, 7, 15)
+    with Session(db_engine) as session:
+        before = snapshot(session, project_id, start, end)
+        watermark = current_watermark(session)
+
+    archived = archive_service.archive_period(db_engine, datetime(2026, 3, 1), datetime(2026, 4, 1), None, watermark)
+
+    with Session(db_engine) as session:
+        assert archived == session.execute(select(func.sum(APILogArchive.rows))).scalar() > 0
+        assert session.execute(
+            select(func.count()).select_from(APILog).where(APILog.created_at.between(datetime(2026, 3, 1), datetime(2026, 4, 1)))
+        ).scalar() == 0
+        assert snapshot(session, project_id, start, end) == before
@@ -0,0 +1,40 @@
+import json
+import re
+from pathlib import Path
+
+from app.services.bot_match_service import BotMatcher
+
+USER_AGENTS_JSON = Path(__file__).resolve().parent.parent / "user_agents.json"
+
+
+def linear_match(bot_infos, user_agent):
+    """The scan BotMatcher replaced: the first pattern in table order that matches."""
+    for bot_info in bot_infos:
+        try:
+            if re.compile(bot_info["pattern"]).search(user_agent):
+                return bot_info["id"]
+        except re.error:
+            continue
+    return None
+
+
+def test_matches_like_the_linear_scan():
+    entries = json.loads(USER_AGENTS_JSON.read_text())
+    bot_infos = [{"id": index, "pattern": entry["pattern"]} for index, entry in enumerate(entries, start=1)]
+    user_agents = [instance for entry in entries for instance in entry.get("instances", [])]
+    user_agents += [
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+        "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148",
+        "curl/8.4.0",
+        "python-requests/2.31.0",
+    ]
+    matcher = BotMatcher(bot_infos)
+
+    mismatches = []
+    for user_agent in user_agents:
+        expected = linear_match(bot_infos, user_agent)
+        if matcher.match(user_agent) != expected:
+            mismatches.append((user_agent, matcher.match(user_agent), expected))
+    assert len(user_agents) > 1000
+    assert mismatches == []
+    assert matcher.match("") is None
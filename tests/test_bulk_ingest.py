@@ -0,0 +1,66 @@
+from sqlalchemy import text
+from sqlmodel import Session
+
+from app.crud.apilog import recent_event_ids
+from app.models.user import UserProject
+from app.schemas.apilog import APILogCreate
+
+
+def test_entries_without_user_agent_or_query_string_are_saved(db_engine, project_id, ingest):
+    result = ingest(project_id, [
+        APILogCreate(url="https://api.example.com/items", ip_address="10.0.0.1", response_code=200),
+        APILogCreate(url="https://api.example.com/items?page=2", ip_address="10.0.0.2",
+                     user_agent="curl/8.5.0", response_code=200),
+        # After an entry with a user agent, the row lacks none of the insert's columns
+        APILogCreate(url="https://api.example.com/items", ip_address="10.0.0.3"),
+    ])
+
+    assert result["count"] == 3
+    with db_engine.connect() as connection:
+        rows = connection.execute(text(
+            "SELECT user_agent, user_agent_id IS NULL, query_params IS NULL FROM apilog ORDER BY ip_address"
+        )).all()
+    assert [tuple(row) for row in rows] == [("", 1, 1), ("curl/8.5.0", 0, 0), ("", 1, 1)]
+
+
+def event(event_id, path="/items"):
+    return APILogCreate(url=f"https://api.example.com{path}", ip_address="10.0.0.1",
+                        user_agent="curl/8.5.0", response_code=200, event_id=event_id)
+
+
+def saved_paths(engine, project_id):
+    with engine.connect() as connection:
+        return sorted(connection.execute(
+            text("SELECT path FROM apilog WHERE user_project_id = :project_id"), {"project_id": project_id.hex}
+        ).scalars())
+
+
+def test_event_ids_are_saved_once_per_project(db_engine, project_id, ingest):
+    # Within one batch, the first entry of an event wins
+    result = ingest(project_id, [event("a", "/first"), event("a", "/retry"), event("b"), event(None), event(None)])
+    assert (result["count"], result["duplicates"]) == (4, 1)
+
+    # Across batches, from the in-memory window
+    result = ingest(project_id, [event("a", "/retry"), event("c")])
+    assert (result["count"], result["duplicates"]) == (1, 1)
+
+    # Across batches once the window is gone, from the apilogevent table
+    recent_event_ids.clear()
+    result = ingest(project_id, [event("a", "/retry"), event("b", "/retry"), event("d")])
+    assert (result["count"], result["duplicates"]) == (1, 2)
+
+    assert saved_paths(db_engine, project_id) == ["/first", "/items", "/items", "/items", "/items", "/items"]
+
+
+def test_event_ids_are_scoped_to_the_project(db_engine, project_id, ingest):
+    with Session(db_engine) as session:
+        other_project = UserProject(name="other", user_id=session.get(UserProject, project_id).user_id)
+        session.add(other_project)
+        session.commit()
+        other_project_id = other_project.id
+
+    assert ingest(project_id, [event("shared")])["count"] == 1
+    assert ingest(other_project_id, [event("shared")])["count"] == 1
+    recent_event_ids.clear()
+    assert ingest(other_project_id, [event("shared")])["duplicates"] == 1
+    assert saved_paths(db_engine, project_id) == saved_paths(db_engine, other_project_id) == ["/items"]
@@ -0,0 +1,38 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.geoip_service import (HEADER, RangeIndexGeoIP,
+                                        compile_csv_index)
+
+
+def write_csv(tmp_path):
+    csv_path = tmp_path / "ranges.csv"
+    csv_path.write_text(
+        "start_ip,end_ip,country,region,city\n"
+        "10.0.0.0,10.0.0.255,NL,North Holland,Amsterdam\n"
+        "2001:db8::,2001:db8::ffff,DE,Berlin,Berlin\n"
+    )
+    return str(csv_path)
+
+
+def test_concurrent_compiles_leave_one_complete_index(tmp_path):
+    csv_path = write_csv(tmp_path)
+    with ThreadPoolExecutor(8) as pool:
+        for future in [pool.submit(compile_csv_index, csv_path, csv_path + ".idx") for _ in range(8)]:
+            future.result()
+
+    assert sorted(os.listdir(tmp_path)) == ["ranges.csv", "ranges.csv.idx"]
+    geoip = RangeIndexGeoIP(csv_path)
+    assert geoip.lookup("10.0.0.7") == "Amsterdam, North Holland, NL"
+    assert geoip.lookup("2001:db8::1") == "Berlin, Berlin, DE"
+    assert geoip.lookup("192.168.0.1") is None
+
+
+def test_index_of_an_older_format_is_compiled_again(tmp_path):
+    csv_path = write_csv(tmp_path)
+    # Version 1 kept its labels in a separate .labels.json file
+    with open(csv_path + ".idx", "wb") as f:
+        f.write(HEADER.pack(b"WWWGEO1\0", 0))
+
+    geoip = RangeIndexGeoIP(csv_path)
+    assert geoip.lookup("10.0.0.7") == "Amsterdam, North Holland, NL"
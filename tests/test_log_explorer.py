@@ -0,0 +1,106 @@
+import base64
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlmodel import Session, select
+
+from app.crud import apilog as crud
+from app.crud.apilog import count_rows, get_apilogs
+from app.models.apilog import APILog
+
+
+def add_logs(engine, project_id, created_ats, response_codes=None):
+    with Session(engine) as session:
+        for i, created_at in enumerate(created_ats):
+            session.add(APILog(user_project_id=project_id, url=f"https://example.com/items/{i}", path=f"/items/{i}",
+                               response_code=response_codes[i] if response_codes else 200, created_at=created_at))
+        session.commit()
+
+
+def all_pages(engine, project_id, limit, **kwargs):
+    ids, cursor = [], None
+    with Session(engine) as session:
+        while True:
+            page = get_apilogs(session, None, limit=limit, project_id=project_id, cursor=cursor,
+                               include_total=False, **kwargs)
+            ids += [log["id"] for log in page["logs"]]
+            cursor = page["next_cursor"]
+            if not cursor:
+                return ids
+
+
+def test_cursor_pages_through_equal_timestamps(db_engine, project_id):
+    start = datetime(2026, 1, 1)
+    # Most rows share a created_at, so only the id tells them apart
+    created_ats = [start] * 17 + [start + timedelta(seconds=1)] * 3 + [start - timedelta(seconds=1)] * 2
+    add_logs(db_engine, project_id, created_ats)
+
+    for direction in ("desc", "asc"):
+        ids = all_pages(db_engine, project_id, 4, sort="created_at", sort_direction=direction)
+        assert len(ids) == len(created_ats)
+        assert len(set(ids)) == len(created_ats)
+    with Session(db_engine) as session:
+        first_page = get_apilogs(session, None, limit=22, project_id=project_id, include_total=False)
+    assert all_pages(db_engine, project_id, 3) == [log["id"] for log in first_page["logs"]]
+
+
+def test_cursor_pages_through_null_sort_keys(db_engine, project_id):
+    start = datetime(2026, 1, 1)
+    add_logs(db_engine, project_id, [start + timedelta(seconds=i % 3) for i in range(15)],
+             [None, 200, 500, None, 200] * 3)
+
+    ids = all_pages(db_engine, project_id, 4, sort="response_code", sort_direction="asc")
+    assert len(ids) == len(set(ids)) == 15
+
+
+def encode(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+@pytest.mark.parametrize("sort, cursor", [
+    ("created_at", "not a cursor"),
+    ("created_at", "%%%"),
+    ("created_at", base64.urlsafe_b64encode(b"\xff\xfe").decode()),
+    ("created_at", encode("created_at")),
+    ("created_at", encode({"a": 1, "b": 2, "c": 3, "d": 4})),
+    ("created_at", encode(["created_at", "desc", "2026-01-01T00:00:00"])),
+    ("created_at", encode(["created_at", "desc", None, str(uuid.uuid4())])),
+    ("created_at", encode(["created_at", "desc", "2026-01-01T00:00:00", 5])),
+    ("created_at", encode(["created_at", "asc", "2026-01-01T00:00:00", str(uuid.uuid4())])),
+    ("response_code", encode(["response_code", "desc", [200], str(uuid.uuid4())])),
+    ("path", encode(["path", "desc", {"a": 1}, str(uuid.uuid4())])),
+])
+def test_malformed_cursor_is_a_client_error(db_engine, project_id, sort, cursor):
+    add_logs(db_engine, project_id, [datetime(2026, 1, 1)])
+    with Session(db_engine) as session, pytest.raises(HTTPException) as error:
+        get_apilogs(session, None, project_id=project_id, cursor=cursor, sort=sort, sort_direction="desc")
+    assert error.value.status_code == 400
+
+
+def test_count_is_capped_past_the_cap(db_engine, project_id, monkeypatch):
+    monkeypatch.setattr(crud, "LOG_COUNT_CAP", 5)
+    add_logs(db_engine, project_id, [datetime(2026, 1, 1)] * 5)
+    query = select(APILog).where(APILog.user_project_id == project_id)
+
+    with Session(db_engine) as session:
+        # At the cap the count is still exact
+        assert count_rows(session, query, "capped") == (5, "exact")
+        add_logs(db_engine, project_id, [datetime(2026, 1, 2)])
+        assert count_rows(session, query, "capped") == (5, "capped")
+        assert count_rows(session, query, "exact") == (6, "exact")
+        # Without a planner estimate (SQLite) these count up to the cap
+        assert count_rows(session, query, "estimated") == (5, "capped")
+        assert count_rows(session, query, "auto") == (5, "capped")
+        with pytest.raises(HTTPException) as error:
+            count_rows(session, query, "approximate")
+        assert error.value.status_code == 400
+
+        page = get_apilogs(session, None, project_id=project_id, count_mode="capped")
+        assert (page["total"], page["total_kind"]) == (5, "capped")
+        page = get_apilogs(session, None, project_id=project_id, count_mode="exact")
+        assert (page["total"], page["total_kind"]) == (6, "exact")
+        page = get_apilogs(session, None, project_id=project_id, include_total=False)
+        assert (page["total"], page["total_kind"]) == (None, None)
@@ -0,0 +1,34 @@
+import json
+import uuid
+
+from app.services.log_import_service import init_worker, parse_caddy, parse_chunk
+
+
+def caddy_line(remote_addr: str) -> str:
+    return json.dumps({
+        "ts": 1700000000.0, "status": 200, "duration": 0.01,
+        "request": {"remote_addr": remote_addr, "host": "example.com", "uri": "/items",
+                    "headers": {"User-Agent": ["curl/8.5.0"]}},
+    })
+
+
+def test_caddy_remote_addr_loses_its_port_and_ipv6_brackets():
+    assert parse_caddy(caddy_line("10.0.0.1:443"), "example.com").ip_address == "10.0.0.1"
+    assert parse_caddy(caddy_line("[::1]:443"), "example.com").ip_address == "::1"
+    assert parse_caddy(caddy_line("[2001:db8::1]:8080"), "example.com").ip_address == "2001:db8::1"
+
+
+def test_lines_of_the_wrong_shape_are_counted_as_bad():
+    init_worker([])
+    lines = [
+        caddy_line("10.0.0.1:443"),
+        "[1, 2, 3]",                                  # JSON, but not an object
+        '"a string"',
+        '{"request": "not an object", "ts": 1}',
+        '{"request": {"headers": 5}, "ts": 1}',
+        "not json at all",
+        "",
+    ]
+    rows, _, errors, _ = parse_chunk("caddy", lines, uuid.uuid4(), "example.com", update_location=False)
+    assert len(rows) == 1
+    assert errors == 5
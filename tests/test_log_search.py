@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text
+from sqlmodel import Session
+
+from app.crud.apilog import get_apilogs, search_conditions
+from app.models.apilog import APILog, ensure_sqlite_search
+from app.schemas.apilog import APILogCreate, APILogSearch
+
+
+def add_logs(engine, project_id, paths):
+    with Session(engine) as session:
+        for i, path in enumerate(paths):
+            session.add(APILog(user_project_id=project_id, url=f"https://example.com{path}", path=path,
+                               user_agent="curl/8.5.0", ip_address=f"10.0.0.{i}",
+                               created_at=datetime(2026, 1, 1) + timedelta(minutes=i)))
+        session.commit()
+
+
+def search(engine, q: str) -> int:
+    with Session(engine) as session:
+        return session.execute(select(func.count()).select_from(APILog).where(*search_conditions(session, None, q))).scalar()
+
+
+def test_search_survives_deletes_and_vacuum(db_engine, project_id):
+    add_logs(db_engine, project_id, [f"/api/items/{i}" for i in range(5)] + ["/api/orders/1"])
+    with db_engine.begin() as connection:
+        connection.execute(text("DELETE FROM apilog WHERE path IN ('/api/items/0', '/api/items/1')"))
+    with db_engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+    add_logs(db_engine, project_id, ["/api/items/7"])
+
+    assert search(db_engine, "items") == 4
+    assert search(db_engine, "orders") == 1
+
+
+def test_search_table_is_created_and_filled_when_missing(db_engine, project_id):
+    add_logs(db_engine, project_id, ["/api/items/1", "/api/orders/1"])
+    with db_engine.begin() as connection:
+        # A database from before the search table existed
+        for trigger in ("apilog_search_insert", "apilog_search_delete", "apilog_search_update"):
+            connection.execute(text(f"DROP TRIGGER {trigger}"))
+        connection.execute(text("DROP TABLE apilog_search"))
+        connection.execute(text("DROP TABLE apilog_search_key"))
+    with db_engine.begin() as connection:
+        ensure_sqlite_search(connection)
+
+    assert search(db_engine, "items") == 1
+    add_logs(db_engine, project_id, ["/api/items/2"])
+    assert search(db_engine, "items") == 2
+
+
+def test_query_param_filters(db_engine, project_id, ingest):
+    queries = ["page=2&sort=name", "page=2", "page=3&sort=name", "filter.name=a%20b&q=%22x%22", ""]
+    ingest(project_id, [
+        APILogCreate(url=f"https://api.example.com/items?{query}", ip_address="10.0.0.1") for query in queries
+    ])
+
+    def paths(query_params):
+        with Session(db_engine) as session:
+            logs = get_apilogs(session, None, limit=10, project_id=project_id,
+                               search_params=APILogSearch(query_params=query_params))["logs"]
+        return sorted("&".join(f"{param['key']}={param['value']}" for param in log["query_params"]) for log in logs)
+
+    assert paths({"page": "2"}) == ["page=2", "page=2&sort=name"]
+    # Every pair must match
+    assert paths({"page": "2", "sort": "name"}) == ["page=2&sort=name"]
+    assert paths({"sort": "name"}) == ["page=2&sort=name", "page=3&sort=name"]
+    # Keys holding path characters and values holding quotes are matched literally
+    assert paths({"filter.name": "a b"}) == ['filter.name=a b&q="x"']
+    assert paths({"q": '"x"'}) == ['filter.name=a b&q="x"']
+    assert paths({"page": "4"}) == []
+    assert paths({"missing": "2"}) == []
@@ -0,0 +1,63 @@
+import uuid
+
+import pytest
+from sqlmodel import Session
+
+from app.crud.user import update_project_path_rules
+from app.models.user import UserProject
+from app.schemas.user import UserProjectPathRulesUpdate
+from app.services.cache_service import MISSING
+from app.services.invalidation_service import poll_invalidations
+from app.services.path_template_service import (DEFAULT_TEMPLATER,
+                                                PathTemplater,
+                                                path_templaters)
+
+
+def test_rules_are_tried_in_order_before_the_fallbacks():
+    templater = PathTemplater(["/repos/{owner}/{repo}", "/repos/{owner}/settings", "/users/{name}"])
+
+    assert templater.template("/repos/navig/settings") == "/repos/{owner}/{repo}"
+    assert templater.template("/repos/navig/whowhywhen/") == "/repos/{owner}/{repo}"
+    assert templater.template("/users/42") == "/users/{name}"
+    # A placeholder matches one segment only
+    assert templater.template("/repos/navig/whowhywhen/issues/7") == "/repos/navig/whowhywhen/issues/{id}"
+
+
+def test_placeholder_must_be_a_whole_segment():
+    with pytest.raises(ValueError):
+        PathTemplater(["/files/{name}.json"])
+    with pytest.raises(ValueError):
+        PathTemplater(["repos/{owner}"])
+
+
+def test_fallback_placeholders():
+    cases = {
+        "/users/123/orders": "/users/{id}/orders",
+        f"/items/{uuid.uuid4()}": "/items/{uuid}",
+        "/blobs/9f86d081884c7d65": "/blobs/{hash}",
+        "/tokens/aB3dEf9hIjK1mN0pQrStUv": "/tokens/{hash}",
+        "/orders/order-1234": "/orders/{slug}",
+        "/help/how-to-reset-a-password": "/help/{slug}",
+        "/help/getting-started": "/help/getting-started",
+        "/v1/users": "/v1/users",
+        "/": "/",
+    }
+    for path, template in cases.items():
+        assert DEFAULT_TEMPLATER.template(path) == template
+    assert DEFAULT_TEMPLATER.template("/blobs/" + "a" * 201) == "/blobs/" + "a" * 201
+
+
+def test_changed_rules_are_dropped_from_every_worker_cache(db_engine, project_id):
+    position, handled = poll_invalidations(db_engine, None, set())
+    path_templaters.set(project_id, PathTemplater())
+
+    with Session(db_engine) as session:
+        user_id = session.get(UserProject, project_id).user_id
+        update_project_path_rules(
+            session, user_id, project_id, UserProjectPathRulesUpdate(path_template_rules=["/repos/{owner}"])
+        )
+    # As seen from another worker, which only learns of the change through the table
+    path_templaters.set(project_id, PathTemplater())
+    poll_invalidations(db_engine, position, handled)
+
+    assert path_templaters.get(project_id) is MISSING
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import select
+from sqlmodel import Session
+
+import process_botinfo
+from app.models.apilog import APILog
+from app.models.botinfo import BotInfo
+from app.models.useragent import UserAgent, user_agent_id
+from app.services.bot_match_service import BotMatcher
+
+CRAWLER = "ExampleBot/1.0 (+https://example.com/bot)"
+BROWSER = "Mozilla/5.0 (X11; Linux x86_64) Firefox/120.0"
+
+
+def add_logs(engine, project_id, bot_logs: int):
+    start = datetime(2026, 1, 1)
+    with Session(engine) as session:
+        bot = BotInfo(bot_name="ExampleBot", pattern="ExampleBot")
+        session.add(bot)
+        for user_agent in (CRAWLER, BROWSER):
+            session.add(UserAgent(id=user_agent_id(user_agent), user_agent=user_agent))
+        for i in range(bot_logs):
+            session.add(APILog(user_project_id=project_id, url="https://example.com/", user_agent=CRAWLER,
+                               user_agent_id=user_agent_id(CRAWLER), created_at=start + timedelta(minutes=i)))
+        session.add(APILog(user_project_id=project_id, url="https://example.com/", user_agent=BROWSER,
+                           user_agent_id=user_agent_id(BROWSER), created_at=start))
+        session.commit()
+        return bot.id
+
+
+def bot_ids(engine, user_agent: str):
+    with Session(engine) as session:
+        return session.execute(
+            select(APILog.bot_id).where(APILog.user_agent_id == user_agent_id(user_agent))
+        ).scalars().all()
+
+
+def test_backfill_walks_each_user_agent_window_by_window(db_engine, project_id):
+    bot_id = add_logs(db_engine, project_id, bot_logs=7)
+    checkpoint = process_botinfo.ImportCheckpoint(source="test")
+    args = SimpleNamespace(user_agent_batch_size=10, batch_size=3, pause=0)
+    process_botinfo.backfill(checkpoint, BotMatcher([{"id": bot_id, "pattern": "ExampleBot"}]), args)
+
+    assert bot_ids(db_engine, CRAWLER) == [bot_id] * 7
+    assert bot_ids(db_engine, BROWSER) == [None]
+    assert checkpoint.rows_imported == 7
+    assert checkpoint.lines_done == 2
+
+
+def test_backfill_resumes_inside_a_user_agent(db_engine, project_id):
+    bot_id = add_logs(db_engine, project_id, bot_logs=6)
+    with Session(db_engine) as session:
+        keys = session.execute(
+            select(APILog.created_at, APILog.id).where(APILog.user_agent_id == user_agent_id(CRAWLER))
+            .order_by(APILog.created_at, APILog.id)
+        ).all()
+    # As if an earlier run stopped after the first four logs of the crawler
+    checkpoint = process_botinfo.ImportCheckpoint(
+        source="test", last_key=process_botinfo.encode_position(user_agent_id(CRAWLER), tuple(keys[3])),
+    )
+    args = SimpleNamespace(user_agent_batch_size=10, batch_size=4, pause=0)
+    process_botinfo.backfill(checkpoint, BotMatcher([{"id": bot_id, "pattern": "ExampleBot"}]), args)
+
+    assert sorted(bot_ids(db_engine, CRAWLER), key=str) == sorted([None] * 4 + [bot_id] * 2, key=str)
+    assert checkpoint.rows_imported == 2
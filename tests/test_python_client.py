@@ -0,0 +1,15 @@
+import httpx
+import pytest
+
+from whowhywhen.client import WhoWhyWhenClient
+
+
+def test_start_in_thread_raises_when_the_flusher_cannot_start(monkeypatch):
+    def broken_client(*args, **kwargs):
+        raise RuntimeError("no HTTP client")
+
+    monkeypatch.setattr(httpx, "AsyncClient", broken_client)
+    client = WhoWhyWhenClient("test-key", api_url="http://testserver")
+    with pytest.raises(RuntimeError, match="no HTTP client"):
+        client.start_in_thread()
+    assert not client.started
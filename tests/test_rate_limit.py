@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.dependencies.apikey import API_KEY_NAME
+from app.services.rate_limit_service import (LocalRateLimitBackend, RateLimiter,
+                                             wait_for_rate_limit)
+
+
+class RefusingBackend:
+    """Refuses the first `refusals` charges, then accepts."""
+
+    def __init__(self, refusals: int):
+        self.refusals = refusals
+        self.buckets = []
+
+    async def take(self, buckets, cost):
+        self.buckets.append([key for key, _, _ in buckets])
+        if self.refusals:
+            self.refusals -= 1
+            return False, 0.001
+        return True, 0.0
+
+    def stats(self):
+        return {}
+
+
+def make_limiter(backend) -> RateLimiter:
+    return RateLimiter(backend, key_rate=1, key_burst=1, project_rate=1, project_burst=1)
+
+
+def test_buckets_do_not_hold_the_api_key():
+    backend = LocalRateLimitBackend()
+    limiter = make_limiter(backend)
+    asyncio.run(limiter.take("secret-api-key", "project", 1))
+    assert len(backend._buckets) == 2
+    assert not any("secret-api-key" in key for key in backend._buckets)
+
+
+def test_streamed_upload_is_counted_once_however_often_it_waits():
+    backend = RefusingBackend(refusals=5)
+    limiter = make_limiter(backend)
+    request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(rate_limiter=limiter)),
+                              headers={API_KEY_NAME: "secret-api-key"})
+    asyncio.run(wait_for_rate_limit(request, SimpleNamespace(id="project"), 10))
+    assert len(backend.buckets) == 6
+    assert limiter.throttled_requests == {"project": 1}
+    assert limiter.throttled_rows == {"project": 10}
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+from sqlmodel import Session
+
+from app.crud import apilog as crud
+from app.crud.apilog import get_apilogs_stats, get_counts_data
+from app.database import async_session_maker, get_async_engine
+from app.models.apilogrollup import APILogHourly
+from app.schemas.apilog import APILogCreate
+from app.services.rollup_service import compact_rollups, current_watermark
+
+
+def rolled_up_requests(engine, project_id) -> int:
+    with Session(engine) as session:
+        return session.execute(
+            select(func.coalesce(func.sum(APILogHourly.requests), 0)).where(APILogHourly.user_project_id == project_id)
+        ).scalar()
+
+
+def test_log_committed_after_a_compaction_is_rolled_up(db_engine, project_id, monkeypatch):
+    compact_rollups(db_engine, lag=0)
+    ensure_user_agents = crud.ensure_user_agents
+
+    async def slow_ensure_user_agents(db, user_agents):
+        # The batch is built, then a compaction passes before it is written, as behind a slow flush
+        await asyncio.sleep(0.01)
+        compact_rollups(db_engine, lag=0)
+        await asyncio.sleep(0.01)
+        await ensure_user_agents(db, user_agents)
+
+    monkeypatch.setattr(crud, "ensure_user_agents", slow_ensure_user_agents)
+
+    async def ingest():
+        async with async_session_maker() as session:
+            result = await crud.create_apilog_bulk(session, project_id, [
+                APILogCreate(url="https://api.example.com/items", ip_address="10.0.0.1",
+                             user_agent=f"rollup-test/{time.time_ns()}", response_code=200),
+            ], update_location=False)
+        # Pooled connections belong to this event loop
+        await get_async_engine().dispose()
+        return result
+
+    assert asyncio.run(ingest())["count"] == 1
+    with Session(db_engine) as session:
+        watermark_before = current_watermark(session)
+    compact_rollups(db_engine, lag=0)
+
+    with Session(db_engine) as session:
+        assert current_watermark(session) > watermark_before
+    assert rolled_up_requests(db_engine, project_id) == 1
+
+
+def test_compaction_counts_each_log_once(db_engine, project_id, ingest):
+    # Entries with and without a user agent, as clients send them
+    ingest(project_id, [
+        APILogCreate(url="https://api.example.com/items", ip_address="10.0.0.1", response_code=200),
+        APILogCreate(url="https://api.example.com/items?page=2", ip_address="10.0.0.1", response_code=404),
+        APILogCreate(url="https://api.example.com/items", ip_address="10.0.0.2",
+                     user_agent="Mozilla/5.0 (X11; Linux x86_64) Firefox/120.0", response_code=200),
+    ])
+    compact_rollups(db_engine, lag=0)
+    compact_rollups(db_engine, lag=0)
+    assert rolled_up_requests(db_engine, project_id) == 3
+
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    None,
+]
+
+
+def seeded_logs(start: datetime, count: int, step: timedelta):
+    return [
+        APILogCreate(url=f"https://api.example.com/items/{i}", ip_address="10.0.0.1", user_agent=USER_AGENTS[i % 4],
+                     response_code=(200, 201, 304, 404, 500, None)[i % 6], response_time=(i % 5) / 10 or None,
+                     created_at=start + step * i)
+        for i in range(count)
+    ]
+
+
+def seed_rollups(db_engine, project_id, ingest, start: datetime):
+    ingest(project_id, seeded_logs(start, 300, timedelta(minutes=13)))
+    compact_rollups(db_engine, lag=0)
+    # Ingested after the compaction, so only in the raw rows
+    ingest(project_id, seeded_logs(start + timedelta(minutes=5), 40, timedelta(minutes=47)))
+
+
+def test_stats_from_rollups_match_the_raw_rows(db_engine, project_id, ingest):
+    start = datetime(2026, 3, 1, 22, 17, 30)
+    seed_rollups(db_engine, project_id, ingest, start)
+    windows = {
+        # Unaligned ends leave partial buckets on both sides
+        "minute": (start + timedelta(hours=2, seconds=20), start + timedelta(hours=4, minutes=3, seconds=10)),
+        "hour": (start + timedelta(minutes=21), start + timedelta(days=1, hours=5, minutes=2)),
+        "day": (start, start + timedelta(days=2, hours=3)),
+    }
+
+    with Session(db_engine) as session:
+        for frequency, (start_datetime, end_datetime) in windows.items():
+            for bots_only in (False, True):
+                stats = [
+                    get_apilogs_stats(session, None, project_id, frequency=frequency, start_datetime=start_datetime,
+                                      end_datetime=end_datetime, bots_only=bots_only, use_rollups=use_rollups)
+                    for use_rollups in (True, False)
+                ]
+                # Response times are summed in another order
+                for period in stats[0]:
+                    period["avg_response_time"] = pytest.approx(period["avg_response_time"])
+                assert stats[0] == stats[1]
+                assert sum(period["2xx_count"] for period in stats[1]) > 0
+
+
+def test_device_stats_from_the_dimension_rollup_match_the_raw_rows(db_engine, project_id, ingest):
+    start = datetime(2026, 3, 1, 22, 17, 30)
+    seed_rollups(db_engine, project_id, ingest, start)
+    windows = [
+        # Partial days on both sides
+        (start, start + timedelta(days=2, hours=3)),
+        (start + timedelta(minutes=21), start + timedelta(days=1, hours=5, minutes=2)),
+        (None, None),
+    ]
+
+    with Session(db_engine) as session:
+        for start_datetime, end_datetime in windows:
+            for bots_only in (False, True):
+                counts = [
+                    get_counts_data(session, None, project_id, start_datetime=start_datetime,
+                                    end_datetime=end_datetime, bots_only=bots_only, use_rollups=use_rollups)
+                    for use_rollups in (True, False)
+                ]
+                assert counts[0] == counts[1]
+                assert sum(counts[1]["device_type_counts"].values()) > 0
@@ -0,0 +1,69 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import event
+from sqlmodel import func, select
+
+from app.database import async_session_maker, get_async_engine
+from app.models.apilog import APILog
+from app.services.telemetry_service import (SelfTelemetryMiddleware,
+                                            start_self_telemetry,
+                                            stop_self_telemetry)
+
+REQUESTS = 500
+
+
+async def serve_and_count(project_id):
+    app = FastAPI()
+    app.add_middleware(SelfTelemetryMiddleware)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    # Counted from pool events, which every pool class emits
+    checked_out = max_checked_out = 0
+
+    def on_checkout(*args):
+        nonlocal checked_out, max_checked_out
+        checked_out += 1
+        max_checked_out = max(max_checked_out, checked_out)
+
+    def on_checkin(*args):
+        nonlocal checked_out
+        checked_out -= 1
+
+    sync_engine = get_async_engine().sync_engine
+    event.listen(sync_engine, "checkout", on_checkout)
+    event.listen(sync_engine, "checkin", on_checkin)
+    try:
+        start_self_telemetry(app, str(project_id))
+        transport = httpx.ASGITransport(app=app, client=("10.0.0.1", 12345))
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as http:
+            remaining = iter(range(REQUESTS))
+
+            async def worker():
+                for i in remaining:
+                    await http.get(f"/ping?i={i}")
+
+            await asyncio.gather(*(worker() for _ in range(16)))
+        await stop_self_telemetry(app)
+        leftover = checked_out
+    finally:
+        event.remove(sync_engine, "checkout", on_checkout)
+        event.remove(sync_engine, "checkin", on_checkin)
+
+    async with async_session_maker() as session:
+        saved = (await session.exec(
+            select(func.count()).select_from(APILog).where(APILog.user_project_id == project_id)
+        )).one()
+    await get_async_engine().dispose()
+    return max_checked_out, leftover, saved, app.state.telemetry_sink.stats()
+
+
+def test_sink_uses_one_connection_at_a_time_and_returns_it(project_id):
+    max_checked_out, leftover, saved, stats = asyncio.run(serve_and_count(project_id))
+    assert max_checked_out == 1
+    assert leftover == 0
+    assert saved == REQUESTS - stats["dropped"]
@@ -0,0 +1,32 @@
+import asyncio
+import gzip
+
+import pytest
+
+from app.services.stream_ingest_service import LineTooLong, iter_lines
+
+
+async def read_lines(data: bytes, chunk_size: int, gzipped: bool = True, max_line_bytes: int = 1000):
+    async def chunks():
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+
+    return [(n, "too long" if isinstance(line, LineTooLong) else line)
+            async for n, line in iter_lines(chunks(), gzipped, max_line_bytes)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100, 1 << 20])
+def test_every_member_of_a_concatenated_gzip_stream_is_read(chunk_size):
+    first = b"".join(b'{"n": %d}\n' % i for i in range(300))
+    # Members padded with zeros in between, and a line split across two members
+    data = gzip.compress(first) + b"\0\0\0" + gzip.compress(b'{"n": "a"}\n{"n": "b') + gzip.compress(b'"}\n')
+    lines = asyncio.run(read_lines(data, chunk_size))
+
+    assert len(lines) == 302
+    assert lines[299] == (300, b'{"n": 299}')
+    assert lines[300:] == [(301, b'{"n": "a"}'), (302, b'{"n": "b"}')]
+
+
+def test_long_lines_are_skipped_in_later_members():
+    data = gzip.compress(b"first\n") + gzip.compress(b"x" * 5000 + b"\nlast\n")
+    assert asyncio.run(read_lines(data, 64)) == [(1, b"first"), (2, "too long"), (3, b"last")]